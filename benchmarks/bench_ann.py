@@ -0,0 +1,83 @@
+# benchmarks/bench_ann.py
+# Two-stage retrieval (IVF candidates + exact MLP re-rank) vs. exact scoring of every item:
+# recall@20 against the exact top 20, and median per-request latency, for a range of
+# RECOMMENDER_ANN_CANDIDATES values.
+# Run from the project root:  python benchmarks/bench_ann.py
+# Uses a randomly initialised MLP. With plain Gaussian item embeddings there is no cluster
+# structure at all, a pessimistic floor; the "grouped" runs draw items around 100 random
+# centres (noise at half the spread), closer to the genre/era groups of a trained model.
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from movie_webapp.config import Config
+from movie_webapp.recommender import MLP, ItemTowerScorer, build_ann_index, select_top_k
+
+K = 20
+NUM_QUERIES = 100
+
+
+def _median_ms(fn, repeat=50):
+    fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2] * 1000
+
+
+def _build_scorer(num_items, grouped):
+    torch.manual_seed(0)
+    model = MLP(Config.RECOMMENDER_NUM_USERS, num_items, Config.RECOMMENDER_EMBEDDING_SIZE, Config.RECOMMENDER_LAYER_DIMS)
+    with torch.no_grad():
+        model.user_embedding.weight.normal_()
+        model.item_embedding.weight.normal_()
+        if grouped:
+            centres = torch.randn(100, Config.RECOMMENDER_EMBEDDING_SIZE)
+            model.item_embedding.weight.mul_(0.5).add_(centres[torch.randint(0, 100, (num_items,))])
+    model.eval()
+    return ItemTowerScorer(model, torch.arange(num_items))
+
+
+def bench_recall_latency(num_items, grouped=False, candidate_counts=(100, 300, 1000, 3000, 10000)):
+    scorer = _build_scorer(num_items, grouped)
+    start = time.perf_counter()
+    index = build_ann_index(scorer)
+    build_s = time.perf_counter() - start
+    servable_mask = torch.ones(num_items, dtype=torch.bool)
+    user_embs = scorer.user_embedding.weight[:NUM_QUERIES].detach()
+
+    def exact(user_emb):
+        return select_top_k(scorer.score_embeddings(user_emb.unsqueeze(0))[0], servable_mask, (), K)[0]
+
+    def two_stage(user_emb, min_candidates):
+        positions = index.candidates(scorer, user_emb, min_candidates)
+        scores = scorer.score_embeddings(user_emb.unsqueeze(0), positions)[0]
+        return positions[select_top_k(scores, servable_mask[positions], (), K)[0]]
+
+    exact_ms = _median_ms(lambda: exact(user_embs[0]))
+    truth = [set(exact(user_emb).tolist()) for user_emb in user_embs]
+    print(f"items={num_items}{' grouped' if grouped else ''}  {index.num_clusters} clusters (built in {build_s:.1f} s)  "
+          f"exact scoring {exact_ms:.2f} ms")
+
+    for count in candidate_counts:
+        if count >= num_items:
+            break
+        recall = np.mean([len(truth[i] & set(two_stage(user_emb, count).tolist())) / K
+                          for i, user_emb in enumerate(user_embs)])
+        ms = _median_ms(lambda: two_stage(user_embs[0], count))
+        print(f"  >= {count:>5} candidates:  recall@{K} {recall:.3f}   {ms:6.2f} ms   x{exact_ms / ms:.1f}")
+
+
+if __name__ == '__main__':
+    print(f"torch {torch.__version__}, {torch.get_num_threads()} intra-op threads")
+    for n in (2933, 50000, Config.RECOMMENDER_NUM_ITEMS):
+        bench_recall_latency(n)
+    for n in (50000, Config.RECOMMENDER_NUM_ITEMS):
+        bench_recall_latency(n, grouped=True)
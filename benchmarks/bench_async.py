@@ -0,0 +1,147 @@
+# benchmarks/bench_async.py
+# Sync (thread pool) vs. async (shared httpx.AsyncClient) TMDB fan-out, and a load test of the
+# async rated_movies view in one threaded worker, against the local stub server (run in its own
+# process so its CPU time is not charged to the client).
+# Run from the project root:  python benchmarks/bench_async.py
+import asyncio
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from werkzeug.serving import make_server
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from movie_webapp import api, async_api, catalog, create_app, db
+from movie_webapp.config import Config
+from movie_webapp.models import Rating, User
+
+LATENCY = 0.2 # Simulated upstream latency in seconds (TMDB from a typical host: 100-300 ms)
+RATINGS = 40 # Movies on the load-test user's rated_movies page
+
+
+def make_app(base_url, db_path, **overrides):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{db_path}'
+        TMDB_API_BASE_URL = base_url
+        TMDB_API_KEY = 'bench'
+        TMDB_CACHE_BACKEND = 'none'
+        FRAGMENT_CACHE_BACKEND = 'none'
+        PREFETCH_ENABLED = False
+        CATALOG_MAX_AGE = -1 # Every catalog row is stale, so each page view goes upstream
+        WTF_CSRF_ENABLED = False
+    for name, value in overrides.items():
+        setattr(BenchConfig, name, value)
+    return create_app(BenchConfig)
+
+
+def bench_fan_out(app, sizes=(8, 32, 128)):
+    """One batch of N detail fetches: sync get_movies_details (TMDB_FETCH_WORKERS threads) vs. async."""
+    with app.app_context():
+        async_api.run(async_api.get_movie_details, 0) # Start the loop and open the client outside the timings
+        for size in sizes:
+            ids = list(range(1, size + 1))
+            start = time.perf_counter()
+            api.get_movies_details(ids)
+            sync_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            results = async_api.run(async_api.get_movies_details, ids)
+            async_ms = (time.perf_counter() - start) * 1000
+            assert all(results[movie_id] for movie_id in ids)
+            print(f"fan-out of {size:>3} detail calls ({LATENCY * 1000:.0f} ms upstream):  "
+                  f"sync pool {sync_ms:7.1f} ms   async client {async_ms:7.1f} ms   x{sync_ms / async_ms:.1f}")
+
+
+def bench_concurrent_pages(app, clients=(1, 4, 8), duration=3.0):
+    """K concurrent rated_movies-sized metadata lookups: sync catalog path vs. async catalog path."""
+    ids = list(range(1, RATINGS + 1))
+
+    def sync_page():
+        with app.app_context():
+            catalog.get_movies_metadata(ids)
+
+    def async_page():
+        with app.app_context():
+            asyncio.run(catalog.get_movies_metadata_async(ids))
+
+    for num_clients in clients:
+        rates = {}
+        for name, page in (('sync', sync_page), ('async', async_page)):
+            rates[name] = _pages_per_second(page, num_clients, duration)
+        print(f"{num_clients:>2} concurrent page views ({RATINGS} stale movies each):  "
+              f"sync {rates['sync']:6.1f} pages/s   async {rates['async']:6.1f} pages/s")
+
+
+def bench_view_load(app, clients=(1, 4, 8), duration=3.0):
+    """Load test of the async /rated_movies view in one threaded worker: sync pool vs. async client."""
+    with app.app_context():
+        user = User(username='bench')
+        user.set_password('bench')
+        db.session.add(user)
+        db.session.commit()
+        catalog.bulk_insert_catalog_ids(range(1, RATINGS + 1))
+        db.session.add_all(Rating(user_id=user.id, movie_id=movie_id, rating=4.0, timestamp=datetime.utcnow())
+                           for movie_id in range(1, RATINGS + 1))
+        db.session.commit()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR) # No access log lines
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    local = threading.local()
+
+    def page():
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+            session.post(f'{base_url}/login', data={'username': 'bench', 'password': 'bench'})
+        response = session.get(f'{base_url}/rated_movies')
+        assert response.status_code == 200 and 'Movie 1' in response.text
+
+    for num_clients in clients:
+        rates = {}
+        for name, use_async in (('sync', False), ('async', True)):
+            app.config['TMDB_ASYNC_CLIENT'] = use_async
+            rates[name] = _pages_per_second(page, num_clients, duration)
+        print(f"/rated_movies, {num_clients:>2} concurrent clients, one worker:  "
+              f"sync {rates['sync']:6.1f} pages/s   async {rates['async']:6.1f} pages/s")
+    server.shutdown()
+
+
+def _pages_per_second(page, num_clients, duration):
+    deadline = time.perf_counter() + duration
+    counts = [0] * num_clients
+
+    def client(index):
+        while time.perf_counter() < deadline:
+            page()
+            counts[index] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=num_clients) as pool:
+        list(pool.map(client, range(num_clients)))
+    return sum(counts) / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    stub_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stub_tmdb.py')
+    upstream = subprocess.Popen([sys.executable, stub_path, str(LATENCY)], stdout=subprocess.PIPE, text=True)
+    try:
+        base_url = upstream.stdout.readline().strip()
+        with tempfile.TemporaryDirectory() as tmp:
+            app = make_app(base_url, os.path.join(tmp, 'bench.db'))
+            bench_fan_out(app)
+            bench_concurrent_pages(app)
+            bench_view_load(app)
+    finally:
+        upstream.kill()
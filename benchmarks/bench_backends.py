@@ -0,0 +1,84 @@
+# benchmarks/bench_backends.py
+# RECOMMENDER_BACKEND on the full catalog: eager torch vs. the exported TorchScript and
+# ONNX (onnxruntime) scorer heads, scoring 1 and 8 users against every model item, plus
+# what importing each runtime costs a fresh worker process.
+# Run from the project root:  python benchmarks/bench_backends.py
+# Uses a randomly initialised MLP of the configured size; onnxruntime is optional.
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from movie_webapp.config import Config
+from movie_webapp.recommender import MLP, ItemTowerScorer, OnnxBackend, TorchScriptBackend, export_scorer
+
+# Imports a runtime in a fresh interpreter and reports the time taken and the RSS in kB
+IMPORT_PROBE = r'''
+import time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+with open('/proc/self/status') as f:
+    rss = next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+print(elapsed, rss)
+'''
+
+
+def _median_ms(fn, repeat=20):
+    fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2] * 1000
+
+
+def bench_scoring(scorer, backends):
+    item_hidden = scorer.item_hidden
+    for batch_size in (1, 8):
+        user_emb = scorer.user_embedding(torch.arange(batch_size))
+        with torch.no_grad():
+            expected = scorer.score_hidden(user_emb, item_hidden)
+        print(f"{batch_size} user(s) x {scorer.num_items} items:")
+        for name, backend in backends.items():
+            scorer.backend = backend
+            ms = _median_ms(lambda: scorer.score_hidden(user_emb, item_hidden))
+            error = (scorer.score_hidden(user_emb, item_hidden) - expected).abs().max().item()
+            print(f"  {name:<12} {ms:8.2f} ms   max |diff| vs torch {error:.1e}")
+        scorer.backend = None
+
+
+def bench_imports(modules=('torch', 'numpy, onnxruntime')):
+    for module in modules:
+        result = subprocess.run([sys.executable, '-c', IMPORT_PROBE.format(module=module)], capture_output=True, text=True)
+        if result.returncode:
+            print(f"import {module}: not installed")
+            continue
+        elapsed, rss = result.stdout.split()
+        print(f"import {module:<18} {float(elapsed) * 1000:7.0f} ms   RSS {int(rss) / 1024:6.1f} MB")
+
+
+if __name__ == '__main__':
+    torch.manual_seed(0)
+    print(f"torch {torch.__version__}, {torch.get_num_threads()} intra-op threads")
+    model = MLP(Config.RECOMMENDER_NUM_USERS, Config.RECOMMENDER_NUM_ITEMS,
+                Config.RECOMMENDER_EMBEDDING_SIZE, Config.RECOMMENDER_LAYER_DIMS)
+    model.eval()
+    scorer = ItemTowerScorer(model, torch.arange(Config.RECOMMENDER_NUM_ITEMS))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        torchscript_path, onnx_path = os.path.join(tmp, 'scorer.pt'), os.path.join(tmp, 'scorer.onnx')
+        export_scorer(scorer, torchscript_path=torchscript_path, onnx_path=onnx_path)
+        backends = {'torch': None, 'torchscript': TorchScriptBackend(torchscript_path)}
+        try:
+            backends['onnxruntime'] = OnnxBackend(onnx_path)
+        except ImportError:
+            print("onnxruntime is not installed; skipping it")
+        bench_scoring(scorer, backends)
+    bench_imports()
@@ -0,0 +1,77 @@
+# benchmarks/bench_batching.py
+# Throughput vs. latency of full-candidate scoring with N concurrent clients (threads in a
+# closed loop, each asking for one user's top 20 again as soon as it has the last one):
+# every request scoring on its own vs. RECOMMENDER_BATCHING's ScoringBatcher.
+# Run from the project root:  python benchmarks/bench_batching.py
+# Uses a randomly initialised MLP of the configured size.
+import os
+import random
+import sys
+import threading
+import time
+
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from movie_webapp.config import Config
+from movie_webapp.recommender import MLP, ItemTowerScorer, ScoringBatcher, select_top_k
+
+K = 20
+DURATION = 3.0 # Seconds per run
+
+
+def run_clients(top_k, num_clients, user_embs):
+    """Runs num_clients closed-loop clients for DURATION seconds. Returns (requests/s, p50, p95, p99 ms)."""
+    latencies = [[] for _ in range(num_clients)]
+    stop_at = time.perf_counter() + DURATION
+
+    def client(timings, seed):
+        rng = random.Random(seed)
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            top_k(user_embs[rng.randrange(len(user_embs))])
+            timings.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(latencies[i], i)) for i in range(num_clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    timings = sorted(t for client_timings in latencies for t in client_timings)
+    return (len(timings) / elapsed, timings[len(timings) // 2] * 1000, timings[int(len(timings) * 0.95)] * 1000,
+            timings[int(len(timings) * 0.99)] * 1000)
+
+
+def bench(num_items, client_counts=(1, 4, 16, 64)):
+    torch.manual_seed(0)
+    model = MLP(Config.RECOMMENDER_NUM_USERS, Config.RECOMMENDER_NUM_ITEMS,
+                Config.RECOMMENDER_EMBEDDING_SIZE, Config.RECOMMENDER_LAYER_DIMS)
+    model.eval()
+    scorer = ItemTowerScorer(model, torch.arange(num_items))
+    servable_mask = torch.ones(num_items, dtype=torch.bool)
+    with torch.no_grad():
+        user_embs = scorer.user_embedding(torch.arange(1000))
+
+    def unbatched(user_emb):
+        return select_top_k(scorer.score_embeddings(user_emb.unsqueeze(0))[0], servable_mask, (), K)
+
+    modes = {'unbatched': unbatched}
+    for window_ms, max_batch in ((2, 8), (2, 32), (5, 32)):
+        batcher = ScoringBatcher(scorer, servable_mask, window_ms=window_ms, max_batch=max_batch)
+        modes[f'batched {window_ms} ms / {max_batch}'] = lambda user_emb, batcher=batcher: batcher.top_k(user_emb, (), K)
+
+    print(f"{num_items} candidates:")
+    for num_clients in client_counts:
+        for label, top_k in modes.items():
+            throughput, p50, p95, p99 = run_clients(top_k, num_clients, user_embs)
+            print(f"  {num_clients:>3} clients  {label:<20} {throughput:8.1f} req/s   "
+                  f"p50 {p50:7.2f} ms   p95 {p95:7.2f} ms   p99 {p99:7.2f} ms")
+
+
+if __name__ == '__main__':
+    print(f"torch {torch.__version__}, {torch.get_num_threads()} intra-op threads, {os.cpu_count()} CPUs")
+    bench(10000)
+    bench(Config.RECOMMENDER_NUM_ITEMS, client_counts=(1, 16))
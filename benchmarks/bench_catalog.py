@@ -0,0 +1,75 @@
+# benchmarks/bench_catalog.py
+# Local catalog (movies table) benchmarks on a temporary SQLite file.
+# Run from the project root:  python benchmarks/bench_catalog.py
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from movie_webapp import create_app, db
+from movie_webapp.catalog import bulk_insert_catalog_ids, get_catalog_writer, read_links_tmdb_ids, upsert_movies
+from movie_webapp.config import Config
+from movie_webapp.models import Movie
+from stub_tmdb import _listing
+
+
+def make_app(db_path, **overrides):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{db_path}'
+        TMDB_CACHE_BACKEND = 'none'
+        PREFETCH_ENABLED = False
+    for name, value in overrides.items():
+        setattr(BenchConfig, name, value)
+    return create_app(BenchConfig)
+
+
+def _median_ms(fn, repeat=50):
+    timings = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn(i)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000
+
+
+def bench_page_upsert(app):
+    """Catalog writes for one 20-movie listing page: per-row get() loop vs. one upsert."""
+
+    def per_row_loop(i):
+        # The loop movies/upcoming_movies/search used before upsert_movies
+        movies_to_add = []
+        for movie_data in _listing(i % 25 + 1, 0)['results']:
+            existing_movie = db.session.get(Movie, movie_data['id'])
+            if not existing_movie:
+                movies_to_add.append(Movie.from_tmdb(movie_data))
+            else:
+                existing_movie.update_from_tmdb(movie_data)
+        db.session.add_all(movies_to_add)
+        db.session.commit()
+
+    def upsert(i):
+        upsert_movies(_listing(i % 25 + 1, 0)['results'], defer=False)
+
+    def deferred(i):
+        upsert_movies(_listing(i % 25 + 1, 0)['results'], defer=True)
+
+    with app.app_context():
+        loop_ms = _median_ms(per_row_loop)
+        upsert_ms = _median_ms(upsert)
+        deferred_ms = _median_ms(deferred)
+        get_catalog_writer().stop() # Drain the background writer before the database goes away
+    print(f"catalog writes per 20-movie page:  per-row get() loop {loop_ms:6.2f} ms   "
+          f"upsert {upsert_ms:6.2f} ms   deferred upsert {deferred_ms:6.3f} ms")
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'bench.db'))
+        with app.app_context():
+            # Start from the full links.csv catalog, like a production database
+            bulk_insert_catalog_ids(read_links_tmdb_ids(Config.ML_LINKS_PATH))
+        bench_page_upsert(app)
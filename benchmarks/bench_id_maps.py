@@ -0,0 +1,73 @@
+# benchmarks/bench_id_maps.py
+# Memory and lookup cost of the pickled dict maps vs. the array-backed IdMaps.
+# Run from the project root:  python benchmarks/bench_id_maps.py
+import os
+import pickle
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from movie_webapp.config import Config
+from movie_webapp.id_maps import IdMaps
+
+
+def _load_dicts():
+    with open(Config.USER_MAP_PATH, 'rb') as f:
+        user_map = pickle.load(f)
+    with open(Config.ITEM_MAP_PATH, 'rb') as f:
+        item_maps = pickle.load(f)
+    return user_map, item_maps
+
+
+def _measure_heap(load):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = load()
+    elapsed = (time.perf_counter() - start) * 1000
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current / 1024 / 1024, elapsed
+
+
+def _timeit(fn, repeat=200):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6 # us per call
+
+
+if __name__ == '__main__':
+    (user_map, item_maps), dict_mb, dict_ms = _measure_heap(_load_dicts)
+    id_maps, array_mb, array_ms = _measure_heap(lambda: IdMaps.load(Config.ID_MAPS_PATH))
+    print(f"load:   dicts {dict_mb:6.2f} MB heap in {dict_ms:6.1f} ms   arrays {array_mb:6.2f} MB heap in {array_ms:6.1f} ms")
+
+    ml_to_model = item_maps['ml_to_model']
+    model_to_ml = item_maps['model_to_ml']
+    ml_to_tmdb = item_maps['ml_to_tmdb']
+    tmdb_to_ml = item_maps['tmdb_to_ml']
+
+    rng = np.random.default_rng(0)
+    rated_tmdb_ids = [int(x) for x in rng.choice(list(tmdb_to_ml.keys()), 300, replace=False)]
+    model_ids = list(range(id_maps.num_items))
+
+    def dict_rated():
+        result = set()
+        for tmdb_id in rated_tmdb_ids:
+            ml_id = tmdb_to_ml.get(tmdb_id)
+            if ml_id is not None:
+                model_id = ml_to_model.get(ml_id)
+                if model_id is not None:
+                    result.add(model_id)
+        return result
+
+    def dict_model_to_tmdb():
+        return [ml_to_tmdb.get(model_to_ml.get(model_id), -1) for model_id in model_ids]
+
+    assert dict_rated() == set(id_maps.tmdb_to_model_ids(rated_tmdb_ids).tolist()) - {-1}
+    print(f"300 TMDB -> model:        dicts {_timeit(dict_rated):8.1f} us   arrays {_timeit(lambda: id_maps.tmdb_to_model_ids(rated_tmdb_ids)):8.1f} us")
+    print(f"{len(model_ids)} model -> TMDB:      dicts {_timeit(dict_model_to_tmdb, 20):8.1f} us   arrays {_timeit(lambda: id_maps.item_model_to_tmdb[model_ids], 20):8.1f} us")
+    print(f"user lookup:              dicts {_timeit(lambda: user_map.get(42)):8.2f} us   arrays {_timeit(lambda: id_maps.user_model_id(42)):8.2f} us")
@@ -0,0 +1,83 @@
+# benchmarks/bench_mmap_weights.py
+# Memory of N worker processes loading the model with torch.load vs. the mmap weights file.
+# Run from the project root:  python benchmarks/bench_mmap_weights.py
+# Uses a randomly initialised model of the configured size in a temporary directory.
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import torch
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from movie_webapp.config import Config
+from movie_webapp.recommender import MLP, export_mmap_weights
+
+# Each worker builds the app (which loads the recommender), scores one user,
+# reports its Pss / Private memory and then waits so all workers are alive at once.
+WORKER = r'''
+import sys, time
+sys.path.insert(0, {root!r})
+from movie_webapp import create_app
+from movie_webapp.config import Config
+from movie_webapp.recommender import get_recommendations_for_user
+
+class BenchConfig(Config):
+    MODEL_PATH = {model_path!r}
+    MODEL_WEIGHTS_PATH = {weights_path!r}
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    PREFETCH_ENABLED = False
+
+app = create_app(BenchConfig)
+with app.app_context():
+    get_recommendations_for_user(1, [], 20)
+fields = {{}}
+with open('/proc/self/smaps_rollup') as f:
+    for line in f:
+        parts = line.split()
+        if parts[0] in ('Rss:', 'Pss:', 'Private_Clean:', 'Private_Dirty:'):
+            fields[parts[0][:-1]] = int(parts[1])
+print(fields['Rss'], fields['Pss'], fields['Private_Clean'] + fields['Private_Dirty'], flush=True)
+time.sleep({hold})
+'''
+
+
+def run_workers(num_workers, model_path, weights_path, hold=15):
+    code = WORKER.format(root=ROOT, model_path=model_path, weights_path=weights_path, hold=hold)
+    procs = [subprocess.Popen([sys.executable, '-c', code], stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, text=True) for _ in range(num_workers)]
+    # Pss is only meaningful once every worker has loaded, so wait for all reports
+    # and then re-read each worker's Pss while they are all still alive.
+    for proc in procs:
+        proc.stdout.readline()
+    rss = pss = private = 0
+    for proc in procs:
+        with open(f'/proc/{proc.pid}/smaps_rollup') as f:
+            values = {line.split()[0]: int(line.split()[1]) for line in f if line[0].isupper()}
+        rss += values['Rss:']
+        pss += values['Pss:']
+        private += values['Private_Clean:'] + values['Private_Dirty:']
+    for proc in procs:
+        proc.kill()
+        proc.wait()
+    return rss / 1024, pss / 1024, private / 1024
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = os.path.join(tmp, 'model.pth')
+        weights_path = os.path.join(tmp, 'model_weights.bin')
+        model = MLP(Config.RECOMMENDER_NUM_USERS, Config.RECOMMENDER_NUM_ITEMS,
+                    Config.RECOMMENDER_EMBEDDING_SIZE, Config.RECOMMENDER_LAYER_DIMS)
+        torch.save({'model_state_dict': model.state_dict()}, model_path)
+        export_mmap_weights(model.state_dict(), weights_path)
+
+        for num_workers in (1, 8):
+            for label, weights in (('torch.load', os.path.join(tmp, 'missing.bin')), ('mmap', weights_path)):
+                start = time.perf_counter()
+                rss, pss, private = run_workers(num_workers, model_path, weights)
+                print(f"workers={num_workers}  {label:<10}  total RSS {rss:7.1f} MB   total PSS {pss:7.1f} MB   "
+                      f"private {private:7.1f} MB   ({time.perf_counter() - start:.1f} s)")
@@ -0,0 +1,104 @@
+# benchmarks/bench_precision.py
+# RECOMMENDER_PRECISION modes vs. fp32: top-20 overlap, embedding table size, per-user
+# scoring latency for a few candidate set sizes, and the memory of a worker process that
+# builds the app (loading model.pth) at each precision.
+# Run from the project root:  python benchmarks/bench_precision.py
+# Uses a randomly initialised MLP of the configured size with unit-variance embeddings (the
+# 0.01 init leaves every score within a hair of 0.5, where any rounding reorders the list).
+import copy
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import torch
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from movie_webapp.config import Config
+from movie_webapp.recommender import (MLP, PRECISIONS, ItemTowerScorer, apply_precision, embedding_bytes,
+                                      top_k_overlap)
+
+K = 20
+NUM_USERS = 200
+
+# Builds the app at one precision, scores a user and reports RSS / private memory in kB
+WORKER = r'''
+import sys
+sys.path.insert(0, {root!r})
+from movie_webapp import create_app
+from movie_webapp.config import Config
+from movie_webapp.recommender import get_recommendations_for_user
+
+class BenchConfig(Config):
+    MODEL_PATH = {model_path!r}
+    MODEL_WEIGHTS_PATH = None
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    RECOMMENDER_PRECISION = {precision!r}
+    PREFETCH_ENABLED = False
+
+app = create_app(BenchConfig)
+with app.app_context():
+    assert get_recommendations_for_user(1, [], 20)
+with open('/proc/self/smaps_rollup') as f:
+    values = {{line.split()[0]: int(line.split()[1]) for line in f if line[0].isupper()}}
+print(values['Rss:'], values['Private_Clean:'] + values['Private_Dirty:'])
+'''
+
+
+def _median_ms(fn, repeat=30):
+    fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2] * 1000
+
+
+def _build_model():
+    torch.manual_seed(0)
+    model = MLP(Config.RECOMMENDER_NUM_USERS, Config.RECOMMENDER_NUM_ITEMS,
+                Config.RECOMMENDER_EMBEDDING_SIZE, Config.RECOMMENDER_LAYER_DIMS)
+    with torch.no_grad():
+        model.user_embedding.weight.normal_()
+        model.item_embedding.weight.normal_()
+    model.eval()
+    return model
+
+
+def bench_precisions(model, candidate_counts=(3000, 10000, 50000)):
+    user_model_ids = torch.randperm(Config.RECOMMENDER_NUM_USERS, generator=torch.Generator().manual_seed(0))[:NUM_USERS]
+    reduced = {precision: apply_precision(copy.deepcopy(model), precision) for precision in PRECISIONS}
+    for num_items in candidate_counts:
+        candidate_ids = torch.arange(num_items)
+        servable_mask = torch.ones(num_items, dtype=torch.bool)
+        reference = ItemTowerScorer(model, candidate_ids)
+        print(f"{num_items} candidates:")
+        for precision, reduced_model in reduced.items():
+            scorer = ItemTowerScorer(reduced_model, candidate_ids)
+            overlaps = top_k_overlap(reference, scorer, user_model_ids, servable_mask, k=K, batch_size=8)
+            ms = _median_ms(lambda: scorer.score_user(42))
+            print(f"  {precision:<12}  top-{K} overlap mean {overlaps.mean():.3f} min {overlaps.min():.2f}   "
+                  f"embeddings {embedding_bytes(reduced_model) / 2**20:5.1f} MB   scoring one user {ms:7.2f} ms")
+
+
+def bench_worker_memory(model_path):
+    for precision in PRECISIONS:
+        code = WORKER.format(root=ROOT, model_path=model_path, precision=precision)
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+        rss, private = (int(value) / 1024 for value in output.split()[-2:])
+        print(f"worker at {precision:<12}  RSS {rss:6.1f} MB   private {private:6.1f} MB")
+
+
+if __name__ == '__main__':
+    print(f"torch {torch.__version__}, {torch.get_num_threads()} intra-op threads, "
+          f"quantized engine {torch.backends.quantized.engine}")
+    model = _build_model()
+    bench_precisions(model)
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = os.path.join(tmp, 'model.pth')
+        torch.save({'model_state_dict': model.state_dict()}, model_path)
+        bench_worker_memory(model_path)
@@ -0,0 +1,130 @@
+# benchmarks/bench_recommender.py
+# Micro-benchmarks for the recommender scoring path.
+# Run from the project root:  python benchmarks/bench_recommender.py
+# Uses a randomly initialised MLP with the sizes from Config, so no model.pth is needed.
+import os
+import sys
+import time
+
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from movie_webapp.config import Config
+from movie_webapp.recommender import MLP, ItemTowerScorer, select_top_k
+
+
+def _timeit(fn, repeat=20, warmup=3):
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000 # median, ms
+
+
+def _build_model():
+    torch.manual_seed(0)
+    model = MLP(Config.RECOMMENDER_NUM_USERS, Config.RECOMMENDER_NUM_ITEMS,
+                Config.RECOMMENDER_EMBEDDING_SIZE, Config.RECOMMENDER_LAYER_DIMS)
+    model.eval()
+    return model
+
+
+def bench_item_tower(model, num_items):
+    """Full per-request forward vs. the precomputed item tower."""
+    item_ids = list(range(num_items))
+    user_model_id = 42
+
+    def full_forward():
+        user_tensor = torch.tensor([user_model_id] * len(item_ids), dtype=torch.long)
+        item_tensor = torch.tensor(item_ids, dtype=torch.long)
+        with torch.no_grad():
+            return model(user_tensor, item_tensor)
+
+    scorer = ItemTowerScorer(model, item_ids)
+    assert torch.allclose(full_forward(), scorer.score_user(user_model_id), atol=1e-6)
+
+    full_ms = _timeit(full_forward)
+    tower_ms = _timeit(lambda: scorer.score_user(user_model_id))
+    print(f"items={num_items:>7}  full forward {full_ms:8.2f} ms   item tower {tower_ms:8.2f} ms   "
+          f"speedup x{full_ms / tower_ms:.1f}")
+
+
+def bench_selection(num_items, k=20, num_rated=300):
+    """Python sort over every item vs. masked torch.topk."""
+    torch.manual_seed(0)
+    scores = torch.rand(num_items)
+    item_ids = list(range(num_items))
+    servable_mask = torch.rand(num_items) < 0.95
+    servable = set(torch.nonzero(servable_mask).view(-1).tolist())
+    rated = set(range(0, num_rated * 7, 7))
+
+    def python_sort():
+        ranked = sorted(zip(item_ids, scores.tolist()), key=lambda item: item[1], reverse=True)
+        picked = []
+        for item_id, score in ranked:
+            if item_id not in rated and item_id in servable:
+                picked.append(item_id)
+                if len(picked) >= k:
+                    break
+        return picked
+
+    def vectorized():
+        positions, _ = select_top_k(scores, servable_mask, sorted(rated), k)
+        return positions.tolist()
+
+    assert python_sort() == vectorized()
+    sort_ms = _timeit(python_sort)
+    topk_ms = _timeit(vectorized)
+    print(f"items={num_items:>7}  python sort  {sort_ms:8.2f} ms   masked topk {topk_ms:8.2f} ms   "
+          f"speedup x{sort_ms / topk_ms:.1f}")
+
+
+def bench_fold_in(model, num_items=3706, num_rated=(5, 30, 200), steps=10):
+    """Cold-start fold-in (hand-written backprop) + scoring, for users missing from the user map."""
+    torch.manual_seed(0)
+    scorer = ItemTowerScorer(model, list(range(num_items)))
+    for count in num_rated:
+        item_ids = torch.randint(0, num_items, (count,))
+        targets = torch.rand(count)
+        fold_in_ms = _timeit(lambda: scorer.fold_in_user(item_ids, targets, steps=steps))
+        total_ms = _timeit(lambda: scorer.score_embeddings(scorer.fold_in_user(item_ids, targets, steps=steps).unsqueeze(0)))
+        print(f"fold-in, {count:>3} ratings, {steps} steps:  fold-in {fold_in_ms:6.2f} ms   fold-in + score {total_ms:6.2f} ms")
+
+
+def bench_candidates(model, num_items=3706, num_servable=2933, caps=(1000, 250), k=20, num_rated=100):
+    """Per-request scoring + selection over every model item vs. only the servable candidates (optionally capped)."""
+    torch.manual_seed(0)
+    servable_ids = torch.sort(torch.randperm(num_items)[:num_servable]).values
+    rated_ids = servable_ids[torch.randperm(num_servable)[:num_rated]]
+    user_model_id = 42
+
+    all_mask = torch.zeros(num_items, dtype=torch.bool)
+    all_mask[servable_ids] = True
+    runs = [(f'all {num_items} model items', torch.arange(num_items), all_mask)]
+    for size in (num_servable,) + caps:
+        runs.append((f'{size} candidates', servable_ids[:size], torch.ones(size, dtype=torch.bool)))
+
+    baseline_ms = None
+    for label, item_ids, servable_mask in runs:
+        scorer = ItemTowerScorer(model, item_ids)
+        # Rated items as positions in this scorer's item order (what model_to_position gives in the app)
+        rated = torch.nonzero(torch.isin(item_ids, rated_ids)).view(-1).tolist()
+        ms = _timeit(lambda: select_top_k(scorer.score_user(user_model_id), servable_mask, rated, k), repeat=200)
+        baseline_ms = baseline_ms or ms
+        print(f"score + select, {label:<22} {ms:6.3f} ms   x{baseline_ms / ms:.2f}")
+
+
+if __name__ == '__main__':
+    model = _build_model()
+    print(f"torch {torch.__version__}, {torch.get_num_threads()} intra-op threads")
+    for n in (3706, Config.RECOMMENDER_NUM_ITEMS):
+        bench_item_tower(model, n)
+    for n in (3706, Config.RECOMMENDER_NUM_ITEMS):
+        bench_selection(n)
+    bench_fold_in(model)
+    bench_candidates(model)
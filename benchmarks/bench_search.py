@@ -0,0 +1,126 @@
+# benchmarks/bench_search.py
+# Local FTS5 search over the catalog vs. a LIKE scan of the movies table vs. a live TMDB
+# search/movie call (local stub with a simulated upstream latency), over a few thousand
+# sample queries typed as users do (whole words, last one a prefix).
+# Run from the project root:  python benchmarks/bench_search.py
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import text
+
+from movie_webapp import api, create_app, db
+from movie_webapp.config import Config
+from movie_webapp.models import Movie
+from movie_webapp.search_index import search_local
+from stub_tmdb import StubTMDBServer
+
+CATALOG_SIZE = 60000
+NUM_QUERIES = 3000
+LATENCY = 0.2 # Simulated TMDB latency in seconds for the upstream comparison
+
+
+def make_app(base_url, db_path):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{db_path}'
+        TMDB_API_BASE_URL = base_url
+        TMDB_API_KEY = 'bench'
+        TMDB_CACHE_BACKEND = 'none'
+        PREFETCH_ENABLED = False
+    return create_app(BenchConfig)
+
+
+def _words(rng, count):
+    syllables = ['ka', 'lo', 'mi', 'ra', 'ten', 'dor', 'vel', 'an', 'is', 'ur', 'sha', 'bri', 'ton', 'el', 'gra', 'mo']
+    words = set()
+    while len(words) < count:
+        words.add(''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def fill_catalog(rng):
+    """CATALOG_SIZE movies with 1-5 word titles drawn Zipf-like from a 5000-word vocabulary."""
+    vocabulary = _words(rng, 5000)
+    rng.shuffle(vocabulary) # Frequency must not follow spelling, or every common word shares one prefix
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    titles = [' '.join(rng.choices(vocabulary, weights, k=rng.randint(1, 5))).title() for _ in range(CATALOG_SIZE)]
+    rows = [{'id': movie_id, 'title': title, 'original_title': title, 'release_date': f'{rng.randint(1920, 2025)}-01-01',
+             'popularity': rng.random() * 100}
+            for movie_id, title in enumerate(titles, start=1)]
+    start = time.perf_counter()
+    with db.engine.begin() as conn:
+        conn.execute(Movie.__table__.insert(), rows) # The triggers index each row on the way in
+    print(f"inserted and indexed {CATALOG_SIZE} movies in {time.perf_counter() - start:.2f} s")
+    return titles
+
+
+def sample_queries(rng, titles):
+    queries = []
+    for title in rng.sample(titles, NUM_QUERIES):
+        words = title.lower().split()[:rng.randint(1, 3)]
+        words[-1] = words[-1][:rng.randint(2, len(words[-1]))] # Still typing the last word
+        queries.append(' '.join(words))
+    return queries
+
+
+def _percentiles(timings):
+    timings = sorted(timings)
+    return (timings[len(timings) // 2] * 1000, timings[int(len(timings) * 0.95)] * 1000,
+            timings[int(len(timings) * 0.99)] * 1000)
+
+
+def bench_local(queries):
+    timings, hits = [], 0
+    for query in queries:
+        start = time.perf_counter()
+        results, total = search_local(query)
+        timings.append(time.perf_counter() - start)
+        hits += total >= Config.SEARCH_LOCAL_MIN_RESULTS
+    p50, p95, p99 = _percentiles(timings)
+    print(f"FTS5 (bm25, prefix):  p50 {p50:6.2f} ms   p95 {p95:6.2f} ms   p99 {p99:6.2f} ms   "
+          f"{hits / len(queries):.0%} of queries answered locally")
+
+
+def bench_like(queries):
+    # What a naive local search would do: a full scan with one LIKE per word
+    timings = []
+    for query in queries[:300]:
+        words = query.split()
+        where = ' AND '.join(f'title LIKE :w{i}' for i in range(len(words)))
+        params = {f'w{i}': f'%{word}%' for i, word in enumerate(words)}
+        start = time.perf_counter()
+        db.session.execute(text(f'SELECT * FROM movies WHERE {where} ORDER BY popularity DESC LIMIT 20'), params).all()
+        timings.append(time.perf_counter() - start)
+    p50, p95, p99 = _percentiles(timings)
+    print(f"LIKE scan:            p50 {p50:6.2f} ms   p95 {p95:6.2f} ms   p99 {p99:6.2f} ms   (300 queries)")
+
+
+def bench_tmdb(queries):
+    timings = []
+    for query in queries[:20]:
+        start = time.perf_counter()
+        api.search_movies(query)
+        timings.append(time.perf_counter() - start)
+    p50, p95, _ = _percentiles(timings)
+    print(f"TMDB search/movie:    p50 {p50:6.2f} ms   p95 {p95:6.2f} ms   ({LATENCY * 1000:.0f} ms simulated upstream, 20 queries)")
+
+
+if __name__ == '__main__':
+    rng = random.Random(0)
+    upstream = StubTMDBServer(latency=LATENCY).start()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            app = make_app(upstream.base_url, os.path.join(tmp, 'bench.db'))
+            with app.app_context():
+                titles = fill_catalog(rng)
+                queries = sample_queries(rng, titles)
+                bench_local(queries)
+                bench_like(queries)
+                bench_tmdb(queries)
+    finally:
+        upstream.stop()
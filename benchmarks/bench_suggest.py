@@ -0,0 +1,70 @@
+# benchmarks/bench_suggest.py
+# /api/suggest typeahead index: build time, lookup latency per query length (the budget is
+# 5 ms per request), and the cost of incremental updates from the catalog upsert path.
+# Run from the project root:  python benchmarks/bench_suggest.py
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_search import fill_catalog, make_app, _percentiles
+from movie_webapp import catalog
+from movie_webapp.suggest import build_suggest_index
+
+NUM_QUERIES = 3000
+
+
+def bench_build():
+    start = time.perf_counter()
+    index = build_suggest_index()
+    print(f"built the index over {len(index)} titles ({len(index._keys)} keys) in {time.perf_counter() - start:.2f} s")
+    return index
+
+
+def bench_lookups(index, titles, rng):
+    for length in (1, 2, 3, 5, 8):
+        timings = []
+        for title in rng.sample(titles, NUM_QUERIES):
+            words = title.split()
+            query = ' '.join(words[rng.randrange(len(words)):])[:length] # From a random word on
+            start = time.perf_counter()
+            index.suggest(query, 10)
+            timings.append(time.perf_counter() - start)
+        p50, p95, p99 = _percentiles(timings)
+        print(f"  {length}-character queries:  p50 {p50:6.3f} ms   p95 {p95:6.3f} ms   p99 {p99:6.3f} ms   "
+              f"max {max(timings) * 1000:6.3f} ms")
+
+
+def bench_updates(index, rng):
+    """Upserts of 20-movie pages (new titles) through the catalog path, including the merges they trigger."""
+    pages = [[{'id': 1000000 + page * 20 + i, 'title': f'Fresh Title {page} {i}', 'popularity': rng.random() * 100}
+              for i in range(20)] for page in range(500)]
+    start = time.perf_counter()
+    for page in pages:
+        catalog.upsert_movies(page, defer=False)
+    elapsed = time.perf_counter() - start
+    print(f"500 upserted pages of 20 new movies: {elapsed / 500 * 1000:.2f} ms per page (database write included), "
+          f"{len(index)} titles now")
+    timings = []
+    for _ in range(NUM_QUERIES):
+        start = time.perf_counter()
+        index.suggest('fresh title', 10)
+        timings.append(time.perf_counter() - start)
+    p50, _, p99 = _percentiles(timings)
+    print(f"  lookups hitting the new titles:  p50 {p50:6.3f} ms   p99 {p99:6.3f} ms")
+
+
+if __name__ == '__main__':
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app('http://127.0.0.1:9', os.path.join(tmp, 'bench.db')) # TMDB is never called
+        with app.app_context():
+            titles = fill_catalog(rng)
+            index = bench_build()
+            app.config['suggest_index'] = index
+            bench_lookups(index, titles, rng)
+            bench_updates(index, rng)
@@ -0,0 +1,95 @@
+# benchmarks/bench_tmdb.py
+# TMDB client benchmarks against the local stub server (benchmarks/stub_tmdb.py).
+# Run from the project root:  python benchmarks/bench_tmdb.py
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from movie_webapp import api, create_app
+from movie_webapp.config import Config
+from stub_tmdb import StubTMDBServer
+
+
+def make_app(server, **overrides):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite://'
+        TMDB_API_BASE_URL = server.base_url
+        TMDB_API_KEY = 'bench'
+        TMDB_CACHE_BACKEND = 'none'
+        PREFETCH_ENABLED = False
+    for name, value in overrides.items():
+        setattr(BenchConfig, name, value)
+    return create_app(BenchConfig)
+
+
+def bench_connection_reuse(server, app, num_requests=500):
+    """Fresh connection per call (bare requests.get) vs. the pooled keep-alive session."""
+    url = f'{server.base_url}/movie/550'
+
+    server.reset_counters()
+    start = time.perf_counter()
+    for _ in range(num_requests):
+        requests.get(url, params={'api_key': 'bench'}, timeout=10).json()
+    bare = num_requests / (time.perf_counter() - start)
+    bare_connections = server.connections
+
+    server.reset_counters()
+    with app.app_context():
+        start = time.perf_counter()
+        for _ in range(num_requests):
+            api._make_tmdb_request('movie/550')
+        pooled = num_requests / (time.perf_counter() - start)
+    pooled_connections = server.connections
+
+    print(f"connection reuse ({num_requests} calls):  bare requests.get {bare:7.0f} req/s ({bare_connections} connections)   "
+          f"pooled session {pooled:7.0f} req/s ({pooled_connections} connections)   x{pooled / bare:.1f}")
+
+
+def check_retries(server, app):
+    """A 503 with Retry-After is retried transparently."""
+    with app.app_context():
+        server.fail_next = 2
+        server.reset_counters()
+        data = api._make_tmdb_request('movie/551')
+        print(f"retry on 503: {'ok' if data and data.get('id') == 551 else 'FAILED'} after {server.requests} upstream attempts")
+
+
+def bench_batch_details(latency=0.02, sizes=(20, 100, 500)):
+    """N serial get_movie_details calls vs. one get_movies_details batch (cold cache)."""
+    server = StubTMDBServer(latency=latency).start()
+    app = make_app(server, TMDB_CACHE_BACKEND='memory', TMDB_CACHE_MAX_ENTRIES=10000)
+    with app.app_context():
+        for size in sizes:
+            app.config['tmdb_cache'].clear()
+            ids = list(range(1, size + 1))
+            start = time.perf_counter()
+            for movie_id in ids:
+                api.get_movie_details(movie_id)
+            serial_ms = (time.perf_counter() - start) * 1000
+
+            app.config['tmdb_cache'].clear()
+            start = time.perf_counter()
+            results = api.get_movies_details(ids)
+            batch_ms = (time.perf_counter() - start) * 1000
+            assert all(results[movie_id] for movie_id in ids)
+
+            start = time.perf_counter()
+            api.get_movies_details(ids)
+            warm_ms = (time.perf_counter() - start) * 1000
+            print(f"details for {size:>3} ids ({latency * 1000:.0f} ms upstream):  serial {serial_ms:8.1f} ms   "
+                  f"batch {batch_ms:7.1f} ms   batch, warm cache {warm_ms:6.1f} ms")
+    server.stop()
+
+
+if __name__ == '__main__':
+    server = StubTMDBServer().start()
+    app = make_app(server)
+    bench_connection_reuse(server, app)
+    check_retries(server, app)
+    server.stop()
+    bench_batch_details()
@@ -0,0 +1,147 @@
+# benchmarks/stub_tmdb.py
+# A local stand-in for api.themoviedb.org used by the benchmarks.
+# Serves deterministic fake data for the endpoints movie_webapp/api.py calls, with a
+# configurable per-request latency, and counts the requests and TCP connections it sees.
+import json
+import re
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def _movie(movie_id):
+    return {
+        'id': movie_id,
+        'title': f'Movie {movie_id}',
+        'original_title': f'Original Movie {movie_id}',
+        'overview': f'Overview of movie {movie_id}.',
+        'poster_path': f'/poster{movie_id}.jpg',
+        'release_date': f'{1950 + movie_id % 75}-01-01',
+        'vote_average': round(5 + (movie_id % 50) / 10, 1),
+        'popularity': float(movie_id % 1000),
+        'genres': [{'id': 18, 'name': 'Drama'}],
+        'genre_ids': [18],
+    }
+
+
+def _credits(movie_id):
+    return {'id': movie_id, 'cast': [{'name': f'Actor {i}', 'character': f'Role {i}', 'profile_path': None}
+                                     for i in range(5)]}
+
+
+def _videos(movie_id):
+    return {'id': movie_id, 'results': [{'site': 'YouTube', 'type': 'Trailer', 'official': True,
+                                         'key': f'key{movie_id}', 'name': 'Trailer'}]}
+
+
+def _listing(page, offset):
+    return {'page': page, 'total_pages': 50, 'total_results': 1000,
+            'results': [_movie(offset + (page - 1) * 20 + i + 1) for i in range(20)]}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # Allow keep-alive
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        # Headers and body are written separately; without this, Nagle + delayed ACK
+        # add ~40 ms to every response on a kept-alive connection
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            fail = server.fail_next > 0
+            if fail:
+                server.fail_next -= 1
+        if server.latency:
+            time.sleep(server.latency)
+
+        if fail:
+            return self._send(503, {'status_message': 'Service unavailable'}, {'Retry-After': '0'})
+
+        url = urlparse(self.path)
+        path = url.path.removeprefix('/3/').strip('/')
+        query = parse_qs(url.query)
+        page = int(query.get('page', ['1'])[0])
+
+        if path == 'movie/top_rated':
+            return self._send(200, _listing(page, 0))
+        if path == 'movie/upcoming':
+            return self._send(200, _listing(page, 100000))
+        if path == 'search/movie':
+            return self._send(200, _listing(page, 200000))
+        match = re.fullmatch(r'movie/(\d+)(?:/(credits|videos))?', path)
+        if match:
+            movie_id, sub = int(match.group(1)), match.group(2)
+            if sub == 'credits':
+                return self._send(200, _credits(movie_id))
+            if sub == 'videos':
+                return self._send(200, _videos(movie_id))
+            data = _movie(movie_id)
+            appended = query.get('append_to_response', [''])[0]
+            if 'credits' in appended:
+                data['credits'] = _credits(movie_id)
+            if 'videos' in appended:
+                data['videos'] = _videos(movie_id)
+            return self._send(200, data)
+        return self._send(404, {'status_message': 'Not found'})
+
+    def _send(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StubTMDBServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128 # The default listen backlog (5) drops SYNs under concurrent connects
+
+    def __init__(self, latency=0.0):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.fail_next = 0 # Number of upcoming requests to answer with 503
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/3'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def reset_counters(self):
+        with self.lock:
+            self.requests = 0
+            self.connections = 0
+
+
+if __name__ == '__main__':
+    # Standalone, so benchmarks can keep the stub's CPU use out of the measured process:
+    #   python benchmarks/stub_tmdb.py 0.05   (prints the base URL, then serves until killed)
+    import sys
+    server = StubTMDBServer(latency=float(sys.argv[1]) if len(sys.argv) > 1 else 0.0)
+    print(server.base_url, flush=True)
+    server.serve_forever()
@@ -1,7 +1,17 @@
 # create_mappings.py
+import importlib.util
 import pandas as pd
 import pickle
 import os
+import sys
+
+# Load movie_webapp/id_maps.py by path: importing it as movie_webapp.id_maps would run the
+# package __init__ (Flask, torch and the whole app) just to write a .npz file
+_spec = importlib.util.spec_from_file_location(
+    'id_maps', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'movie_webapp', 'id_maps.py'))
+_id_maps = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_id_maps)
+IdMaps = _id_maps.IdMaps
 
 # --- Configuration ---
 # Adjust these paths relative to where you run this script
@@ -15,9 +25,31 @@ LINKS_CSV_PATH = os.path.join(MOVIEWEBAPP_DIR, 'links.csv') # Path to your train
 # Output paths for the mapping files (will be saved INSIDE movie_webapp)
 USER_MAP_PKL_PATH = os.path.join(MOVIEWEBAPP_DIR, 'user_map.pkl')
 ITEM_MAP_PKL_PATH = os.path.join(MOVIEWEBAPP_DIR, 'item_map.pkl')
+ID_MAPS_PATH = os.path.join(MOVIEWEBAPP_DIR, 'id_maps.npz') # Array-backed maps loaded by the web app
 # ---------------------
 
-def create_and_save_mappings(ratings_csv_path, links_csv_path, user_map_output_path, item_map_output_path):
+def save_id_maps(user_map, item_mappings, id_maps_output_path):
+    """Converts the dict mappings into the array-backed IdMaps and saves them as .npz."""
+    try:
+        id_maps = IdMaps.from_dicts(user_map, item_mappings['ml_to_model'],
+                                    item_mappings['ml_to_tmdb'], item_mappings['tmdb_to_ml'])
+        id_maps.save(id_maps_output_path)
+        print(f"ID maps ({id_maps.num_users} users, {id_maps.num_items} items) saved to {id_maps_output_path}")
+    except Exception as e:
+        print(f"Error saving ID maps: {e}")
+
+
+def convert_pickles_to_id_maps(user_map_pkl_path, item_map_pkl_path, id_maps_output_path):
+    """Builds id_maps.npz from existing user_map.pkl / item_map.pkl files (no CSVs needed)."""
+    with open(user_map_pkl_path, 'rb') as f:
+        user_map = pickle.load(f)
+    with open(item_map_pkl_path, 'rb') as f:
+        item_mappings = pickle.load(f)
+    save_id_maps(user_map, item_mappings, id_maps_output_path)
+
+
+def create_and_save_mappings(ratings_csv_path, links_csv_path, user_map_output_path, item_map_output_path,
+                             id_maps_output_path=ID_MAPS_PATH):
     """
     Creates user and item mapping files from MovieLens data.
 
@@ -26,6 +58,7 @@ def create_and_save_mappings(ratings_csv_path, links_csv_path, user_map_output_p
         links_csv_path (str): Path to the MovieLens links.csv file.
         user_map_output_path (str): Path to save the user_map.pkl file.
         item_map_output_path (str): Path to save the item_map.pkl file.
+        id_maps_output_path (str): Path to save the array-backed id_maps.npz file.
     """
     print(f"Loading data from {ratings_csv_path} and {links_csv_path}...")
 
@@ -96,9 +129,17 @@ def create_and_save_mappings(ratings_csv_path, links_csv_path, user_map_output_p
     except Exception as e:
         print(f"Error saving item maps: {e}")
 
+    # Save the same maps as contiguous arrays for the web app
+    save_id_maps(user_map, item_mappings, id_maps_output_path)
+
     print("Mapping generation complete.")
 
 
 # --- Run the script ---
+# python create_mappings.py                 -> build everything from the training CSVs
+# python create_mappings.py --from-pickles  -> only convert the existing .pkl maps to id_maps.npz
 if __name__ == "__main__":
-    create_and_save_mappings(RATINGS_CSV_PATH, LINKS_CSV_PATH, USER_MAP_PKL_PATH, ITEM_MAP_PKL_PATH)
\ No newline at end of file
+    if '--from-pickles' in sys.argv[1:]:
+        convert_pickles_to_id_maps(USER_MAP_PKL_PATH, ITEM_MAP_PKL_PATH, ID_MAPS_PATH)
+    else:
+        create_and_save_mappings(RATINGS_CSV_PATH, LINKS_CSV_PATH, USER_MAP_PKL_PATH, ITEM_MAP_PKL_PATH)
\ No newline at end of file
@@ -31,15 +31,12 @@ def create_app(config_class=Config):
     db.init_app(app)
     login_manager.init_app(app)
 
-    # --- Load Recommender Model and Maps ---
-    # Call the loading function and store the returned dictionary in app.config
-    # **Ensure this line is present and correct**
-    app.config['recommender_loaded_data'] = recommender.load_recommender_model(app)
-    # Check if model loading was successful
-    if app.config['recommender_loaded_data'].get('model') is None:
-        app.logger.warning("Recommender model failed to load or is incomplete. Personalized recommendations will not be available.")
-    # -----------------------------------------
-
+    # --- TMDB response cache ---
+    from .api import init_tmdb_cache
+    init_tmdb_cache(app)
+    # --- Rendered fragment cache ---
+    from .fragments import init_fragment_cache
+    init_fragment_cache(app)
 
     # Import and register routes blueprint
     # from .routes import routes as routes_blueprint # This was the old way
@@ -47,10 +44,38 @@ def create_app(config_class=Config):
     from movie_webapp.routes import routes as routes_blueprint # Use absolute import here
     app.register_blueprint(routes_blueprint)
 
+    # Register CLI commands (flask --app run <command>)
+    from movie_webapp.commands import register_commands
+    register_commands(app)
+
     # Ensure database tables are created within app context
     # This happens *after* models are imported above and associated with db
     with app.app_context():
         db.create_all()
+        # Bring tables created by older versions up to date with the models
+        from .models import add_missing_columns
+        add_missing_columns()
+        # Full-text index over the catalog for /search (needs the movies table and its columns)
+        from .search_index import init_search_index
+        init_search_index(app)
+        # In-memory title prefix index for the search-box typeahead
+        from .suggest import init_suggest_index
+        init_suggest_index(app)
+
+    # --- Load Recommender Model and Maps ---
+    # After the schema setup above: candidate selection reads popularity from the movies table
+    # Call the loading function and store the returned dictionary in app.config
+    # **Ensure this line is present and correct**
+    app.config['recommender_loaded_data'] = recommender.load_recommender_model(app)
+    recommender.init_recommendation_cache(app)
+    # Check if model loading was successful
+    if app.config['recommender_loaded_data'].get('model') is None:
+        app.logger.warning("Recommender model failed to load or is incomplete. Personalized recommendations will not be available.")
+    # -----------------------------------------
+
+    # --- Background prefetch of popular TMDB listings (needs the routes and the catalog table) ---
+    from .prefetch import init_prefetcher
+    init_prefetcher(app)
 
     return app
 
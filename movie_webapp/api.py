@@ -1,9 +1,126 @@
 # movie_webapp/api.py
+import os
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatch
+from urllib.parse import urlencode
 from flask import current_app
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from .cache import make_cache
+
+# --- Pooled HTTP session ---
+class _CappedRetry(Retry):
+    """Retry that honours Retry-After but never sleeps longer than backoff_max."""
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, self.backoff_max)
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+def _build_session(config):
+    retry = _CappedRetry(
+        total=config.get('TMDB_MAX_RETRIES', 3),
+        backoff_factor=config.get('TMDB_RETRY_BACKOFF', 0.5),
+        backoff_max=config.get('TMDB_RETRY_MAX_WAIT', 10),
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET']),
+        respect_retry_after_header=True,
+        raise_on_status=False, # Hand the final error response back to raise_for_status()
+    )
+    adapter = HTTPAdapter(pool_connections=config.get('TMDB_POOL_CONNECTIONS', 4),
+                          pool_maxsize=config.get('TMDB_POOL_SIZE', 10),
+                          max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def _get_session():
+    """Returns this process's keep-alive session, creating it on first use (and again after a fork)."""
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        with _session_lock:
+            if _session is None or _session_pid != os.getpid():
+                _session = _build_session(current_app.config)
+                _session_pid = os.getpid()
+    return _session
+
+# --- Concurrent fan-out ---
+_executor = None
+_executor_pid = None
+
+def _get_executor():
+    """Returns this process's bounded thread pool for concurrent TMDB calls (TMDB_FETCH_WORKERS threads)."""
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _session_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(max_workers=current_app.config.get('TMDB_FETCH_WORKERS', 8),
+                                               thread_name_prefix='tmdb-fetch')
+                _executor_pid = os.getpid()
+    return _executor
+
+def _run_concurrently(calls):
+    """
+    Runs (function, args) pairs on the shared pool, each inside an app context,
+    and returns their results in order.
+    """
+    app = current_app._get_current_object()
+
+    def run_in_app_context(function, args):
+        with app.app_context():
+            return function(*args)
+
+    futures = [_get_executor().submit(run_in_app_context, function, args) for function, args in calls]
+    return [future.result() for future in futures]
+
+# --- Response cache ---
+def init_tmdb_cache(app):
+    """Creates the TMDB response cache configured by TMDB_CACHE_* and stores it in app.config."""
+    app.config['tmdb_cache'] = make_cache(app.config.get('TMDB_CACHE_BACKEND', 'memory'),
+                                          path=app.config.get('TMDB_CACHE_PATH'),
+                                          max_entries=app.config.get('TMDB_CACHE_MAX_ENTRIES', 1024))
+
+def _cache_ttl(endpoint):
+    """TTL in seconds for an endpoint: the first matching pattern in TMDB_CACHE_TTLS wins, 0 means don't cache."""
+    for pattern, ttl in current_app.config.get('TMDB_CACHE_TTLS', {}).items():
+        if fnmatch(endpoint, pattern):
+            return ttl
+    return 0
+
+def _cache_key(endpoint, params):
+    # The API key is deliberately not part of the key
+    return f"{endpoint}?{urlencode(sorted((params or {}).items()))}"
 
 # Helper function to make TMDB API requests
-def _make_tmdb_request(endpoint, params=None):
+def _get_cached_response(endpoint, params=None):
+    """Returns the cached response for a request, or None on a miss (or if the endpoint isn't cached)."""
+    cache = current_app.config.get('tmdb_cache')
+    if cache is None or _cache_ttl(endpoint) <= 0:
+        return None
+    return cache.get(_cache_key(endpoint, params))
+
+def _make_tmdb_request(endpoint, params=None, refresh=False):
+    """
+    GETs a TMDB endpoint and returns the decoded JSON (None on failure).
+    Responses are served from / stored in the response cache; refresh=True skips
+    the cache lookup but still stores the fresh response.
+    """
+    cache = current_app.config.get('tmdb_cache')
+    ttl = _cache_ttl(endpoint) if cache is not None else 0
+    if ttl > 0:
+        cache_key = _cache_key(endpoint, params)
+        cached = cache.get(cache_key) if not refresh else None
+        if cached is not None:
+            return cached
+
     base_url = current_app.config['TMDB_API_BASE_URL']
     api_key = current_app.config['TMDB_API_KEY']
 
@@ -17,13 +134,19 @@ def _make_tmdb_request(endpoint, params=None):
         default_params.update(params)
 
     try:
-        response = requests.get(url, params=default_params)
+        timeout = (current_app.config.get('TMDB_CONNECT_TIMEOUT', 3.05), current_app.config.get('TMDB_READ_TIMEOUT', 10))
+        response = _get_session().get(url, params=default_params, timeout=timeout)
         response.raise_for_status() # Raise an HTTPError for bad responses (4xx or 5xx)
-        return response.json()
+        data = response.json()
     except requests.exceptions.RequestException as e:
         current_app.logger.error(f"TMDB API request failed for endpoint {endpoint}: {e}")
         return None
 
+    # Only successful responses are cached
+    if ttl > 0 and data is not None:
+        cache.set(cache_key, data, ttl)
+    return data
+
 def get_top_rated_movies(page=1):
     """Fetches a list of top-rated movies from TMDB."""
     data = _make_tmdb_request('movie/top_rated', {'page': page})
@@ -49,6 +172,58 @@ def get_movie_videos(movie_id):
     return data.get('results', []) if data else []
 # ----------------------------------------
 
+def get_movies_details(movie_ids):
+    """
+    Fetches details for many movies at once.
+
+    Cached responses are served directly; only the misses go upstream, concurrently
+    on the bounded TMDB_FETCH_WORKERS pool.
+
+    Returns:
+        dict: TMDB ID -> details dict, or None where the fetch failed.
+    """
+    movie_ids = list(dict.fromkeys(movie_ids)) # Dedupe, keep order
+    results = {movie_id: _get_cached_response(f'movie/{movie_id}') for movie_id in movie_ids}
+    misses = [movie_id for movie_id, data in results.items() if data is None]
+
+    if len(misses) == 1:
+        results[misses[0]] = _make_tmdb_request(f'movie/{misses[0]}', refresh=True)
+    elif misses:
+        fetched = _run_concurrently([(_make_tmdb_request, (f'movie/{movie_id}', None, True)) for movie_id in misses])
+        results.update(zip(misses, fetched))
+    return results
+
+# --- Function to get details, credits and videos together ---
+# Params of the combined details request; the prefetcher warms the same cache key
+FULL_DETAILS_PARAMS = {'append_to_response': 'credits,videos'}
+
+def get_movie_full_details(movie_id):
+    """
+    Fetches details, credits and videos for a movie in one round trip using TMDB's
+    append_to_response. Falls back to three concurrent calls if the combined response
+    lacks credits or videos (or TMDB_APPEND_TO_RESPONSE is off); if the request itself
+    fails, returns the empty result rather than retrying three more times.
+
+    Returns:
+        tuple: (details dict or None, credits dict or None, list of video dicts)
+    """
+    if current_app.config.get('TMDB_APPEND_TO_RESPONSE', True):
+        data = _make_tmdb_request(f'movie/{movie_id}', FULL_DETAILS_PARAMS)
+        if data is None:
+            return None, None, [] # TMDB failed; three more calls would only add load to it
+        if 'credits' in data and 'videos' in data:
+            # Copy rather than pop: data may be the cached object itself
+            details = {key: value for key, value in data.items() if key not in ('credits', 'videos')}
+            videos = data['videos']
+            return details, data['credits'], videos.get('results', []) if videos else []
+
+    return tuple(_run_concurrently([
+        (get_movie_details, (movie_id,)),
+        (get_movie_credits, (movie_id,)),
+        (get_movie_videos, (movie_id,)),
+    ]))
+# ----------------------------------------
+
 def get_upcoming_movies(page=1):
     """Fetches a list of upcoming movies from TMDB."""
     data = _make_tmdb_request('movie/upcoming', {'page': page})
@@ -0,0 +1,239 @@
+# movie_webapp/async_api.py
+# asyncio counterparts of the TMDB helpers in api.py, over one shared httpx.AsyncClient.
+#
+# The client lives on a background event loop (one thread per worker process). Async views
+# await calls on it with `await call(get_movie_details, movie_id)`; sync code can use
+# `run(...)`. Everything scheduled on the loop runs inside the caller's app context, and
+# shares the TMDB response cache with api.py.
+import asyncio
+import atexit
+import os
+import threading
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import httpx
+from flask import current_app
+from .api import FULL_DETAILS_PARAMS, _cache_key, _cache_ttl
+from .cache import SQLiteCache
+
+# --- Shared event loop and client ---
+_loop = None
+_loop_pid = None
+_client = None
+_upstream_slots = None # Semaphore bounding in-flight upstream requests to the client's pool size
+_loop_lock = threading.Lock()
+
+def _get_loop():
+    """Returns this process's TMDB event loop, starting its thread on first use (and again after a fork)."""
+    global _loop, _loop_pid, _client, _upstream_slots
+    if _loop is None or _loop_pid != os.getpid():
+        with _loop_lock:
+            if _loop is None or _loop_pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='tmdb-async', daemon=True).start()
+                _loop, _loop_pid, _client, _upstream_slots = loop, os.getpid(), None, None
+                atexit.register(_shutdown, loop)
+    return _loop
+
+def _shutdown(loop):
+    """Closes the shared client and stops the loop (registered with atexit)."""
+    async def close_client():
+        global _client
+        if _client is not None:
+            await _client.aclose()
+            _client = None
+    if loop.is_running():
+        try:
+            asyncio.run_coroutine_threadsafe(close_client(), loop).result(timeout=5)
+        except Exception:
+            pass
+        loop.call_soon_threadsafe(loop.stop)
+
+def _get_client():
+    """Returns the shared AsyncClient. Only called on the loop thread, so no locking is needed."""
+    global _client
+    if _client is None:
+        config = current_app.config
+        max_connections = config.get('TMDB_ASYNC_MAX_CONNECTIONS', 32)
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(config.get('TMDB_READ_TIMEOUT', 10), connect=config.get('TMDB_CONNECT_TIMEOUT', 3.05)),
+            # Transport-level retries cover connection errors; 429/5xx are retried in _get_with_retries
+            transport=httpx.AsyncHTTPTransport(limits=limits, retries=config.get('TMDB_MAX_RETRIES', 3)),
+        )
+    return _client
+
+def _get_upstream_slots():
+    """
+    Semaphore sized TMDB_ASYNC_MAX_CONNECTIONS that every upstream request holds, so large
+    gathers queue here instead of waiting (and timing out) on the httpx connection pool.
+    Only called on the loop thread.
+    """
+    global _upstream_slots
+    if _upstream_slots is None:
+        _upstream_slots = asyncio.Semaphore(current_app.config.get('TMDB_ASYNC_MAX_CONNECTIONS', 32))
+    return _upstream_slots
+
+async def _cache_call(cache, method, *args):
+    """Calls a cache method; the SQLite backend's disk I/O runs on a thread so it never stalls the loop."""
+    if isinstance(cache, SQLiteCache):
+        return await asyncio.to_thread(getattr(cache, method), *args)
+    return getattr(cache, method)(*args)
+
+def submit(function, *args):
+    """
+    Schedules the coroutine function(*args) on the shared loop inside the current app
+    context and returns a concurrent.futures.Future for its result.
+    """
+    app = current_app._get_current_object()
+
+    async def in_app_context():
+        with app.app_context():
+            return await function(*args)
+
+    return asyncio.run_coroutine_threadsafe(in_app_context(), _get_loop())
+
+async def call(function, *args):
+    """Awaits function(*args) on the shared loop; for use in async views."""
+    return await asyncio.wrap_future(submit(function, *args))
+
+def run(function, *args):
+    """Runs function(*args) on the shared loop and blocks for the result; for use in sync code."""
+    return submit(function, *args).result()
+
+# --- Requests ---
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+def _retry_after(response):
+    """Seconds from a Retry-After header (delta-seconds or HTTP date), or None."""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+async def _get_with_retries(url, params):
+    """GET with the same 429/5xx retry policy as the sync session (backoff, capped Retry-After)."""
+    config = current_app.config
+    max_retries = config.get('TMDB_MAX_RETRIES', 3)
+    backoff = config.get('TMDB_RETRY_BACKOFF', 0.5)
+    max_wait = config.get('TMDB_RETRY_MAX_WAIT', 10)
+
+    for attempt in range(max_retries + 1):
+        response = await _get_client().get(url, params=params)
+        if response.status_code not in RETRY_STATUSES or attempt == max_retries:
+            return response
+        wait = _retry_after(response)
+        if wait is None:
+            wait = backoff * (2 ** attempt) if attempt else 0 # urllib3 style: no sleep before the first retry
+        await asyncio.sleep(min(wait, max_wait))
+    return response
+
+async def _make_tmdb_request(endpoint, params=None, refresh=False):
+    """Async version of api._make_tmdb_request: decoded JSON, or None on failure."""
+    cache = current_app.config.get('tmdb_cache')
+    ttl = _cache_ttl(endpoint) if cache is not None else 0
+    if ttl > 0:
+        cache_key = _cache_key(endpoint, params)
+        cached = await _cache_call(cache, 'get', cache_key) if not refresh else None
+        if cached is not None:
+            return cached
+
+    base_url = current_app.config['TMDB_API_BASE_URL']
+    api_key = current_app.config['TMDB_API_KEY']
+
+    if not api_key:
+        current_app.logger.error("TMDB_API_KEY is not set in config!")
+        return None
+
+    url = f"{base_url}/{endpoint}"
+    default_params = {'api_key': api_key}
+    if params:
+        default_params.update(params)
+
+    try:
+        async with _get_upstream_slots():
+            response = await _get_with_retries(url, default_params)
+        response.raise_for_status()
+        data = response.json()
+    except (httpx.HTTPError, ValueError) as e:
+        current_app.logger.error(f"TMDB API request failed for endpoint {endpoint}: {e}")
+        return None
+
+    # Only successful responses are cached
+    if ttl > 0 and data is not None:
+        await _cache_call(cache, 'set', cache_key, data, ttl)
+    return data
+
+async def get_top_rated_movies(page=1):
+    """Fetches a list of top-rated movies from TMDB."""
+    data = await _make_tmdb_request('movie/top_rated', {'page': page})
+    return data.get('results', []) if data else []
+
+async def get_movie_details(movie_id):
+    """Fetches details for a specific movie by its TMDB ID."""
+    data = await _make_tmdb_request(f'movie/{movie_id}')
+    return data if data else None
+
+async def get_movie_credits(movie_id):
+    """Fetches cast and crew for a specific movie by its TMDB ID."""
+    data = await _make_tmdb_request(f'movie/{movie_id}/credits')
+    return data if data else None
+
+async def get_movie_videos(movie_id):
+    """Fetches videos (including trailers) for a specific movie by its TMDB ID."""
+    data = await _make_tmdb_request(f'movie/{movie_id}/videos')
+    return data.get('results', []) if data else []
+
+async def get_movies_details(movie_ids):
+    """
+    Fetches details for many movies at once, all misses in flight together
+    (at most TMDB_ASYNC_MAX_CONNECTIONS upstream at a time, the rest wait their turn).
+
+    Returns:
+        dict: TMDB ID -> details dict, or None where the fetch failed.
+    """
+    movie_ids = list(dict.fromkeys(movie_ids)) # Dedupe, keep order
+    fetched = await asyncio.gather(*(get_movie_details(movie_id) for movie_id in movie_ids))
+    return dict(zip(movie_ids, fetched))
+
+async def get_movie_full_details(movie_id):
+    """
+    Fetches details, credits and videos for a movie in one round trip (append_to_response),
+    falling back to three concurrent calls only if the response lacks credits or videos.
+
+    Returns:
+        tuple: (details dict or None, credits dict or None, list of video dicts)
+    """
+    if current_app.config.get('TMDB_APPEND_TO_RESPONSE', True):
+        data = await _make_tmdb_request(f'movie/{movie_id}', FULL_DETAILS_PARAMS)
+        if data is None:
+            return None, None, [] # TMDB failed; three more calls would only add load to it
+        if 'credits' in data and 'videos' in data:
+            # Copy rather than pop: data may be the cached object itself
+            details = {key: value for key, value in data.items() if key not in ('credits', 'videos')}
+            videos = data['videos']
+            return details, data['credits'], videos.get('results', []) if videos else []
+
+    return tuple(await asyncio.gather(get_movie_details(movie_id),
+                                      get_movie_credits(movie_id),
+                                      get_movie_videos(movie_id)))
+
+async def get_upcoming_movies(page=1):
+    """Fetches a list of upcoming movies from TMDB."""
+    data = await _make_tmdb_request('movie/upcoming', {'page': page})
+    return data.get('results', []) if data else []
+
+async def search_movies(query, page=1):
+    """Searches for movies on TMDB based on a query."""
+    if not query:
+        return None
+
+    data = await _make_tmdb_request('search/movie', {'query': query, 'page': page})
+    return data if data else {'results': [], 'total_results': 0, 'total_pages': 0}
@@ -0,0 +1,161 @@
+# movie_webapp/cache.py
+# Small key/value caches with per-entry TTLs and size-bounded LRU eviction.
+# Values must be JSON-serializable (the SQLite backend stores them as JSON text).
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheStats:
+    """Hit/miss/eviction counters shared by the cache backends."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def as_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+class TTLCache:
+    """In-process LRU cache. Thread-safe; entries expire after their own TTL."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self._entries = OrderedDict() # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.stats.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """
+    On-disk LRU cache in a SQLite file, so entries survive restarts and are shared by
+    every worker pointing at the same path. Counters are per process.
+
+    Reads only write when an entry's access time is more than touch_interval seconds old,
+    and expired / over-limit entries are evicted every evict_interval writes rather than on
+    each one, so most requests never take the database's write lock. The LRU order is
+    therefore approximate, and the table may briefly hold a few entries over max_entries.
+    """
+
+    def __init__(self, path, max_entries=10000, touch_interval=60, evict_interval=32):
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self.evict_interval = evict_interval
+        self.stats = CacheStats()
+        self._local = threading.local()
+        self._writes = 0 # Per process; evictions run when it reaches a multiple of evict_interval
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS cache ('
+                         'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                         'expires_at REAL NOT NULL, accessed_at REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_cache_accessed_at ON cache (accessed_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_cache_expires_at ON cache (expires_at)')
+
+    def _connect(self):
+        # One connection per thread and process (connections must not cross a fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key, default=None):
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute('SELECT value, expires_at, accessed_at FROM cache WHERE key = ?', (key,)).fetchone()
+        if row is None or row[1] <= now:
+            self.stats.misses += 1
+            return default
+        if now - row[2] > self.touch_interval:
+            with conn:
+                conn.execute('UPDATE cache SET accessed_at = ? WHERE key = ?', (now, key))
+        self.stats.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)',
+                         (key, json.dumps(value), now + ttl, now))
+        self._writes += 1
+        if self._writes % self.evict_interval == 0:
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        """Drops expired rows, then the least recently used ones if the table is over max_entries."""
+        with conn:
+            conn.execute('DELETE FROM cache WHERE expires_at <= ?', (now,))
+            excess = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0] - self.max_entries
+            if excess > 0:
+                self.stats.evictions += conn.execute('DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                                                     'ORDER BY accessed_at LIMIT ?)', (excess,)).rowcount
+
+    def delete(self, key):
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def clear(self):
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM cache')
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+
+def make_cache(backend='memory', path=None, max_entries=1024):
+    """Creates a cache for the configured backend ('memory' or 'sqlite'); 'none' disables caching."""
+    if backend == 'sqlite':
+        return SQLiteCache(path, max_entries=max_entries)
+    if backend == 'memory':
+        return TTLCache(max_entries=max_entries)
+    return None
@@ -0,0 +1,303 @@
+# movie_webapp/catalog.py
+# The local movie catalog: the `movies` table as a cache of TMDB metadata.
+import atexit
+import csv
+import os
+import queue
+import threading
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from . import db
+from . import async_api
+from .models import Movie
+from .api import get_movies_details
+from .suggest import note_catalog_rows
+
+
+# Catalog columns written by upsert_movies (besides id)
+UPSERT_COLUMNS = ('title',) + Movie.TMDB_FIELDS + ('genres', 'last_refreshed')
+
+
+def _catalog_rows(movies_data):
+    """Turns TMDB movie payloads into uniform row dicts for an executemany upsert (deduped by ID)."""
+    rows = {}
+    for movie_data in movies_data:
+        if not movie_data or not movie_data.get('id'):
+            continue
+        row = dict.fromkeys(UPSERT_COLUMNS)
+        row.update(Movie.tmdb_values(movie_data))
+        row['id'] = movie_data['id']
+        rows[row['id']] = row
+    return list(rows.values())
+
+
+def _upsert_statement(columns):
+    """INSERT ... ON CONFLICT (id) DO UPDATE of columns; a NULL in the new row keeps the current value."""
+    table = Movie.__table__
+    statement = _dialect_insert(table)
+    return statement.on_conflict_do_update(
+        index_elements=['id'],
+        set_={column: func.coalesce(statement.excluded[column], table.c[column]) for column in columns},
+    )
+
+
+def _upsert_rows(rows):
+    """
+    Upserts all rows in one transaction. Columns a payload did not carry (NULL in the row)
+    keep their current value.
+
+    Title is NOT NULL, and even a row that conflicts must pass that check, so rows without
+    a title go through a second statement: they are inserted with Movie.PLACEHOLDER_TITLE
+    but never update the title of an existing row.
+    """
+    titled = [row for row in rows if row['title']]
+    untitled = [dict(row, title=Movie.PLACEHOLDER_TITLE) for row in rows if not row['title']]
+    with db.engine.begin() as conn:
+        if titled:
+            conn.execute(_upsert_statement(UPSERT_COLUMNS), titled)
+        if untitled:
+            conn.execute(_upsert_statement([column for column in UPSERT_COLUMNS if column != 'title']), untitled)
+    note_catalog_rows(titled)
+
+
+def upsert_movies(movies_data, defer=None):
+    """
+    Inserts or refreshes catalog rows for a list of TMDB movie payloads.
+
+    Replaces the per-row Movie.query.get() + add_all() loops: a single dialect-native
+    upsert statement covers the whole page. With defer=True (default: CATALOG_DEFERRED_WRITES)
+    the rows are handed to the background catalog writer and the response does not wait
+    on the commit; the catalog is a cache, so a dropped write only costs a later TMDB call.
+    """
+    rows = _catalog_rows(movies_data)
+    if not rows:
+        return
+    if defer is None:
+        defer = current_app.config.get('CATALOG_DEFERRED_WRITES', False)
+    if defer:
+        get_catalog_writer().submit(rows)
+        return
+    try:
+        _upsert_rows(rows)
+    except Exception as e:
+        current_app.logger.error(f"Error upserting {len(rows)} movies into the catalog: {e}")
+
+
+def _merge_rows(merged, rows):
+    """Adds rows to merged (ID -> row); for an ID already there, the newer row's non-NULL columns win."""
+    for row in rows:
+        current = merged.get(row['id'])
+        if current is None:
+            merged[row['id']] = dict(row)
+        else:
+            current.update((column, value) for column, value in row.items() if value is not None)
+    return merged
+
+
+class CatalogWriter:
+    """Background thread that applies deferred catalog upserts outside the request path."""
+
+    def __init__(self, app, max_pending=1000):
+        self.app = app
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.thread = threading.Thread(target=self._run, name='catalog-writer', daemon=True)
+        self.thread.start()
+
+    def submit(self, rows):
+        try:
+            self.queue.put_nowait(rows)
+        except queue.Full:
+            self.app.logger.warning(f"Catalog writer queue full, dropping {len(rows)} rows.")
+
+    def stop(self, timeout=5):
+        """Flushes pending writes and stops the thread."""
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+    def _run(self):
+        while True:
+            rows = self.queue.get()
+            if rows is None:
+                return
+            # Coalesce whatever else is already waiting into the same statement, one row per ID:
+            # PostgreSQL rejects an upsert that touches the same row twice
+            merged = _merge_rows({}, rows)
+            stop = False
+            while not stop:
+                try:
+                    more = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if more is None:
+                    stop = True
+                else:
+                    _merge_rows(merged, more)
+            rows = list(merged.values())
+            with self.app.app_context():
+                try:
+                    _upsert_rows(rows)
+                except Exception as e:
+                    self.app.logger.error(f"Catalog writer failed to upsert {len(rows)} movies: {e}")
+            if stop:
+                return
+
+
+_writer = None
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+
+def get_catalog_writer():
+    """Returns this process's catalog writer, starting it on first use (and again after a fork)."""
+    global _writer, _writer_pid
+    if _writer is None or _writer_pid != os.getpid():
+        with _writer_lock:
+            if _writer is None or _writer_pid != os.getpid():
+                _writer = CatalogWriter(current_app._get_current_object(),
+                                        max_pending=current_app.config.get('CATALOG_WRITER_MAX_PENDING', 1000))
+                _writer_pid = os.getpid()
+                atexit.register(_writer.stop)
+    return _writer
+
+
+def get_movies_metadata(tmdb_ids):
+    """
+    Returns display metadata (title, poster_path, ...) for many movies.
+
+    Rows in the local catalog refreshed within CATALOG_MAX_AGE are served from SQLite;
+    only stale or missing movies are fetched from TMDB (in one batch), and the fetched
+    details are written back to the catalog.
+
+    Returns:
+        dict: TMDB ID -> TMDB-shaped dict, or None where the movie could not be fetched.
+    """
+    results, stale_ids = _read_fresh_rows(tmdb_ids)
+    if stale_ids:
+        _store_fetched(results, stale_ids, get_movies_details(stale_ids))
+    return results
+
+
+async def get_movies_metadata_async(tmdb_ids):
+    """
+    get_movies_metadata for async views: with TMDB_ASYNC_CLIENT the stale movies are fetched
+    on the shared async TMDB client, while the catalog reads and writes stay on the calling thread.
+    """
+    results, stale_ids = _read_fresh_rows(tmdb_ids)
+    if stale_ids:
+        if current_app.config.get('TMDB_ASYNC_CLIENT', True):
+            fetched = await async_api.call(async_api.get_movies_details, stale_ids)
+        else:
+            fetched = get_movies_details(stale_ids)
+        _store_fetched(results, stale_ids, fetched)
+    return results
+
+
+def get_cataloged_movies_metadata(tmdb_ids):
+    """
+    get_movies_metadata without the TMDB fallback, for views that must not wait on upstream:
+    only movies with a catalog row refreshed within CATALOG_MAX_AGE are returned.
+    """
+    return _read_fresh_rows(tmdb_ids)[0]
+
+
+def _read_fresh_rows(tmdb_ids):
+    """Splits tmdb_ids into ({id: dict} served from fresh catalog rows, [stale or missing ids])."""
+    tmdb_ids = list(dict.fromkeys(tmdb_ids)) # Dedupe, keep order
+    if not tmdb_ids:
+        return {}, []
+
+    max_age = current_app.config.get('CATALOG_MAX_AGE', 7 * 24 * 60 * 60)
+    rows = {movie.id: movie for movie in Movie.query.filter(Movie.id.in_(tmdb_ids)).all()}
+
+    results = {}
+    stale_ids = []
+    for tmdb_id in tmdb_ids:
+        movie = rows.get(tmdb_id)
+        if movie is not None and movie.is_fresh(max_age):
+            results[tmdb_id] = movie.to_tmdb_dict()
+        else:
+            stale_ids.append(tmdb_id)
+    return results, stale_ids
+
+
+def _store_fetched(results, stale_ids, fetched):
+    """Adds the TMDB details fetched for stale_ids to results and writes them back to the catalog."""
+    results.update((tmdb_id, fetched.get(tmdb_id)) for tmdb_id in stale_ids)
+    upsert_movies(fetched.values())
+
+
+def _dialect_insert(table):
+    """INSERT construct for the current database that supports ON CONFLICT (SQLite / PostgreSQL)."""
+    if db.engine.dialect.name == 'postgresql':
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+
+def read_links_tmdb_ids(links_path):
+    """Reads every TMDB ID from a MovieLens links.csv (rows without a tmdbId are skipped)."""
+    tmdb_ids = []
+    with open(links_path, newline='') as f:
+        for row in csv.DictReader(f):
+            tmdb_id = (row.get('tmdbId') or '').strip()
+            if tmdb_id:
+                tmdb_ids.append(int(float(tmdb_id)))
+    return list(dict.fromkeys(tmdb_ids))
+
+
+def bulk_insert_catalog_ids(tmdb_ids, chunk_size=1000):
+    """
+    Inserts a placeholder row for every TMDB ID not yet in the catalog, in chunked
+    executemany batches inside one transaction. Existing rows are left untouched.
+    Placeholder rows have Movie.PLACEHOLDER_TITLE and no last_refreshed, so they count as stale
+    until enriched from TMDB.
+
+    Returns:
+        int: number of rows inserted.
+    """
+    statement = _dialect_insert(Movie.__table__).on_conflict_do_nothing(index_elements=['id'])
+    inserted = 0
+    with db.engine.begin() as conn:
+        for start in range(0, len(tmdb_ids), chunk_size):
+            chunk = tmdb_ids[start:start + chunk_size]
+            result = conn.execute(statement, [{'id': tmdb_id, 'title': Movie.PLACEHOLDER_TITLE} for tmdb_id in chunk])
+            inserted += max(result.rowcount, 0)
+    return inserted
+
+
+def enrich_catalog(chunk_size=100, limit=None, progress=None):
+    """
+    Fills catalog rows that have never been refreshed with TMDB details.
+
+    Works through the rows in ID order, a chunk at a time: each chunk is fetched
+    concurrently (TMDB_FETCH_WORKERS threads) and committed before the next, so an
+    interrupted run resumes where it stopped. IDs TMDB cannot resolve stay unrefreshed
+    and are retried by the next run.
+
+    Returns:
+        tuple: (refreshed, failed) row counts.
+    """
+    refreshed = failed = 0
+    last_id = 0
+    while limit is None or refreshed + failed < limit:
+        size = chunk_size if limit is None else min(chunk_size, limit - refreshed - failed)
+        movies = (Movie.query.filter(Movie.last_refreshed.is_(None), Movie.id > last_id)
+                  .order_by(Movie.id).limit(size).all())
+        if not movies:
+            break
+        last_id = movies[-1].id
+
+        fetched = get_movies_details([movie.id for movie in movies])
+        for movie in movies:
+            movie_data = fetched.get(movie.id)
+            if movie_data:
+                movie.update_from_tmdb(movie_data)
+                refreshed += 1
+            else:
+                failed += 1
+        db.session.commit()
+        note_catalog_rows([movie_data for movie_data in fetched.values() if movie_data])
+
+        if progress:
+            progress(refreshed, failed)
+    return refreshed, failed
@@ -0,0 +1,200 @@
+# movie_webapp/commands.py
+# Flask CLI commands, registered on the app in create_app.
+# Run them with e.g.:  flask --app run export-weights
+import time
+import click
+import torch
+from flask import current_app
+from flask.cli import with_appcontext
+
+from . import recommender
+from . import catalog
+from . import precompute
+from . import search_index
+from .fragments import invalidate_fragments
+
+
+@click.command('export-weights')
+@click.option('--output', default=None, help='Output file (defaults to MODEL_WEIGHTS_PATH).')
+@with_appcontext
+def export_weights_command(output):
+    """Exports model.pth to a flat, memory-mappable weights file."""
+    model_path = current_app.config.get('MODEL_PATH')
+    output = output or current_app.config.get('MODEL_WEIGHTS_PATH')
+
+    checkpoint = torch.load(model_path, map_location=torch.device('cpu'), weights_only=False)
+    model_state_dict = checkpoint.get('model_state_dict')
+    if model_state_dict is None:
+        raise click.ClickException(f"Expected key 'model_state_dict' not found in checkpoint file {model_path}")
+
+    manifest = recommender.export_mmap_weights(model_state_dict, output)
+    click.echo(f"Wrote {len(manifest)} tensors to {output} (manifest: {output}.json).")
+
+
+@click.command('ingest-catalog')
+@click.option('--links', 'links_path', default=None, help='MovieLens links.csv (defaults to ML_LINKS_PATH).')
+@click.option('--chunk-size', default=1000, show_default=True, help='Rows per executemany batch.')
+@click.option('--enrich/--no-enrich', default=False, show_default=True,
+              help='Fetch TMDB details for rows that have never been refreshed (resumable).')
+@click.option('--enrich-chunk-size', default=100, show_default=True, help='Rows fetched and committed per enrich step.')
+@click.option('--limit', default=None, type=int, help='Enrich at most this many rows.')
+@with_appcontext
+def ingest_catalog_command(links_path, chunk_size, enrich, enrich_chunk_size, limit):
+    """Bulk-loads every TMDB ID from links.csv into the movies table."""
+    links_path = links_path or current_app.config.get('ML_LINKS_PATH')
+
+    start = time.perf_counter()
+    tmdb_ids = catalog.read_links_tmdb_ids(links_path)
+    inserted = catalog.bulk_insert_catalog_ids(tmdb_ids, chunk_size=chunk_size)
+    click.echo(f"Read {len(tmdb_ids)} TMDB IDs from {links_path}, inserted {inserted} new rows "
+               f"in {time.perf_counter() - start:.2f} s.")
+
+    if enrich:
+        start = time.perf_counter()
+
+        def progress(refreshed, failed):
+            elapsed = time.perf_counter() - start
+            click.echo(f"  enriched {refreshed} rows ({failed} failed), {refreshed / elapsed:.1f} rows/s")
+
+        refreshed, failed = catalog.enrich_catalog(chunk_size=enrich_chunk_size, limit=limit, progress=progress)
+        click.echo(f"Enriched {refreshed} rows from TMDB ({failed} failed) in {time.perf_counter() - start:.2f} s.")
+
+
+@click.command('precompute-recommendations')
+@click.option('--top-k', default=50, show_default=True,
+              help='Items stored per user (keep above RECOMMENDER_TOP_N so later ratings can be filtered out).')
+@click.option('--batch-size', default=8, show_default=True,
+              help='Users scored per matrix operation (the [batch, items, hidden] activations should stay in cache).')
+@click.option('--chunk-size', default=1024, show_default=True, help='Users per work unit / write transaction.')
+@click.option('--workers', default=1, show_default=True, help='Scoring processes.')
+@with_appcontext
+def precompute_recommendations_command(top_k, batch_size, chunk_size, workers):
+    """Scores every mapped user offline and stores their top-K list."""
+    start = time.perf_counter()
+
+    def progress(users_done, rows_written):
+        elapsed = time.perf_counter() - start
+        click.echo(f"  {users_done} users, {rows_written} rows, {users_done / elapsed:.1f} users/s")
+
+    try:
+        users_done, rows_written = precompute.precompute_recommendations(
+            top_k=top_k, batch_size=batch_size, chunk_size=chunk_size, workers=workers, progress=progress)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    elapsed = time.perf_counter() - start
+    click.echo(f"Stored top-{top_k} lists for {users_done} users ({rows_written} rows) in {elapsed:.2f} s "
+               f"({users_done / elapsed:.1f} users/s, {workers} worker(s)).")
+
+
+@click.command('build-ann-index')
+@click.option('--output', default=None, help='Output file (defaults to ANN_INDEX_PATH).')
+@click.option('--clusters', default=None, type=int, help='Number of k-means clusters (defaults to 2 * sqrt(candidates)).')
+@click.option('--iterations', default=20, show_default=True, help='k-means iterations.')
+@with_appcontext
+def build_ann_index_command(output, clusters, iterations):
+    """Clusters the candidate items into the IVF index used by RECOMMENDER_ANN."""
+    output = output or current_app.config.get('ANN_INDEX_PATH')
+    scorer = (current_app.config.get('recommender_loaded_data') or {}).get('scorer')
+    if scorer is None:
+        raise click.ClickException("Recommender components are not loaded.")
+
+    start = time.perf_counter()
+    index = recommender.build_ann_index(scorer, num_clusters=clusters, iterations=iterations)
+    index.save(output)
+    click.echo(f"Clustered {scorer.num_items} candidates into {index.num_clusters} clusters in "
+               f"{time.perf_counter() - start:.2f} s; wrote {output} (manifest: {output}.json).")
+
+
+@click.command('check-precision')
+@click.option('--precision', type=click.Choice(recommender.PRECISIONS), default=None,
+              help='Precision to check against fp32 (defaults to RECOMMENDER_PRECISION).')
+@click.option('--users', default=500, show_default=True, help='Randomly sampled model users to compare.')
+@click.option('--k', default=20, show_default=True, help='Top-k list size compared.')
+@click.option('--min-overlap', default=0.9, show_default=True, help='Fail if the mean top-k overlap is below this.')
+@with_appcontext
+def check_precision_command(precision, users, k, min_overlap):
+    """Compares top-k lists at a reduced precision with fp32 over the served candidates."""
+    precision = precision or current_app.config.get('RECOMMENDER_PRECISION', 'fp32')
+    loaded_data = current_app.config.get('recommender_loaded_data') or {}
+    scorer, selection = loaded_data.get('scorer'), loaded_data.get('selection')
+    if scorer is None or selection is None:
+        raise click.ClickException("Recommender components are not loaded.")
+
+    reference_model = recommender.build_model(current_app, 'fp32')
+    model = recommender.build_model(current_app, precision)
+    reference = recommender.ItemTowerScorer(reference_model, scorer.item_model_ids)
+    candidate = recommender.ItemTowerScorer(model, scorer.item_model_ids)
+
+    generator = torch.Generator().manual_seed(0)
+    num_users = reference_model.user_embedding.num_embeddings
+    user_model_ids = torch.randperm(num_users, generator=generator)[:users]
+    overlaps = recommender.top_k_overlap(reference, candidate, user_model_ids, selection['servable_mask'], k=k)
+
+    timings = {}
+    timed_users = user_model_ids[:100].tolist()
+    for label, tested in (('fp32', reference), (precision, candidate)):
+        start = time.perf_counter()
+        for user_model_id in timed_users:
+            tested.score_user(user_model_id)
+        timings[label] = (time.perf_counter() - start) / len(timed_users) * 1000
+
+    click.echo(f"{precision} vs fp32 over {scorer.num_items} candidates, {len(overlaps)} users: top-{k} overlap "
+               f"mean {overlaps.mean():.3f}, min {overlaps.min():.3f}, identical sets {(overlaps == 1).mean():.0%}")
+    click.echo(f"  embedding tables {recommender.embedding_bytes(reference_model) / 2**20:.1f} MB -> "
+               f"{recommender.embedding_bytes(model) / 2**20:.1f} MB; scoring one user "
+               f"{timings['fp32']:.2f} ms -> {timings[precision]:.2f} ms")
+    if overlaps.mean() < min_overlap:
+        raise click.ClickException(f"Mean top-{k} overlap {overlaps.mean():.3f} is below {min_overlap}.")
+
+
+@click.command('export-scorer')
+@click.option('--format', 'formats', type=click.Choice(('torchscript', 'onnx')), multiple=True,
+              help='Graph format(s) to write (defaults to both).')
+@with_appcontext
+def export_scorer_command(formats):
+    """Exports the per-request scoring layers for RECOMMENDER_BACKEND = torchscript / onnx."""
+    formats = formats or ('torchscript', 'onnx')
+    scorer = (current_app.config.get('recommender_loaded_data') or {}).get('scorer')
+    if scorer is None:
+        raise click.ClickException("Recommender components are not loaded.")
+
+    paths = {'torchscript': current_app.config.get('SCORER_TORCHSCRIPT_PATH') if 'torchscript' in formats else None,
+             'onnx': current_app.config.get('SCORER_ONNX_PATH') if 'onnx' in formats else None}
+    recommender.export_scorer(scorer, torchscript_path=paths['torchscript'], onnx_path=paths['onnx'])
+    for name, path in paths.items():
+        if path:
+            click.echo(f"Wrote the {name} scorer to {path}.")
+
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    """Refills the local full-text search index from the movies catalog."""
+    if not current_app.config.get('search_index'):
+        raise click.ClickException("The local search index is disabled or unavailable (needs SQLite with FTS5).")
+    start = time.perf_counter()
+    count = search_index.rebuild_search_index()
+    click.echo(f"Indexed {count} catalog rows in {time.perf_counter() - start:.2f} s.")
+
+
+@click.command('clear-fragments')
+@click.argument('keys', nargs=-1)
+@with_appcontext
+def clear_fragments_command(keys):
+    """Drops the given rendered fragments (e.g. index:top_rated movies:page=1), or all of them."""
+    if current_app.config.get('FRAGMENT_CACHE_BACKEND') != 'sqlite':
+        raise click.ClickException("Fragments are only shared with the web workers by the 'sqlite' "
+                                   "FRAGMENT_CACHE_BACKEND; 'memory' fragments expire by TTL or on restart.")
+    invalidate_fragments(*keys)
+    click.echo(f"Cleared {', '.join(keys) if keys else 'all fragments'}.")
+
+
+def register_commands(app):
+    app.cli.add_command(export_weights_command)
+    app.cli.add_command(ingest_catalog_command)
+    app.cli.add_command(precompute_recommendations_command)
+    app.cli.add_command(build_ann_index_command)
+    app.cli.add_command(check_precision_command)
+    app.cli.add_command(export_scorer_command)
+    app.cli.add_command(rebuild_search_index_command)
+    app.cli.add_command(clear_fragments_command)
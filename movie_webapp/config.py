@@ -15,16 +15,142 @@ class Config:
     # Base URL for TMDB images (change size 'w500' as needed)
     TMDB_IMAGE_BASE_URL = 'https://image.tmdb.org/t/p/w500'
 
+    # --- TMDB HTTP Client ---
+    # One keep-alive requests.Session per worker process
+    TMDB_POOL_CONNECTIONS = 4 # Number of hosts to keep pools for
+    TMDB_POOL_SIZE = 10 # Max pooled connections per host (set >= concurrent TMDB calls per worker)
+    TMDB_CONNECT_TIMEOUT = 3.05 # Seconds
+    TMDB_READ_TIMEOUT = 10 # Seconds
+    TMDB_MAX_RETRIES = 3 # Retries on connection errors and 429/5xx responses
+    TMDB_RETRY_BACKOFF = 0.5 # Exponential backoff factor in seconds
+    TMDB_RETRY_MAX_WAIT = 10 # Upper bound in seconds for backoff and Retry-After waits
+    TMDB_FETCH_WORKERS = 8 # Threads per worker for concurrent TMDB calls
+    TMDB_APPEND_TO_RESPONSE = True # Fetch details + credits + videos in one call on movie_detail
+    # The async views (movie_detail, rated_movies, recommendations) fetch over one shared httpx.AsyncClient
+    # per worker; set TMDB_ASYNC_CLIENT=false to use the sync session and TMDB_FETCH_WORKERS pool instead
+    TMDB_ASYNC_CLIENT = (os.environ.get('TMDB_ASYNC_CLIENT') or 'true').lower() == 'true'
+    TMDB_ASYNC_MAX_CONNECTIONS = 32 # Max concurrent upstream connections of the async client
+
+    # --- TMDB Response Cache ---
+    # 'memory' (per worker), 'sqlite' (on disk, survives restarts, shared by workers) or 'none'
+    TMDB_CACHE_BACKEND = os.environ.get('TMDB_CACHE_BACKEND') or 'memory'
+    TMDB_CACHE_PATH = os.path.join(basedir, 'tmdb_cache.sqlite') # Used by the 'sqlite' backend
+    TMDB_CACHE_MAX_ENTRIES = 5000 # LRU eviction beyond this many responses
+    # TTL in seconds per endpoint pattern (fnmatch, first match wins; 0 disables caching)
+    TMDB_CACHE_TTLS = {
+        'movie/upcoming': 30 * 60,
+        'movie/top_rated': 6 * 60 * 60,
+        'search/movie': 60 * 60,
+        'movie/*/credits': 7 * 24 * 60 * 60,
+        'movie/*/videos': 24 * 60 * 60,
+        'movie/*': 24 * 60 * 60, # Details
+    }
+
+    # --- Rendered Fragment Cache ---
+    # Dashboard rows and top-rated / upcoming grids are the same for every user; cache their HTML
+    FRAGMENT_CACHE_BACKEND = os.environ.get('FRAGMENT_CACHE_BACKEND') or 'memory' # 'memory', 'sqlite' or 'none'
+    FRAGMENT_CACHE_PATH = os.path.join(basedir, 'fragment_cache.sqlite') # Used by the 'sqlite' backend
+    FRAGMENT_CACHE_MAX_ENTRIES = 256
+    # TTL in seconds per fragment key pattern (fnmatch, first match wins; 0 disables caching)
+    FRAGMENT_CACHE_TTLS = {
+        'index:upcoming': 10 * 60,
+        'index:*': 60 * 60,
+        'upcoming_movies:*': 10 * 60,
+        'movies:*': 60 * 60,
+    }
+
+    # --- Background Prefetch ---
+    # Keeps the listings below (first PREFETCH_PAGES pages, their fragments and the details of
+    # their movies) refreshed before the cached copies expire. Opt-in: set PREFETCH_ENABLED=true
+    # only in the environment of the serving process, never for CLI jobs or benchmarks, since
+    # every create_app() with it on starts a thread that calls TMDB. Only one process per
+    # instance folder runs it (the first to take instance/prefetch.lock), so the rate limit
+    # below holds for all gunicorn workers together rather than for each of them. That process
+    # warms only caches the others can read, so it requires TMDB_CACHE_BACKEND=sqlite and
+    # FRAGMENT_CACHE_BACKEND=sqlite; with either left at 'memory' it logs an error and does not start.
+    PREFETCH_ENABLED = (os.environ.get('PREFETCH_ENABLED') or 'false').lower() == 'true'
+    PREFETCH_LISTINGS = ('movie/top_rated', 'movie/upcoming')
+    PREFETCH_PAGES = 3
+    PREFETCH_REFRESH_FRACTION = 0.8 # Refresh after this fraction of the shortest TTL involved
+    PREFETCH_RATE_LIMIT = 4 # Max upstream TMDB requests per second from the prefetcher
+
+    # --- Recommendation Result Cache ---
+    # Each user's ranked list, reused until their ratings change. 'memory' (per worker, LRU),
+    # 'sqlite' (shared by every worker on the host) or 'none'
+    RECOMMENDATION_CACHE_BACKEND = os.environ.get('RECOMMENDATION_CACHE_BACKEND') or 'memory'
+    RECOMMENDATION_CACHE_PATH = os.path.join(basedir, 'recommendation_cache.sqlite') # Used by the 'sqlite' backend
+    RECOMMENDATION_CACHE_MAX_ENTRIES = 1000 # Users kept before LRU eviction
+    RECOMMENDATION_CACHE_TTL = 24 * 60 * 60 # Seconds; also bounds how long a list outlives a model update
+    # Serve lists written by `flask precompute-recommendations` (user_recommendations table) before scoring live
+    RECOMMENDER_USE_PRECOMPUTED = True
+
+    # --- Local Movie Catalog ---
+    # Rows in the movies table refreshed within this many seconds are rendered without calling TMDB
+    CATALOG_MAX_AGE = 7 * 24 * 60 * 60
+    # Hand catalog upserts from page views to a background writer thread instead of committing in the request
+    CATALOG_DEFERRED_WRITES = False
+    CATALOG_WRITER_MAX_PENDING = 1000 # Queued upsert batches before new ones are dropped
+
+    # --- Local Search Index ---
+    # /search answers from a SQLite FTS5 index over the catalog first, and only asks
+    # TMDB when the catalog has fewer than SEARCH_LOCAL_MIN_RESULTS matches
+    SEARCH_LOCAL_INDEX = True
+    SEARCH_LOCAL_MIN_RESULTS = 5
+    # /api/suggest typeahead: in-memory title prefix index built from the catalog at startup
+    SUGGEST_ENABLED = True
+    SUGGEST_LIMIT = 10 # Suggestions per request (?limit= can lower it)
+    SUGGEST_MERGE_THRESHOLD = 2000 # Keys added since the build before they are merged into the main arrays
+
     # --- Recommender Model Configuration ---
     # **VERIFY THESE PATHS**
     MODEL_PATH = os.path.join(basedir, 'model.pth')
+    # Flat weights file (+ .json manifest) written by `flask export-weights`; when present it is
+    # memory-mapped read-only instead of torch.load-ing MODEL_PATH, so workers share one copy
+    MODEL_WEIGHTS_PATH = os.path.join(basedir, 'model_weights.bin')
     USER_MAP_PATH = os.path.join(basedir, 'user_map.pkl')
     ITEM_MAP_PATH = os.path.join(basedir, 'item_map.pkl') # This should map ML_ID <-> Model Index
     ML_LINKS_PATH = os.path.join(basedir, 'links.csv') # Path to MovieLens links.csv (ML_ID <-> TMDB_ID)
+    ID_MAPS_PATH = os.path.join(basedir, 'id_maps.npz') # Array-backed ID maps built by create_mappings.py (preferred over the .pkl maps)
 
     # **VERIFY THESE PARAMETERS**
     RECOMMENDER_NUM_USERS = 6041
     RECOMMENDER_NUM_ITEMS = 193610
     RECOMMENDER_EMBEDDING_SIZE = 32
     RECOMMENDER_LAYER_DIMS = [64, 32, 16]
-    RECOMMENDER_TOP_N = 20 # Number of recommendations to show
\ No newline at end of file
+    RECOMMENDER_TOP_N = 20 # Number of recommendations to show
+    # Candidate set scored per request: servable items only (mapped to TMDB), optionally
+    # restricted to a minimum catalog popularity and capped at the N most popular (None = off)
+    RECOMMENDER_MIN_POPULARITY = None
+    RECOMMENDER_MAX_CANDIDATES = None
+    # Two-stage retrieval: an IVF index (built offline with `flask build-ann-index`, mapped at
+    # load) picks at least RECOMMENDER_ANN_CANDIDATES items, which the MLP then re-ranks.
+    # Worth it once the candidate set runs to tens of thousands of items
+    RECOMMENDER_ANN = False
+    RECOMMENDER_ANN_CANDIDATES = 300
+    ANN_INDEX_PATH = os.path.join(basedir, 'ann_index.bin')
+    # "More like this" on movie_detail: cosine similarity over normalised item embeddings.
+    # Lists for the N most popular candidates can be precomputed at load (0 = always live)
+    RECOMMENDER_SIMILAR_K = 10
+    RECOMMENDER_SIMILAR_PRECOMPUTE = 0
+    RECOMMENDER_SIMILAR_PRECOMPUTE_K = 50
+    # Users missing from the user map (signed up after training) get an embedding fitted to their ratings
+    RECOMMENDER_FOLD_IN = True
+    RECOMMENDER_FOLD_IN_STEPS = 10 # Adam steps on the user embedding (~0.25 ms each on one core)
+    # Precision of the loaded model: 'fp32'; 'fp16' or 'bf16' (embedding tables at half
+    # precision); 'int8' (per-row int8 embedding tables); 'int8-dynamic' ('int8' plus int8
+    # dynamic quantization of the Linear layers). Check agreement with fp32 before switching:
+    # flask check-precision --precision int8
+    RECOMMENDER_PRECISION = os.environ.get('RECOMMENDER_PRECISION') or 'fp32'
+    # Scoring backend for the per-request MLP layers: 'torch' (eager), 'torchscript' or 'onnx'
+    # (onnxruntime, optional dependency). Graphs are written by `flask export-scorer`; the app
+    # falls back to torch if one is missing or no longer matches the model
+    RECOMMENDER_BACKEND = os.environ.get('RECOMMENDER_BACKEND') or 'torch'
+    SCORER_TORCHSCRIPT_PATH = os.path.join(basedir, 'scorer.pt')
+    SCORER_ONNX_PATH = os.path.join(basedir, 'scorer.onnx')
+    # Micro-batching: concurrent requests that score every candidate (no ANN index) are queued
+    # and scored together, up to RECOMMENDER_MAX_BATCH users gathered within
+    # RECOMMENDER_BATCH_WINDOW_MS of the first. Only pays off when a worker serves requests
+    # concurrently (threaded workers); a lone request waits out the window
+    RECOMMENDER_BATCHING = (os.environ.get('RECOMMENDER_BATCHING') or 'false').lower() == 'true'
+    RECOMMENDER_BATCH_WINDOW_MS = 2
+    RECOMMENDER_MAX_BATCH = 8
\ No newline at end of file
@@ -0,0 +1,68 @@
+# movie_webapp/fragments.py
+# Shared cache for the user-independent parts of pages: the dashboard preview rows and the
+# top-rated / upcoming grids. Entries hold rendered HTML plus whatever the page needs
+# alongside it (e.g. has_next), keyed by endpoint and page.
+from fnmatch import fnmatch
+from flask import current_app
+from markupsafe import Markup
+from .cache import make_cache
+
+
+def init_fragment_cache(app):
+    """Creates the fragment cache configured by FRAGMENT_CACHE_* and stores it in app.config."""
+    app.config['fragment_cache'] = make_cache(app.config.get('FRAGMENT_CACHE_BACKEND', 'memory'),
+                                              path=app.config.get('FRAGMENT_CACHE_PATH'),
+                                              max_entries=app.config.get('FRAGMENT_CACHE_MAX_ENTRIES', 256))
+
+
+def _fragment_ttl(key):
+    for pattern, ttl in current_app.config.get('FRAGMENT_CACHE_TTLS', {}).items():
+        if fnmatch(key, pattern):
+            return ttl
+    return 0
+
+
+def cached_fragment(key, build):
+    """
+    Returns the cached entry for key, or calls build() and caches its result.
+    build() returns a dict with an 'html' string (or None for nothing to cache, e.g. on
+    an upstream error). The returned 'html' is wrapped in Markup, ready for the template.
+    """
+    cache = current_app.config.get('fragment_cache')
+    ttl = _fragment_ttl(key) if cache is not None else 0
+
+    entry = cache.get(key) if ttl > 0 else None
+    if entry is None:
+        entry = build()
+        if entry is None:
+            return None
+        if ttl > 0:
+            cache.set(key, entry, ttl)
+    return dict(entry, html=Markup(entry['html']))
+
+
+def refresh_fragment(key, build):
+    """
+    Rebuilds and re-caches a fragment regardless of what is cached (used by the prefetcher
+    to replace entries before they expire). Returns False if build() produced nothing.
+    """
+    cache = current_app.config.get('fragment_cache')
+    ttl = _fragment_ttl(key) if cache is not None else 0
+    if ttl <= 0:
+        return False
+    entry = build()
+    if entry is None:
+        return False
+    cache.set(key, entry, ttl)
+    return True
+
+
+def invalidate_fragments(*keys):
+    """Drops the given fragment keys, or every fragment when called without keys."""
+    cache = current_app.config.get('fragment_cache')
+    if cache is None:
+        return
+    if not keys:
+        cache.clear()
+    for key in keys:
+        cache.delete(key)
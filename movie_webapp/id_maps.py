@@ -0,0 +1,85 @@
+# movie_webapp/id_maps.py
+# Depends on numpy only: create_mappings.py loads this file directly, without the package.
+import numpy as np
+
+
+class IdMaps:
+    """
+    Compact ID translation tables backed by contiguous numpy arrays.
+
+    Replaces the pickled dicts (user_map.pkl and the four maps in item_map.pkl):
+      - item_model_to_tmdb[i]: TMDB ID of model item i (-1 if unmapped)
+      - user_ids / item_tmdb_ids: sorted key arrays, looked up with np.searchsorted,
+        with the matching model indices in user_model_ids / tmdb_model_ids
+    """
+
+    # Files written by older versions also hold item_model_to_ml, which load() ignores
+    ARRAY_NAMES = ('user_ids', 'user_model_ids', 'item_model_to_tmdb', 'tmdb_ids', 'tmdb_model_ids')
+
+    def __init__(self, user_ids, user_model_ids, item_model_to_tmdb, tmdb_ids, tmdb_model_ids):
+        self.user_ids = user_ids
+        self.user_model_ids = user_model_ids
+        self.item_model_to_tmdb = item_model_to_tmdb
+        self.tmdb_ids = tmdb_ids
+        self.tmdb_model_ids = tmdb_model_ids
+
+    # --- Construction / persistence ---
+    @classmethod
+    def from_dicts(cls, user_map, ml_to_model, ml_to_tmdb, tmdb_to_ml):
+        """Builds the arrays from the dict mappings produced by create_mappings.py."""
+        user_ids, user_model_ids = _sorted_pairs(user_map.items())
+
+        num_items = max(ml_to_model.values()) + 1 if ml_to_model else 0
+        item_model_to_tmdb = np.full(num_items, -1, dtype=np.int64)
+        for ml_id, model_id in ml_to_model.items():
+            tmdb_id = ml_to_tmdb.get(ml_id)
+            if tmdb_id is not None:
+                item_model_to_tmdb[model_id] = tmdb_id
+
+        # TMDB ID -> ML ID -> model index, keeping only TMDB IDs the model knows
+        tmdb_pairs = [(tmdb_id, ml_to_model[ml_id]) for tmdb_id, ml_id in tmdb_to_ml.items() if ml_id in ml_to_model]
+        tmdb_ids, tmdb_model_ids = _sorted_pairs(tmdb_pairs)
+
+        return cls(user_ids, user_model_ids, item_model_to_tmdb, tmdb_ids, tmdb_model_ids)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(*(data[name] for name in cls.ARRAY_NAMES))
+
+    def save(self, path):
+        # Uncompressed so loading is a straight read of the arrays
+        np.savez(path, **{name: getattr(self, name) for name in self.ARRAY_NAMES})
+
+    # --- Lookups ---
+    @property
+    def num_users(self):
+        return len(self.user_ids)
+
+    @property
+    def num_items(self):
+        return len(self.item_model_to_tmdb)
+
+    def user_model_id(self, user_db_id):
+        """Flask DB user ID -> model user index, or None if the user is not in the map."""
+        position = np.searchsorted(self.user_ids, user_db_id)
+        if position < len(self.user_ids) and self.user_ids[position] == user_db_id:
+            return int(self.user_model_ids[position])
+        return None
+
+    def tmdb_to_model_ids(self, tmdb_ids):
+        """Vectorized TMDB ID -> model item index. Unknown TMDB IDs map to -1."""
+        tmdb_ids = np.asarray(tmdb_ids, dtype=np.int64)
+        if len(self.tmdb_ids) == 0:
+            return np.full(tmdb_ids.shape, -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.tmdb_ids, tmdb_ids), len(self.tmdb_ids) - 1)
+        found = self.tmdb_ids[positions] == tmdb_ids
+        return np.where(found, self.tmdb_model_ids[positions], -1)
+
+
+def _sorted_pairs(pairs):
+    """Splits (key, value) pairs into two int64 arrays sorted by key."""
+    pairs = sorted((int(key), int(value)) for key, value in pairs)
+    keys = np.array([key for key, _ in pairs], dtype=np.int64)
+    values = np.array([value for _, value in pairs], dtype=np.int64)
+    return keys, values
@@ -3,7 +3,8 @@
 from . import db # Import db from the initialized instance in __init__.py
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from datetime import datetime, timedelta
+from sqlalchemy import inspect, text
 
 # The load_user function and @login_manager.user_loader decorator have been moved to __init__.py
 
@@ -30,11 +31,71 @@ class Movie(db.Model):
     __tablename__ = 'movies'
     id = db.Column(db.Integer, primary_key=True) # This TMDB ID is crucial for matching
     title = db.Column(db.String(255), nullable=False)
+    original_title = db.Column(db.String(255)) # Title in the original language (indexed for search)
     genre = db.Column(db.String(255)) # Example
-    # Add other info if needed
+    # Local catalog fields, copied from TMDB whenever a movie is seen (see update_from_tmdb)
+    poster_path = db.Column(db.String(255))
+    release_date = db.Column(db.String(10)) # 'YYYY-MM-DD' as returned by TMDB
+    vote_average = db.Column(db.Float)
+    popularity = db.Column(db.Float, index=True)
+    genres = db.Column(db.String(255)) # Comma-separated genre names (only present in TMDB details)
+    last_refreshed = db.Column(db.DateTime) # When the fields above were last copied from TMDB
 
     interactions = db.relationship('Rating', backref='movie', lazy=True)
 
+    # Stored title of rows whose TMDB title is unknown (ingest placeholders, partial payloads);
+    # title is NOT NULL. Pages show DISPLAY_PLACEHOLDER_TITLE instead, search and typeahead skip them.
+    PLACEHOLDER_TITLE = ''
+    DISPLAY_PLACEHOLDER_TITLE = 'Unknown Title'
+
+    # TMDB payload keys copied as-is
+    TMDB_FIELDS = ('original_title', 'poster_path', 'release_date', 'vote_average', 'popularity')
+
+    @classmethod
+    def tmdb_values(cls, movie_data):
+        """Column values carried by a TMDB movie payload (details or list result), plus last_refreshed."""
+        values = {field: movie_data[field] for field in cls.TMDB_FIELDS if field in movie_data}
+        if movie_data.get('title'):
+            values['title'] = movie_data['title']
+        # List results only carry genre_ids, so genres are only set from details
+        if movie_data.get('genres'):
+            values['genres'] = ', '.join(genre['name'] for genre in movie_data['genres'] if genre.get('name'))[:255]
+        values['last_refreshed'] = datetime.utcnow()
+        return values
+
+    @classmethod
+    def from_tmdb(cls, movie_data):
+        """Creates a Movie from a TMDB movie payload (details or list result)."""
+        movie = cls(id=movie_data['id'], title=movie_data.get('title') or cls.PLACEHOLDER_TITLE)
+        movie.update_from_tmdb(movie_data)
+        return movie
+
+    def update_from_tmdb(self, movie_data):
+        """Copies the catalog fields present in a TMDB movie payload and marks the row as refreshed."""
+        for field, value in self.tmdb_values(movie_data).items():
+            setattr(self, field, value)
+
+    def is_fresh(self, max_age):
+        """True if the catalog fields were refreshed within max_age (a timedelta or seconds)."""
+        if self.last_refreshed is None:
+            return False
+        if not isinstance(max_age, timedelta):
+            max_age = timedelta(seconds=max_age)
+        return datetime.utcnow() - self.last_refreshed <= max_age
+
+    def to_tmdb_dict(self):
+        """Returns the row in the shape of a TMDB details payload, so pages can render it directly."""
+        return {
+            'id': self.id,
+            'title': self.title or self.DISPLAY_PLACEHOLDER_TITLE,
+            'original_title': self.original_title,
+            'poster_path': self.poster_path,
+            'release_date': self.release_date,
+            'vote_average': self.vote_average,
+            'popularity': self.popularity,
+            'genres': [{'name': name} for name in self.genres.split(', ')] if self.genres else [],
+        }
+
     def __repr__(self):
         return f'<Movie {self.title} (ID: {self.id})>'
 
@@ -49,4 +110,41 @@ class Rating(db.Model):
     __table_args__ = (db.UniqueConstraint('user_id', 'movie_id', name='_user_movie_uc'),)
 
     def __repr__(self):
-        return f'<Rating User {self.user_id} Movie {self.movie_id} Value {self.rating} Time {self.timestamp}>'
\ No newline at end of file
+        return f'<Rating User {self.user_id} Movie {self.movie_id} Value {self.rating} Time {self.timestamp}>'
+
+
+class UserRecommendation(db.Model):
+    """Offline top-K list for one user, written by `flask precompute-recommendations` (one row per rank)."""
+    __tablename__ = 'user_recommendations'
+    # No foreign keys: user_map covers users that may not have signed up yet, and the
+    # recommended movies need not be in the local catalog
+    user_id = db.Column(db.Integer, primary_key=True) # Flask DB user ID (user_map key)
+    rank = db.Column(db.Integer, primary_key=True) # 0 = best
+    movie_id = db.Column(db.Integer, nullable=False) # TMDB ID
+    score = db.Column(db.Float, nullable=False)
+    generated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<UserRecommendation User {self.user_id} Rank {self.rank} Movie {self.movie_id} Score {self.score}>'
+
+def add_missing_columns():
+    """
+    Adds columns that exist on the models but not yet in the database.
+
+    db.create_all() only creates missing tables, so databases created before a column
+    was added (e.g. the Movie catalog fields) are upgraded here. Only nullable columns
+    without server defaults are supported, which is all this needs.
+    """
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                with db.engine.begin() as conn:
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                    for index in table.indexes:
+                        if [c.name for c in index.columns] == [column.name]:
+                            index.create(conn, checkfirst=True)
@@ -0,0 +1,126 @@
+# movie_webapp/precompute.py
+# Offline batch scoring: the top-K list of every user in the user map, written to the
+# user_recommendations table so /recommendations can serve it without running the model.
+# Run it with:  flask --app run precompute-recommendations
+import multiprocessing
+from collections import defaultdict
+from datetime import datetime
+import numpy as np
+import torch
+from flask import current_app
+from . import db
+from .models import Rating, UserRecommendation
+from .recommender import select_top_k_batch
+
+# Set in the parent before the worker pool forks, so children inherit the model and
+# ratings instead of having them pickled to each one
+_job = None
+
+
+def _score_chunk(user_positions):
+    """
+    Scores one chunk of users (positions into id_maps.user_ids) in batches.
+    Returns (user DB IDs [C], TMDB IDs [C, K], scores [C, K]); padding has score -inf.
+    """
+    scorer, selection, id_maps = _job['scorer'], _job['selection'], _job['id_maps']
+    user_db_ids = id_maps.user_ids[user_positions]
+    user_model_ids = id_maps.user_model_ids[user_positions]
+    batch_size = _job['batch_size']
+
+    tmdb_batches, score_batches = [], []
+    for start in range(0, len(user_positions), batch_size):
+        batch_users = user_db_ids[start:start + batch_size]
+        excluded = [_job['rated_positions'].get(int(user_db_id), ()) for user_db_id in batch_users]
+        scores = scorer.score_users(user_model_ids[start:start + batch_size])
+        top_positions, top_scores = select_top_k_batch(scores, selection['servable_mask'], excluded, _job['top_k'])
+        tmdb_batches.append(selection['item_tmdb_ids'][top_positions].numpy())
+        score_batches.append(top_scores.numpy())
+    return user_db_ids, np.concatenate(tmdb_batches), np.concatenate(score_batches)
+
+
+def _init_worker():
+    # One intra-op thread per process; the processes are the parallelism
+    torch.set_num_threads(1)
+
+
+def _rated_positions(id_maps, selection):
+    """User DB ID -> candidate positions of the movies they have rated (to exclude from their list)."""
+    rated = defaultdict(list)
+    for user_id, movie_id in db.session.query(Rating.user_id, Rating.movie_id):
+        rated[user_id].append(movie_id)
+    positions = {}
+    for user_id, movie_ids in rated.items():
+        model_ids = id_maps.tmdb_to_model_ids(movie_ids)
+        user_positions = selection['model_to_position'][model_ids[model_ids >= 0]]
+        positions[user_id] = user_positions[user_positions >= 0]
+    return positions
+
+
+def _write_chunk(user_db_ids, tmdb_ids, scores, generated_at):
+    """Replaces the stored lists of one chunk of users in a single transaction."""
+    # .tolist() once instead of converting numpy scalars row by row
+    rows = [{'user_id': user_db_id, 'rank': rank, 'movie_id': tmdb_id, 'score': score, 'generated_at': generated_at}
+            for user_db_id, user_tmdb_ids, user_scores in zip(user_db_ids.tolist(), tmdb_ids.tolist(), scores.tolist())
+            for rank, (tmdb_id, score) in enumerate(zip(user_tmdb_ids, user_scores)) if score != float('-inf')]
+    db.session.execute(db.delete(UserRecommendation).where(UserRecommendation.user_id.in_(user_db_ids.tolist())))
+    if rows:
+        db.session.execute(UserRecommendation.__table__.insert(), rows) # Core executemany, no ORM bookkeeping
+    db.session.commit()
+    return len(rows)
+
+
+def precompute_recommendations(top_k=50, batch_size=8, chunk_size=1024, workers=1, progress=None):
+    """
+    Scores every user in the user map and stores their top_k (TMDB ID, score) pairs.
+
+    Users are split into chunks of chunk_size; with workers > 1 the chunks are scored in
+    forked processes, and the parent writes each finished chunk. Every user's already
+    rated movies are excluded, as in get_recommendations_for_user. progress(users_done,
+    rows_written) is called after each chunk.
+
+    Returns:
+        tuple: (users scored, rows written)
+    """
+    global _job
+    loaded_data = current_app.config.get('recommender_loaded_data') or {}
+    scorer, selection, id_maps = loaded_data.get('scorer'), loaded_data.get('selection'), loaded_data.get('id_maps')
+    if scorer is None or selection is None or id_maps is None:
+        raise RuntimeError("Recommender components are not loaded.")
+
+    _job = {
+        'scorer': scorer,
+        'selection': selection,
+        'id_maps': id_maps,
+        'rated_positions': _rated_positions(id_maps, selection),
+        'top_k': top_k,
+        'batch_size': batch_size,
+    }
+    chunks = [np.arange(start, min(start + chunk_size, id_maps.num_users))
+              for start in range(0, id_maps.num_users, chunk_size)]
+    generated_at = datetime.utcnow()
+    users_done = rows_written = 0
+    pool = None
+
+    try:
+        if workers > 1:
+            # Fork so the children share the loaded (possibly mmap-backed) weights
+            pool = multiprocessing.get_context('fork').Pool(workers, initializer=_init_worker)
+            results = pool.imap_unordered(_score_chunk, chunks)
+        else:
+            results = map(_score_chunk, chunks)
+
+        for user_db_ids, tmdb_ids, scores in results:
+            rows_written += _write_chunk(user_db_ids, tmdb_ids, scores, generated_at)
+            users_done += len(user_db_ids)
+            if progress:
+                progress(users_done, rows_written)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        _job = None
+
+    # Lists left over from users no longer in the map
+    db.session.execute(db.delete(UserRecommendation).where(UserRecommendation.generated_at < generated_at))
+    db.session.commit()
+    return users_done, rows_written
@@ -0,0 +1,184 @@
+# movie_webapp/prefetch.py
+# Background refresher that keeps the popular TMDB listings (and the movies on them) warm
+# in the response, fragment and catalog caches, so page views never pay for a cold fetch.
+import atexit
+import os
+import threading
+import time
+from .api import FULL_DETAILS_PARAMS, _cache_ttl, _make_tmdb_request
+from .catalog import upsert_movies
+from .fragments import _fragment_ttl, refresh_fragment
+
+
+class Prefetcher:
+    """
+    Daemon thread that re-fetches the first PREFETCH_PAGES pages of each listing in
+    PREFETCH_LISTINGS, plus the details (with credits and videos) of the movies on them,
+    shortly before their cache entries expire, then re-renders the matching page fragments.
+
+    Each job's period is the shortest TTL of the caches it feeds, scaled by
+    PREFETCH_REFRESH_FRACTION. Upstream calls are spaced at most PREFETCH_RATE_LIMIT
+    per second to stay well inside the TMDB quota; init_prefetcher runs a single
+    Prefetcher per instance folder so that limit is not multiplied by the worker count.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.listings = tuple(app.config.get('PREFETCH_LISTINGS', ()))
+        self.pages = app.config.get('PREFETCH_PAGES', 3)
+        self.refresh_fraction = app.config.get('PREFETCH_REFRESH_FRACTION', 0.8)
+        self.min_interval = 1.0 / app.config.get('PREFETCH_RATE_LIMIT', 4)
+        self.upstream_calls = 0
+        self._next_call = 0.0
+        self._next_due = {} # (listing, page) -> monotonic time of the next refresh
+        self._details_due = {} # TMDB ID -> monotonic time its details are due again
+        self._stop = threading.Event()
+        self.lock_file = None # Held while running so no other process prefetches too
+        self.thread = threading.Thread(target=self._run, name='tmdb-prefetch', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        """Stops the thread; an in-flight TMDB call is allowed to finish."""
+        self._stop.set()
+        if self.thread.is_alive():
+            self.thread.join(timeout)
+        if self.lock_file is not None:
+            self.lock_file.close()
+            self.lock_file = None
+
+    # --- Scheduling ---
+    def _period(self, *ttls):
+        """Refresh period for entries with these TTLs (0 = not cached), or None if nothing is cached."""
+        ttls = [ttl for ttl in ttls if ttl > 0]
+        return min(ttls) * self.refresh_fraction if ttls else None
+
+    def _run(self):
+        from .routes import grid_fragment, preview_fragment
+
+        with self.app.app_context():
+            for listing in self.listings:
+                for page in range(1, self.pages + 1):
+                    self._next_due[(listing, page)] = 0.0 # Warm everything right away
+
+        while not self._stop.is_set():
+            now = time.monotonic()
+            for (listing, page), due in sorted(self._next_due.items(), key=lambda item: item[1]):
+                if due > now or self._stop.is_set():
+                    continue
+                fragments = [grid_fragment(listing, page)]
+                if page == 1:
+                    fragments.append(preview_fragment(listing))
+                # Render inside a request context so the templates' url_for() works
+                with self.app.test_request_context('/'):
+                    period = self._period(_cache_ttl(listing), *(_fragment_ttl(key) for key, _ in fragments))
+                    try:
+                        self._refresh_listing(listing, page, fragments)
+                    except Exception as e:
+                        self.app.logger.error(f"Prefetch of {listing} page {page} failed: {e}")
+                if period is None:
+                    del self._next_due[(listing, page)] # Caching is off for this job, nothing to keep warm
+                else:
+                    self._next_due[(listing, page)] = time.monotonic() + period
+
+            if not self._next_due:
+                return
+            self._stop.wait(max(min(self._next_due.values()) - time.monotonic(), 1.0))
+
+    # --- Refresh ---
+    def _throttle(self):
+        """Waits for the next upstream slot. Returns False if the prefetcher is stopping."""
+        wait = self._next_call - time.monotonic()
+        if wait > 0 and self._stop.wait(wait):
+            return False
+        self._next_call = time.monotonic() + self.min_interval
+        self.upstream_calls += 1
+        return not self._stop.is_set()
+
+    def _refresh_listing(self, listing, page, fragments):
+        if not self._throttle():
+            return
+        data = _make_tmdb_request(listing, {'page': page}, refresh=True)
+        if not data:
+            return # Keep serving whatever is cached; try again next period
+
+        # Details of the movies on the page, each at most once per details TTL. Fetched the
+        # way get_movie_full_details does, so the detail page is served from this entry.
+        params = FULL_DETAILS_PARAMS if self.app.config.get('TMDB_APPEND_TO_RESPONSE', True) else None
+        now = time.monotonic()
+        details = []
+        for movie in data.get('results', []):
+            movie_id = movie.get('id')
+            if not movie_id or self._details_due.get(movie_id, 0.0) > now:
+                continue
+            if not self._throttle():
+                return
+            movie_data = _make_tmdb_request(f'movie/{movie_id}', params, refresh=True)
+            if movie_data:
+                details.append(movie_data)
+                period = self._period(_cache_ttl(f'movie/{movie_id}'))
+                if period is not None:
+                    self._details_due[movie_id] = time.monotonic() + period
+        upsert_movies(details)
+
+        # The listing response is warm now, so rebuilding the fragments makes no upstream calls
+        for key, build in fragments:
+            refresh_fragment(key, build)
+
+
+def _acquire_prefetch_lock(app):
+    """
+    Takes an exclusive lock on instance/prefetch.lock without blocking. Returns the open
+    file (the lock lasts as long as it stays open, i.e. for the life of this process),
+    or None if another process already holds it.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return open(os.devnull) # No flock on this platform; assume a single process
+    os.makedirs(app.instance_path, exist_ok=True)
+    lock_file = open(os.path.join(app.instance_path, 'prefetch.lock'), 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def init_prefetcher(app):
+    """
+    Starts the background prefetcher if PREFETCH_ENABLED and stores it in app.config.
+    Requires TMDB_CACHE_BACKEND and FRAGMENT_CACHE_BACKEND to be 'sqlite', the caches every
+    worker reads; otherwise logs an error and starts nothing. Only the first process to take the prefetch lock starts one; when it exits, the next
+    worker to boot (e.g. its gunicorn replacement) takes over.
+    """
+    prefetcher = None
+    if app.config.get('PREFETCH_ENABLED') and app.config.get('PREFETCH_LISTINGS'):
+        # The prefetcher only warms the caches it can reach: with per-worker 'memory' caches it
+        # would warm its own process (or, under --preload, the master) and no other worker
+        memory_backends = [name for name in ('TMDB_CACHE_BACKEND', 'FRAGMENT_CACHE_BACKEND')
+                           if app.config.get(name) != 'sqlite']
+        if memory_backends:
+            app.logger.error(f"PREFETCH_ENABLED needs the shared 'sqlite' backend for {' and '.join(memory_backends)}; "
+                             f"not starting the prefetcher")
+            app.config['prefetcher'] = None
+            return None
+        lock_file = _acquire_prefetch_lock(app)
+        if lock_file is None:
+            app.logger.info("Prefetcher already running in another process, not starting one here")
+        else:
+            prefetcher = Prefetcher(app).start()
+            prefetcher.lock_file = lock_file
+            atexit.register(prefetcher.stop)
+    app.config['prefetcher'] = prefetcher
+    return prefetcher
+
+
+def stop_prefetcher(app):
+    """Stops the app's prefetcher, if one is running."""
+    prefetcher = app.config.get('prefetcher')
+    if prefetcher is not None:
+        prefetcher.stop()
@@ -1,10 +1,19 @@
 # movie_webapp/recommender.py
 import torch
 import torch.nn as nn
+import numpy as np
 import pickle
 import os
 import csv
+import json
+import queue
+import threading
+import time
+import warnings
+from concurrent.futures import Future
 from flask import current_app
+from .cache import make_cache
+from .id_maps import IdMaps
 
 # --- 1. Define the MLP model architecture ---
 class MLP(nn.Module):
@@ -44,92 +53,910 @@ class MLP(nn.Module):
         return self.sigmoid(x).view(-1) # Return a 1D tensor of scores
 
 
+# --- 1b. Scoring engine with a precomputed item tower ---
+class ItemTowerScorer:
+    """
+    Scores users against a fixed set of items without re-running the item side of the MLP.
+
+    The first nn.Linear acts on cat([user_emb, item_emb]), so it splits into a user half and
+    an item half: W @ [u; i] + b == W_u @ u + (W_i @ i + b). The item half (plus bias) is
+    computed once for every item at load time; a request only needs one small [E x H] matmul
+    for the user, a broadcast add and the remaining (narrower) layers.
+    """
+
+    CHUNK_ROWS = 4096 # Rows of the [B, N, H] activations scored at a time (see score_hidden)
+
+    def __init__(self, model, item_model_ids):
+        first_layer = model.mlp_layers[0]
+        embedding_size = model.user_embedding.embedding_dim
+
+        self.item_model_ids = torch.as_tensor(item_model_ids, dtype=torch.long)
+        self.user_embedding = model.user_embedding
+        self.item_embedding = model.item_embedding
+        self.first_layer = first_layer
+        self.embedding_size = embedding_size
+        self.remaining_layers = model.mlp_layers[1:] # Starts with the ReLU of the first layer
+        self.output_layer = model.output_layer
+        # Linear layers after the first, with float weights for the fold-in's backward pass
+        # (dequantized once if the layers are int8, see apply_precision)
+        self.backward_layers = [(layer, _float_weight(layer)) for layer in self.remaining_layers
+                                if not isinstance(layer, nn.ReLU)] + [(self.output_layer, _float_weight(self.output_layer))]
+        # Exported graph that score_hidden runs instead of the eager layers (see load_scoring_backend)
+        self.backend = None
+
+        with torch.no_grad():
+            # Starting point for folding in users the model has never seen
+            all_users = torch.arange(model.user_embedding.num_embeddings)
+            self.mean_user_embedding = model.user_embedding(all_users).mean(dim=0)
+            # [E, H] so a batch of user embeddings [B, E] maps straight to [B, H]
+            self.user_weight = first_layer.weight[:, :embedding_size].t().contiguous()
+            # [N, H]: item half of the first layer with the bias folded in
+            self.item_hidden = self.item_hidden_for(self.item_model_ids).contiguous()
+
+    @property
+    def num_items(self):
+        return self.item_model_ids.numel()
+
+    def item_hidden_for(self, item_model_ids):
+        """Item half of the first layer (bias included) for any model item indices, scored or not. Returns [R, H]."""
+        with torch.no_grad():
+            item_emb = self.item_embedding(torch.as_tensor(item_model_ids, dtype=torch.long))
+            return torch.addmm(self.first_layer.bias, item_emb, self.first_layer.weight[:, self.embedding_size:].t())
+
+    def score_embeddings(self, user_emb, positions=None):
+        """Scores a [B, E] batch of user embeddings against every item, or only those at positions. Returns [B, N]."""
+        item_hidden = self.item_hidden if positions is None else self.item_hidden[torch.as_tensor(positions, dtype=torch.long)]
+        return self.score_hidden(user_emb, item_hidden)
+
+    def score_hidden(self, user_emb, item_hidden):
+        """
+        Scores a [B, E] batch of user embeddings against [N, H] precomputed item halves. Returns [B, N].
+
+        Items are scored CHUNK_ROWS // B at a time, so the [B, chunk, H] activations stay in
+        cache; in one piece they spill once N runs to thousands and scoring is ~2x slower.
+        """
+        if self.backend is not None:
+            return self.backend(user_emb, item_hidden)
+        chunk = max(self.CHUNK_ROWS // len(user_emb), 256)
+        with torch.no_grad():
+            user_hidden = (user_emb @ self.user_weight).unsqueeze(1) # [B, 1, H]
+            scores = torch.empty(len(user_emb), len(item_hidden))
+            for start in range(0, len(item_hidden), chunk):
+                x = item_hidden[start:start + chunk].unsqueeze(0) + user_hidden # [B, chunk, H]
+                x = self.remaining_layers(x)
+                x = self.output_layer(x)
+                scores[:, start:start + chunk] = torch.sigmoid(x).squeeze(-1)
+            return scores
+
+    def fold_in_user(self, item_model_ids, targets, steps=10, lr=0.1, l2=0.01):
+        """
+        Builds an embedding [E] for a user outside the training set from their ratings.
+
+        Starts at the mean user embedding and takes a few Adam steps on it with the whole
+        network frozen, fitting the model's output on the rated items (model item indices,
+        candidates or not) to targets in [0, 1] under a cross-entropy loss. The l2 term
+        keeps it near the mean when there are only a handful of ratings.
+
+        Gradients are back-propagated by hand through the Linear/ReLU stack: with only the
+        [R, H] rows of the rated items involved, autograd's bookkeeping would cost far more
+        than the arithmetic, and this keeps a fold-in within a few milliseconds.
+        """
+        rated_hidden = self.item_hidden_for(item_model_ids) # [R, H]
+        targets = torch.as_tensor(targets, dtype=rated_hidden.dtype).unsqueeze(1) # [R, 1]
+        beta1, beta2, eps = 0.9, 0.999, 1e-8
+
+        with torch.no_grad():
+            user_emb = self.mean_user_embedding.clone()
+            first_moment = torch.zeros_like(user_emb)
+            second_moment = torch.zeros_like(user_emb)
+            for step in range(1, steps + 1):
+                # Forward: every Linear but the output one is followed by a ReLU
+                pre_activations = [rated_hidden + user_emb @ self.user_weight]
+                x = pre_activations[0]
+                for layer, _ in self.backward_layers:
+                    x = layer(torch.relu(x))
+                    pre_activations.append(x)
+
+                # Backward: d(mean BCE)/d(logit) = (sigmoid(logit) - target) / R
+                grad = (torch.sigmoid(x) - targets) / len(targets)
+                for (_, weight), pre_activation in zip(reversed(self.backward_layers), reversed(pre_activations[:-1])):
+                    grad = (grad @ weight) * (pre_activation > 0)
+                user_grad = self.user_weight @ grad.sum(dim=0) + 2 * l2 * (user_emb - self.mean_user_embedding)
+
+                # Adam update
+                first_moment.mul_(beta1).add_(user_grad, alpha=1 - beta1)
+                second_moment.mul_(beta2).addcmul_(user_grad, user_grad, value=1 - beta2)
+                denom = (second_moment / (1 - beta2 ** step)).sqrt_().add_(eps)
+                user_emb.addcdiv_(first_moment, denom, value=-lr / (1 - beta1 ** step))
+        return user_emb
+
+    def score_users(self, user_model_ids):
+        """Scores a batch of user model indices against every item. Returns [B, N]."""
+        with torch.no_grad():
+            user_emb = self.user_embedding(torch.as_tensor(user_model_ids, dtype=torch.long))
+        return self.score_embeddings(user_emb)
+
+    def score_user(self, user_model_id):
+        """Scores a single user model index against every item. Returns [N]."""
+        return self.score_users([user_model_id])[0]
+
+
+# --- 1c. Vectorized candidate selection ---
+def build_candidate_set(app, id_maps):
+    """
+    Model item indices worth scoring, as a contiguous, sorted LongTensor.
+
+    Only servable items (mapped to a TMDB ID) are kept. With RECOMMENDER_MIN_POPULARITY set,
+    items whose catalog popularity is below it are dropped too (items the catalog has no
+    popularity for are kept). RECOMMENDER_MAX_CANDIDATES caps the set at the most popular items.
+    """
+    candidate_ids = np.flatnonzero(id_maps.item_model_to_tmdb >= 0)
+    min_popularity = app.config.get('RECOMMENDER_MIN_POPULARITY')
+    max_candidates = app.config.get('RECOMMENDER_MAX_CANDIDATES')
+
+    if min_popularity is not None or (max_candidates and len(candidate_ids) > max_candidates):
+        popularity = _catalog_popularity(app, id_maps.item_model_to_tmdb[candidate_ids])
+        if min_popularity is not None:
+            candidate_ids = candidate_ids[~(popularity < min_popularity)] # NaN (unknown) compares False: kept
+            popularity = popularity[~(popularity < min_popularity)]
+        if max_candidates and len(candidate_ids) > max_candidates:
+            candidate_ids = np.sort(candidate_ids[_popularity_order(candidate_ids, popularity)[:max_candidates]])
+
+    return torch.from_numpy(candidate_ids.astype(np.int64))
+
+
+def _catalog_popularity(app, tmdb_ids):
+    """TMDB popularity from the local catalog for each TMDB ID (NaN where unknown)."""
+    popularity = np.full(len(tmdb_ids), np.nan)
+    try:
+        from .models import Movie # recommender is imported before the models (see __init__.py)
+        with app.app_context():
+            known = dict(Movie.query.with_entities(Movie.id, Movie.popularity)
+                         .filter(Movie.popularity.isnot(None)).all())
+    except Exception as e:
+        app.logger.warning(f"Could not read catalog popularity ({e}): RECOMMENDER_MIN_POPULARITY is not applied and "
+                           f"popularity caps keep arbitrary items until the model is reloaded")
+        return popularity
+    for position, tmdb_id in enumerate(tmdb_ids.tolist()):
+        if tmdb_id in known:
+            popularity[position] = known[tmdb_id]
+    return popularity
+
+
+def build_selection_tables(id_maps, candidate_ids):
+    """
+    Precomputes the tables used to pick recommendations from a score vector.
+
+    The tensors are indexed by candidate position (the scorer's item order):
+      - 'item_tmdb_ids': TMDB ID for each candidate
+      - 'servable_mask': True for candidates that can be shown (all of them, as candidates are servable)
+    and 'model_to_position' maps a model item index to its candidate position (-1 if not a candidate).
+    """
+    candidate_ids = torch.as_tensor(candidate_ids, dtype=torch.long)
+    item_tmdb_ids = torch.from_numpy(id_maps.item_model_to_tmdb)[candidate_ids]
+    model_to_position = np.full(id_maps.num_items, -1, dtype=np.int64)
+    model_to_position[candidate_ids.numpy()] = np.arange(len(candidate_ids))
+    return {
+        'item_tmdb_ids': item_tmdb_ids,
+        'servable_mask': item_tmdb_ids >= 0,
+        'model_to_position': model_to_position,
+    }
+
+
+def select_top_k(scores, servable_mask, excluded_positions, k):
+    """
+    Picks the k best servable items from a [N] score tensor, skipping excluded positions.
+    Returns (positions, scores) tensors of length <= k, best first.
+    """
+    allowed = servable_mask.clone()
+    if len(excluded_positions):
+        allowed[torch.as_tensor(excluded_positions, dtype=torch.long)] = False
+
+    k = min(k, int(allowed.sum()))
+    if k <= 0:
+        return torch.empty(0, dtype=torch.long), torch.empty(0, dtype=scores.dtype)
+
+    masked_scores = scores.masked_fill(~allowed, float('-inf'))
+    top_scores, top_positions = torch.topk(masked_scores, k)
+    return top_positions, top_scores
+
+
+def select_top_k_batch(scores, servable_mask, excluded_positions, k):
+    """
+    Batched select_top_k: scores is [B, N] and excluded_positions a list of B position arrays.
+    Returns (positions, scores) tensors of shape [B, k'] with k' = min(k, servable items);
+    a row with fewer than k' allowed items is padded with -inf scores.
+    """
+    k = min(k, int(servable_mask.sum()))
+    if k <= 0:
+        return torch.empty(scores.shape[0], 0, dtype=torch.long), torch.empty(scores.shape[0], 0, dtype=scores.dtype)
+
+    masked_scores = scores.masked_fill(~servable_mask, float('-inf'))
+    rows = [np.full(len(positions), row) for row, positions in enumerate(excluded_positions) if len(positions)]
+    if rows:
+        columns = [positions for positions in excluded_positions if len(positions)]
+        masked_scores[torch.from_numpy(np.concatenate(rows)), torch.from_numpy(np.concatenate(columns))] = float('-inf')
+    top_scores, top_positions = torch.topk(masked_scores, k, dim=1)
+    return top_positions, top_scores
+
+
+def _popularity_order(item_ids, popularity):
+    """Order of item_ids by popularity, most popular first (unknown popularity last), ties by model index."""
+    return np.lexsort((item_ids, -np.nan_to_num(popularity, nan=-np.inf)))
+
+
+# --- 1d. Approximate nearest-neighbour retrieval (two-stage scoring) ---
+class IVFIndex:
+    """
+    Inverted-file index over the scorer's items for two-stage retrieval.
+
+    The items' first-layer projections (ItemTowerScorer.item_hidden, i.e. the item
+    embeddings as the MLP sees them) are clustered with k-means. A query scores only the
+    cluster centroids with the MLP, gathers the items of the best clusters until it has
+    at least min_candidates of them, and the caller re-ranks those exactly. Centroids are
+    averages of item halves, and the first layer is linear, so a centroid scores like an
+    "average item" of its cluster.
+
+    Arrays (all built offline by build_ann_index and memory-mapped at load):
+      - 'centroids': [C, H] cluster centroids
+      - 'item_positions': [N] scorer positions grouped by cluster
+      - 'offsets': [C + 1] start of each cluster in item_positions
+      - 'item_model_ids': [N] model item indices the index was built for
+    """
+
+    ARRAY_NAMES = ('centroids', 'item_positions', 'offsets', 'item_model_ids')
+
+    def __init__(self, centroids, item_positions, offsets, item_model_ids):
+        self.centroids = centroids
+        self.item_positions = item_positions
+        self.offsets = offsets
+        self.item_model_ids = item_model_ids
+        self.cluster_sizes = offsets[1:] - offsets[:-1]
+
+    @property
+    def num_clusters(self):
+        return len(self.cluster_sizes)
+
+    def save(self, path):
+        export_mmap_weights({name: getattr(self, name) for name in self.ARRAY_NAMES}, path)
+
+    @classmethod
+    def load(cls, path):
+        """Maps an index written by save() read-only."""
+        arrays = load_mmap_state_dict(path)
+        return cls(*(arrays[name] for name in cls.ARRAY_NAMES))
+
+    def candidates(self, scorer, user_emb, min_candidates):
+        """
+        Stage 1: scorer positions of the items in the clusters whose centroids score best
+        for user_emb [E], taken best cluster first until there are at least min_candidates.
+        """
+        centroid_scores = scorer.score_hidden(user_emb.unsqueeze(0), self.centroids)[0]
+        order = torch.argsort(centroid_scores, descending=True)
+        covered = torch.cumsum(self.cluster_sizes[order], dim=0)
+        num_probes = int(torch.searchsorted(covered, min_candidates)) + 1
+        return torch.cat([self.item_positions[self.offsets[cluster]:self.offsets[cluster + 1]]
+                          for cluster in order[:num_probes].tolist()])
+
+
+def build_ann_index(scorer, num_clusters=None, iterations=20, chunk_size=8192, seed=0):
+    """
+    Clusters the scorer's item halves with k-means (Lloyd's algorithm, numpy) into an
+    IVFIndex. num_clusters defaults to 2 * sqrt(N), i.e. clusters of ~sqrt(N) / 2 items.
+    """
+    item_hidden = scorer.item_hidden.numpy().astype(np.float32)
+    num_items = len(item_hidden)
+    num_clusters = min(num_clusters or max(int(2 * np.sqrt(num_items)), 1), num_items)
+    rng = np.random.default_rng(seed)
+    centroids = item_hidden[rng.choice(num_items, num_clusters, replace=False)].copy()
+
+    def assign(centroids):
+        # Nearest centroid by squared distance, in chunks so [chunk, C] stays small
+        assignments = np.empty(num_items, dtype=np.int64)
+        centroid_norms = (centroids ** 2).sum(axis=1)
+        for start in range(0, num_items, chunk_size):
+            chunk = item_hidden[start:start + chunk_size]
+            assignments[start:start + chunk_size] = (centroid_norms - 2 * chunk @ centroids.T).argmin(axis=1)
+        return assignments
+
+    for _ in range(iterations):
+        assignments = assign(centroids)
+        counts = np.bincount(assignments, minlength=num_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, item_hidden)
+        filled = counts > 0 # Empty clusters keep their old centroid
+        centroids[filled] = sums[filled] / counts[filled, None]
+
+    assignments = assign(centroids)
+    item_positions = np.argsort(assignments, kind='stable')
+    offsets = np.searchsorted(assignments[item_positions], np.arange(num_clusters + 1))
+    return IVFIndex(torch.from_numpy(centroids), torch.from_numpy(item_positions),
+                    torch.from_numpy(offsets.astype(np.int64)), scorer.item_model_ids.clone())
+
+
+def load_ann_index(app, scorer):
+    """
+    Maps ANN_INDEX_PATH if RECOMMENDER_ANN is on. Returns None if it is off, missing, or
+    was built for a different candidate set (rebuild it with `flask build-ann-index`).
+    """
+    index_path = app.config.get('ANN_INDEX_PATH')
+    if not app.config.get('RECOMMENDER_ANN'):
+        return None
+    if not index_path or not os.path.exists(index_path) or not os.path.exists(index_path + '.json'):
+        app.logger.warning(f"RECOMMENDER_ANN is on but there is no index at {index_path}; scoring every candidate.")
+        return None
+
+    index = IVFIndex.load(index_path)
+    if not torch.equal(index.item_model_ids, scorer.item_model_ids):
+        app.logger.warning(f"ANN index {index_path} was built for a different candidate set; scoring every candidate.")
+        return None
+    app.logger.info(f"Mapped ANN index with {index.num_clusters} clusters from {index_path}.")
+    return index
+
+
+# --- 1e. Item-to-item similarity ("More like this") ---
+def build_similarity_tables(app, model, id_maps, candidate_ids):
+    """
+    Precomputes what get_similar_movies needs, indexed like the selection tables:
+      - 'normalized': [N, E] L2-normalised item embeddings of the candidates
+    and, for the RECOMMENDER_SIMILAR_PRECOMPUTE most popular candidates, their full lists:
+      - 'precomputed_rows': model item index -> row in the lists below (-1 if none)
+      - 'precomputed_positions' / 'precomputed_scores': [P, RECOMMENDER_SIMILAR_PRECOMPUTE_K]
+    """
+    candidate_ids = torch.as_tensor(candidate_ids, dtype=torch.long)
+    with torch.no_grad():
+        normalized = nn.functional.normalize(model.item_embedding(candidate_ids), dim=1).contiguous()
+
+    num_precomputed = min(app.config.get('RECOMMENDER_SIMILAR_PRECOMPUTE') or 0, len(candidate_ids))
+    k = min(app.config.get('RECOMMENDER_SIMILAR_PRECOMPUTE_K', 50), len(candidate_ids) - 1)
+    precomputed_rows = np.full(id_maps.num_items, -1, dtype=np.int64)
+    precomputed_positions = torch.empty(0, max(k, 0), dtype=torch.long)
+    precomputed_scores = torch.empty(0, max(k, 0))
+
+    if num_precomputed and k > 0:
+        candidate_array = candidate_ids.numpy()
+        popularity = _catalog_popularity(app, id_maps.item_model_to_tmdb[candidate_array])
+        positions = torch.from_numpy(_popularity_order(candidate_array, popularity)[:num_precomputed])
+        score_chunks, position_chunks = [], []
+        for start in range(0, len(positions), 1024): # [1024, N] similarities at a time
+            chunk = positions[start:start + 1024]
+            similarities = normalized[chunk] @ normalized.t()
+            similarities[torch.arange(len(chunk)), chunk] = float('-inf') # Not similar to itself
+            chunk_scores, chunk_positions = torch.topk(similarities, k, dim=1)
+            score_chunks.append(chunk_scores)
+            position_chunks.append(chunk_positions)
+        precomputed_scores, precomputed_positions = torch.cat(score_chunks), torch.cat(position_chunks)
+        precomputed_rows[candidate_array[positions.numpy()]] = np.arange(len(positions))
+
+    return {
+        'normalized': normalized,
+        'precomputed_rows': precomputed_rows,
+        'precomputed_positions': precomputed_positions,
+        'precomputed_scores': precomputed_scores,
+    }
+
+
+def get_similar_movies(tmdb_id, k=10):
+    """
+    The k candidate movies whose item embeddings are closest (cosine) to tmdb_id's.
+
+    Served from the precomputed lists when the movie has one, otherwise one [N, E] x [E]
+    product against the normalised matrix.
+
+    Returns:
+        list: Dicts with 'tmdb_id' and 'score' (cosine similarity), most similar first;
+              empty if the model does not know the movie or is not loaded.
+    """
+    loaded_data = current_app.config.get('recommender_loaded_data') or {}
+    model, selection = loaded_data.get('model'), loaded_data.get('selection')
+    similarity, id_maps = loaded_data.get('similarity'), loaded_data.get('id_maps')
+    if model is None or selection is None or similarity is None or id_maps is None:
+        return []
+
+    model_id = int(id_maps.tmdb_to_model_ids([tmdb_id])[0])
+    if model_id < 0:
+        return []
+
+    row = similarity['precomputed_rows'][model_id]
+    if row >= 0 and k <= similarity['precomputed_positions'].shape[1]:
+        top_positions = similarity['precomputed_positions'][row, :k]
+        top_scores = similarity['precomputed_scores'][row, :k]
+    else:
+        with torch.no_grad():
+            query = nn.functional.normalize(model.item_embedding(torch.tensor(model_id)), dim=0)
+            scores = similarity['normalized'] @ query
+        position = selection['model_to_position'][model_id]
+        excluded = [position] if position >= 0 else []
+        top_positions, top_scores = select_top_k(scores, selection['servable_mask'], excluded, k)
+
+    top_tmdb_ids = selection['item_tmdb_ids'][top_positions]
+    return [{'tmdb_id': similar_id, 'score': score}
+            for similar_id, score in zip(top_tmdb_ids.tolist(), top_scores.tolist())]
+
+
+# --- 1f. Reduced-precision weights (RECOMMENDER_PRECISION) ---
+PRECISIONS = ('fp32', 'fp16', 'bf16', 'int8', 'int8-dynamic')
+
+
+class CompactEmbedding(nn.Module):
+    """
+    Read-only embedding table stored in fp16, bf16 or per-row int8, returning fp32 rows.
+
+    int8 rows keep their own scale (max |value| / 127), so a row of small values keeps its
+    resolution: 36 bytes per 32-wide row instead of 128. Drop-in for the lookups made
+    through nn.Embedding.__call__ (there is no float .weight to index).
+    """
+
+    def __init__(self, weight, scale=None):
+        super().__init__()
+        self.register_buffer('weight', weight)
+        self.register_buffer('scale', scale)
+        self.num_embeddings, self.embedding_dim = weight.shape
+
+    @classmethod
+    def from_embedding(cls, embedding, precision, chunk_size=8192):
+        weight = embedding.weight.detach()
+        if not precision.startswith('int8'):
+            return cls(weight.to(torch.float16 if precision == 'fp16' else torch.bfloat16))
+        # Chunked, so the float temporaries stay small: table-sized ones would be freed
+        # into the allocator's heap and stay in the worker's RSS
+        quantized = torch.empty(weight.shape, dtype=torch.int8)
+        scale = torch.empty(weight.shape[0])
+        for start in range(0, weight.shape[0], chunk_size):
+            rows = weight[start:start + chunk_size].float()
+            chunk_scale = (rows.abs().amax(dim=1) / 127).clamp_min(1e-12)
+            scale[start:start + chunk_size] = chunk_scale
+            quantized[start:start + chunk_size] = torch.round(rows / chunk_scale.unsqueeze(1))
+        return cls(quantized, scale)
+
+    def forward(self, indices):
+        rows = self.weight[indices].float()
+        return rows if self.scale is None else rows * self.scale[indices].unsqueeze(-1)
+
+
+def _float_weight(layer):
+    """Float weight matrix of an nn.Linear or of a dynamically quantized one (where weight() is a method)."""
+    weight = layer.weight
+    return weight().dequantize() if callable(weight) else weight.detach()
+
+
+def apply_precision(model, precision):
+    """
+    Converts a loaded (eval mode) MLP in place for RECOMMENDER_PRECISION:
+      - 'fp32': unchanged
+      - 'fp16' / 'bf16': both embedding tables stored at half precision
+      - 'int8': per-row int8 embedding tables
+      - 'int8-dynamic': 'int8', plus every nn.Linear but the first dynamically quantized to
+        int8 (the first one is folded into the precomputed item tower, so it stays fp32;
+        see ItemTowerScorer). These layers are so narrow that the per-call activation
+        quantization costs more than the int8 matmuls save on x86; see bench_precision.py
+    Returns the model.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown RECOMMENDER_PRECISION {precision!r}, expected one of {', '.join(PRECISIONS)}")
+    if precision == 'fp32':
+        return model
+
+    model.user_embedding = CompactEmbedding.from_embedding(model.user_embedding, precision)
+    model.item_embedding = CompactEmbedding.from_embedding(model.item_embedding, precision)
+    if precision == 'int8-dynamic':
+        first_layer = model.mlp_layers[0]
+        quantized = {name for name, module in model.named_modules()
+                     if isinstance(module, nn.Linear) and module is not first_layer}
+        with warnings.catch_warnings():
+            # torch.ao.quantization warns about its planned move to torchao on every call
+            warnings.simplefilter('ignore')
+            torch.ao.quantization.quantize_dynamic(model, quantized, dtype=torch.qint8, inplace=True)
+    return model
+
+
+def embedding_bytes(model):
+    """Bytes held by the model's two embedding tables (weights plus int8 scales)."""
+    tensors = [model.user_embedding.weight, model.item_embedding.weight,
+               getattr(model.user_embedding, 'scale', None), getattr(model.item_embedding, 'scale', None)]
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors if tensor is not None)
+
+
+def top_k_overlap(reference, scorer, user_model_ids, servable_mask, k=20, batch_size=64):
+    """
+    Per-user fraction of reference's top k that scorer also puts in its top k (both scorers
+    over the same candidates; rated items are not excluded). Returns a float numpy array.
+    """
+    overlaps = []
+    for start in range(0, len(user_model_ids), batch_size):
+        batch = user_model_ids[start:start + batch_size]
+        no_exclusions = [()] * len(batch)
+        expected, _ = select_top_k_batch(reference.score_users(batch), servable_mask, no_exclusions, k)
+        actual, _ = select_top_k_batch(scorer.score_users(batch), servable_mask, no_exclusions, k)
+        overlaps.extend(len(set(want.tolist()) & set(got.tolist())) / max(len(want), 1)
+                        for want, got in zip(expected, actual))
+    return np.array(overlaps)
+
+
+# --- 1g. Exported scoring graphs (RECOMMENDER_BACKEND) ---
+BACKENDS = ('torch', 'torchscript', 'onnx')
+
+
+class ScorerHead(nn.Module):
+    """
+    ItemTowerScorer.score_hidden as a standalone module for export:
+    (user_emb [B, E], item_hidden [N, H]) -> scores [B, N].
+
+    The item tower is an input rather than a constant, so one graph serves any candidate
+    set (and the ANN re-rank subsets); only retraining the model calls for a new export.
+    Weights are float copies, so an int8-dynamic model exports at fp32.
+    """
+
+    def __init__(self, scorer):
+        super().__init__()
+        self.register_buffer('user_weight', scorer.user_weight.detach().clone())
+        self.linears = nn.ModuleList([_float_linear(layer) for layer, _ in scorer.backward_layers])
+
+    def forward(self, user_emb, item_hidden):
+        x = item_hidden.unsqueeze(0) + (user_emb @ self.user_weight).unsqueeze(1)
+        for linear in self.linears: # Every Linear is preceded by a ReLU (the first one by the item tower's)
+            x = linear(torch.relu(x))
+        return torch.sigmoid(x).squeeze(-1)
+
+
+def _float_linear(layer):
+    """fp32 nn.Linear copy of an nn.Linear or of a dynamically quantized one."""
+    weight = _float_weight(layer)
+    bias = layer.bias() if callable(layer.bias) else layer.bias
+    linear = nn.Linear(weight.shape[1], weight.shape[0])
+    with torch.no_grad():
+        linear.weight.copy_(weight)
+        linear.bias.copy_(bias.detach())
+    return linear
+
+
+def export_scorer(scorer, torchscript_path=None, onnx_path=None):
+    """Writes the scorer's head (see ScorerHead) as TorchScript and/or ONNX, with dynamic user and item counts."""
+    head = ScorerHead(scorer).eval()
+    example = (scorer.mean_user_embedding.unsqueeze(0), scorer.item_hidden[:16])
+    with warnings.catch_warnings():
+        # Both exporters are deprecated in favour of torch.export in recent torch releases;
+        # the legacy ONNX exporter needs no onnxscript
+        warnings.simplefilter('ignore')
+        if torchscript_path:
+            torch.jit.save(torch.jit.freeze(torch.jit.script(head)), torchscript_path)
+        if onnx_path:
+            torch.onnx.export(head, example, onnx_path, input_names=['user_emb', 'item_hidden'], output_names=['scores'],
+                              dynamic_axes={'user_emb': {0: 'users'}, 'item_hidden': {0: 'items'},
+                                            'scores': {0: 'users', 1: 'items'}}, dynamo=False)
+
+
+class TorchScriptBackend:
+    """Runs a TorchScript head written by export_scorer."""
+
+    def __init__(self, path):
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', FutureWarning) # torch.jit deprecation notice
+            self.module = torch.jit.load(path, map_location='cpu').eval()
+
+    def __call__(self, user_emb, item_hidden):
+        with torch.no_grad():
+            return self.module(user_emb, item_hidden)
+
+
+class OnnxBackend:
+    """
+    Runs an ONNX head written by export_scorer through onnxruntime (an optional dependency).
+    Sessions are created per process on first use: precompute-recommendations forks
+    workers, and a session's thread pool does not survive a fork.
+    """
+
+    def __init__(self, path):
+        import onnxruntime # Optional: only needed for RECOMMENDER_BACKEND = 'onnx'
+        self._onnxruntime = onnxruntime
+        self.path = path
+        self._session = None
+        self._session_pid = None
+
+    def _get_session(self):
+        if self._session is None or self._session_pid != os.getpid():
+            options = self._onnxruntime.SessionOptions()
+            options.intra_op_num_threads = torch.get_num_threads() # Same budget as the eager path
+            self._session = self._onnxruntime.InferenceSession(self.path, options, providers=['CPUExecutionProvider'])
+            self._session_pid = os.getpid()
+        return self._session
+
+    def __call__(self, user_emb, item_hidden):
+        inputs = {'user_emb': user_emb.detach().float().contiguous().numpy(),
+                  'item_hidden': item_hidden.detach().float().contiguous().numpy()}
+        return torch.from_numpy(self._get_session().run(None, inputs)[0])
+
+
+def load_scoring_backend(app, scorer):
+    """
+    The backend for RECOMMENDER_BACKEND, or None for eager torch. Falls back to None (with
+    a warning) if the exported graph is missing, cannot be run, or does not reproduce the
+    eager scores, e.g. after a retrain (re-export with `flask export-scorer`).
+    """
+    name = app.config.get('RECOMMENDER_BACKEND', 'torch')
+    if name == 'torch':
+        return None
+    if name not in BACKENDS:
+        app.logger.warning(f"Unknown RECOMMENDER_BACKEND {name!r}, expected one of {', '.join(BACKENDS)}; using torch.")
+        return None
+    path = app.config.get('SCORER_TORCHSCRIPT_PATH' if name == 'torchscript' else 'SCORER_ONNX_PATH')
+    if not path or not os.path.exists(path):
+        app.logger.warning(f"RECOMMENDER_BACKEND is {name} but there is no exported scorer at {path}; using torch.")
+        return None
+
+    try:
+        backend = TorchScriptBackend(path) if name == 'torchscript' else OnnxBackend(path)
+        user_emb = scorer.mean_user_embedding.unsqueeze(0)
+        item_hidden = scorer.item_hidden[:1000]
+        with torch.no_grad():
+            expected = ScorerHead(scorer)(user_emb, item_hidden)
+        actual = backend(user_emb, item_hidden)
+    except Exception as e:
+        app.logger.warning(f"Could not run the {name} scorer at {path}, using torch: {e}")
+        return None
+    if actual.shape != expected.shape or (actual - expected).abs().max() > 1e-4:
+        app.logger.warning(f"The {name} scorer at {path} does not match the loaded model; using torch.")
+        return None
+    app.logger.info(f"Scoring with the {name} scorer at {path}.")
+    return backend
+
+
+# --- 1h. Micro-batched scoring (RECOMMENDER_BATCHING) ---
+class ScoringBatcher:
+    """
+    Coalesces concurrent requests to score every candidate into one [B, N] pass.
+
+    Request threads queue (user embedding, rated positions, k) and wait on a Future. One
+    scoring thread takes the first waiting request, keeps collecting until window_ms after
+    it or max_batch requests, scores the batch and hands each caller its own top k. With
+    one thread doing all the scoring, concurrent requests no longer fight over torch's
+    intra-op threads either.
+
+    The thread is started on first use (and again after a fork).
+    """
+
+    def __init__(self, scorer, servable_mask, window_ms=2.0, max_batch=8):
+        self.scorer = scorer
+        self.servable_mask = servable_mask
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._requests = None
+        self._thread_pid = None
+
+    def top_k(self, user_emb, excluded_positions, k):
+        """select_top_k over the scores of user_emb [E] against every candidate, via the next batch."""
+        future = Future()
+        self._get_requests().put((user_emb, excluded_positions, k, future))
+        return future.result()
+
+    def _get_requests(self):
+        if self._thread_pid != os.getpid():
+            with self._lock:
+                if self._thread_pid != os.getpid():
+                    self._requests = queue.Queue()
+                    threading.Thread(target=self._run, args=(self._requests,), name='recommender-batcher',
+                                     daemon=True).start()
+                    self._thread_pid = os.getpid()
+        return self._requests
+
+    def _run(self, requests):
+        while True:
+            batch = [requests.get()]
+            deadline = time.perf_counter() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                try:
+                    batch.append(requests.get(timeout=remaining) if remaining > 0 else requests.get_nowait())
+                except queue.Empty:
+                    break
+            self._score(batch)
+
+    def _score(self, batch):
+        try:
+            scores = self.scorer.score_embeddings(torch.stack([user_emb for user_emb, _, _, _ in batch]))
+            top_positions, top_scores = select_top_k_batch(scores, self.servable_mask, [excluded for _, excluded, _, _ in batch],
+                                                           max(k for _, _, k, _ in batch))
+            for row, (_, _, k, future) in enumerate(batch):
+                found = top_scores[row] > float('-inf') # Rows with fewer allowed items are padded with -inf
+                future.set_result((top_positions[row][found][:k], top_scores[row][found][:k]))
+        except Exception as e:
+            for _, _, _, future in batch:
+                future.set_exception(e)
+
+
 # --- 2. Function to load the trained model and mappings ---
-def load_recommender_model(app):
-    """Loads the trained NCF model and mapping files."""
-    model_path = app.config.get('MODEL_PATH')
+def load_id_maps(app):
+    """
+    Loads the array-backed ID maps from ID_MAPS_PATH, falling back to building
+    them from the legacy pickles (user_map.pkl / item_map.pkl) when it is missing.
+    """
+    id_maps_path = app.config.get('ID_MAPS_PATH')
+    if id_maps_path and os.path.exists(id_maps_path):
+        id_maps = IdMaps.load(id_maps_path)
+        app.logger.info(f"Loaded ID maps from {id_maps_path}: {id_maps.num_users} users, {id_maps.num_items} items.")
+        return id_maps
+
     user_map_path = app.config.get('USER_MAP_PATH')
     item_map_path = app.config.get('ITEM_MAP_PATH') # ML_ID <-> Model Index + ML_ID <-> TMDB_ID maps here
+    missing_files = [path for path in (user_map_path, item_map_path) if not path or not os.path.exists(path)]
+    if missing_files:
+        app.logger.error(f"Missing ID map files: {', '.join(str(path) for path in missing_files)}.")
+        return None
 
-    num_users = app.config.get('RECOMMENDER_NUM_USERS')
-    num_items = app.config.get('RECOMMENDER_NUM_ITEMS')
-    embedding_size = app.config.get('RECOMMENDER_EMBEDDING_SIZE')
-    layer_dims = app.config.get('RECOMMENDER_LAYER_DIMS')
+    app.logger.warning(f"{id_maps_path} not found, building ID maps from pickles. Run create_mappings.py to generate it.")
+    # Load user map (Flask DB User ID -> Model Index)
+    with open(user_map_path, 'rb') as f:
+        user_map = pickle.load(f)
+    # Load item map (ML_ID <-> Model Index + ML_ID <-> TMDB_ID)
+    with open(item_map_path, 'rb') as f:
+        item_maps = pickle.load(f)
 
-    model = None
-    user_map = None
-    item_map_ml_to_model = None
-    item_map_model_to_ml = None
-    tmdb_to_ml_map = {}
-    ml_to_tmdb_map = {}
+    ml_to_model = item_maps.get('ml_to_model', {})
+    ml_to_tmdb = item_maps.get('ml_to_tmdb', {})
+    tmdb_to_ml = item_maps.get('tmdb_to_ml', {})
+    if not user_map or not ml_to_model or not ml_to_tmdb or not tmdb_to_ml:
+        app.logger.error(f"Incomplete or incorrect maps loaded from {user_map_path} / {item_map_path}. Ensure item_map contains 'ml_to_model', 'ml_to_tmdb', and 'tmdb_to_ml'.")
+        return None
 
-    # --- Check if core files exist before attempting to load ---
-    core_files = {'Model file': model_path, 'User map': user_map_path, 'Item map': item_map_path}
-    missing_core_files = [name for name, path in core_files.items() if not path or not os.path.exists(path)]
+    return IdMaps.from_dicts(user_map, ml_to_model, ml_to_tmdb, tmdb_to_ml)
 
-    if missing_core_files:
-        app.logger.error(f"Missing core recommender files: {', '.join(missing_core_files)}. Recommendations will not be available.")
-        return { 'model': None, 'user_map': None, 'item_map_ml_to_model': {},
-                 'item_map_model_to_ml': {}, 'tmdb_to_ml_map': {}, 'ml_to_tmdb_map': {} }
 
-    try:
-        # Load user map (Flask DB User ID -> Model Index)
-        with open(user_map_path, 'rb') as f:
-            user_map = pickle.load(f)
-        app.logger.info(f"Loaded user map from {user_map_path} with {len(user_map)} entries.")
-
-        # Load item map (ML_ID <-> Model Index + ML_ID <-> TMDB_ID)
-        with open(item_map_path, 'rb') as f:
-             item_maps = pickle.load(f)
-             item_map_ml_to_model = item_maps.get('ml_to_model', {})
-             item_map_model_to_ml = item_maps.get('model_to_ml', {})
-             ml_to_tmdb_map = item_maps.get('ml_to_tmdb', {})
-             tmdb_to_ml_map = item_maps.get('tmdb_to_ml', {})
-
-        # Check if essential item maps were loaded
-        if not item_map_ml_to_model or not item_map_model_to_ml or len(item_map_ml_to_model) != len(item_map_model_to_ml) or not ml_to_tmdb_map or not tmdb_to_ml_map:
-             app.logger.error(f"Incomplete or incorrect item maps loaded from {item_map_path}. Ensure it contains 'ml_to_model', 'model_to_ml', 'ml_to_tmdb', and 'tmdb_to_ml'. Recommendations may be limited or unavailable.")
-             item_map_ml_to_model = {}
-             item_map_model_to_ml = {}
-             ml_to_tmdb_map = {}
-             tmdb_to_ml_map = {}
-        else:
-             app.logger.info(f"Loaded item maps from {item_map_path}. Model has {len(item_map_ml_to_model)} items, {len(tmdb_to_ml_map)} ML<->TMDB links.")
+# --- 2b. Flat, memory-mappable weight files ---
+MMAP_ALIGNMENT = 64 # Byte alignment of each tensor inside the weights file
 
 
-        # Instantiate model
-        model = MLP(num_users, num_items, embedding_size, layer_dims)
+def export_mmap_weights(state_dict, weights_path):
+    """
+    Writes a state dict as one flat binary file plus a JSON manifest (<weights_path>.json)
+    listing the dtype, shape and byte offset of every tensor.
+    """
+    manifest = {}
+    offset = 0
+    with open(weights_path, 'wb') as f:
+        for name, tensor in state_dict.items():
+            array = tensor.detach().cpu().contiguous().numpy()
+            padding = -offset % MMAP_ALIGNMENT
+            f.write(b'\0' * padding)
+            offset += padding
+            f.write(array.tobytes())
+            manifest[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+            offset += array.nbytes
 
-        # Load the trained state dictionary
-        app.logger.warning("Loading model with weights_only=False due to potential compatibility issues. Ensure you trust the source of model.pth.")
-        # Use map_location='cpu' for loading on machines without GPU
-        checkpoint = torch.load(model_path, map_location=torch.device('cpu'), weights_only=False)
+    with open(weights_path + '.json', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
 
-        model_state_dict = checkpoint.get('model_state_dict')
 
-        if model_state_dict is None:
-             app.logger.error(f"Expected key 'model_state_dict' not found in the loaded dictionary from {model_path}.")
-             raise KeyError(f"Expected key 'model_state_dict' not found in checkpoint file {model_path}")
+def load_mmap_state_dict(weights_path):
+    """
+    Maps a file written by export_mmap_weights read-only and returns a state dict of tensors
+    backed by the mapping. All workers share one page-cache copy; nothing is deserialized.
+    """
+    with open(weights_path + '.json') as f:
+        manifest = json.load(f)
+
+    mapping = np.memmap(weights_path, dtype=np.uint8, mode='r')
+    state_dict = {}
+    with warnings.catch_warnings():
+        # torch warns that the arrays are not writable; the weights are never modified
+        warnings.simplefilter('ignore', UserWarning)
+        for name, spec in manifest.items():
+            dtype = np.dtype(spec['dtype'])
+            count = int(np.prod(spec['shape'], dtype=np.int64))
+            array = np.frombuffer(mapping, dtype=dtype, count=count, offset=spec['offset']).reshape(spec['shape'])
+            state_dict[name] = torch.from_numpy(array)
+    return state_dict
 
-        model.load_state_dict(model_state_dict)
 
-        model.eval() # Set model to evaluation mode
-        app.logger.info(f"Loaded model state dictionary from {model_path}.")
+def load_model_state_dict(app):
+    """
+    Returns the MLP state dict, preferring the memory-mapped MODEL_WEIGHTS_PATH over
+    deserializing MODEL_PATH with torch.load. The second value is True for mmap-backed tensors.
+    """
+    weights_path = app.config.get('MODEL_WEIGHTS_PATH')
+    if weights_path and os.path.exists(weights_path) and os.path.exists(weights_path + '.json'):
+        app.logger.info(f"Mapping model weights read-only from {weights_path}.")
+        return load_mmap_state_dict(weights_path), True
+
+    model_path = app.config.get('MODEL_PATH')
+    # Load the trained state dictionary
+    app.logger.warning("Loading model with weights_only=False due to potential compatibility issues. Ensure you trust the source of model.pth.")
+    # Use map_location='cpu' for loading on machines without GPU
+    checkpoint = torch.load(model_path, map_location=torch.device('cpu'), weights_only=False)
+
+    model_state_dict = checkpoint.get('model_state_dict')
+
+    if model_state_dict is None:
+         app.logger.error(f"Expected key 'model_state_dict' not found in the loaded dictionary from {model_path}.")
+         raise KeyError(f"Expected key 'model_state_dict' not found in checkpoint file {model_path}")
+
+    app.logger.info(f"Loaded model state dictionary from {model_path}.")
+    return model_state_dict, False
+
+
+def build_model(app, precision='fp32'):
+    """Instantiates the MLP with the configured sizes, loads the trained weights and applies precision (see apply_precision)."""
+    model_state_dict, is_mmap = load_model_state_dict(app)
+
+    # Instantiate model
+    model = MLP(app.config.get('RECOMMENDER_NUM_USERS'), app.config.get('RECOMMENDER_NUM_ITEMS'),
+                app.config.get('RECOMMENDER_EMBEDDING_SIZE'), app.config.get('RECOMMENDER_LAYER_DIMS'))
+    # For mmap-backed weights, adopt the mapped tensors instead of copying them into
+    # the freshly initialised parameters (which are then freed)
+    model.load_state_dict(model_state_dict, assign=is_mmap)
+
+    model.eval() # Set model to evaluation mode
+    # Reduced precision makes private (smaller) copies of the converted tensors, so with
+    # mmap weights it trades pages shared by every worker for per-worker ones
+    return apply_precision(model, precision)
+
+
+def load_recommender_model(app):
+    """Loads the trained NCF model and mapping files."""
+    model_path = app.config.get('MODEL_PATH')
+
+    model = None
+    scorer = None
+    selection = None
+    ann_index = None
+    similarity = None
+    batcher = None
+    id_maps = None
+
+    weights_path = app.config.get('MODEL_WEIGHTS_PATH')
+
+    # --- Check if core files exist before attempting to load ---
+    model_files = [path for path in (model_path, weights_path) if path and os.path.exists(path)]
+    if not model_files:
+        app.logger.error("Missing core recommender files: Model file. Recommendations will not be available.")
+        return { 'model': None, 'scorer': None, 'selection': None, 'ann_index': None, 'similarity': None, 'batcher': None, 'id_maps': None }
+
+    try:
+        id_maps = load_id_maps(app)
+        if id_maps is None:
+            raise ValueError("ID maps could not be loaded")
+
+        precision = app.config.get('RECOMMENDER_PRECISION', 'fp32')
+        model = build_model(app, precision)
+        app.logger.info(f"Recommender weights at {precision}: embedding tables {embedding_bytes(model) / 2**20:.1f} MB.")
+
+        # Only servable (and popular enough) items are scored; the item half of the
+        # first layer is precomputed once for each of them
+        candidate_ids = build_candidate_set(app, id_maps)
+        scorer = ItemTowerScorer(model, candidate_ids)
+        app.logger.info(f"Precomputed item tower for {scorer.num_items} candidates out of {id_maps.num_items} model items.")
+
+        scorer.backend = load_scoring_backend(app, scorer)
+
+        selection = build_selection_tables(id_maps, candidate_ids)
+        ann_index = load_ann_index(app, scorer)
+        similarity = build_similarity_tables(app, model, id_maps, candidate_ids)
+        if app.config.get('RECOMMENDER_BATCHING'):
+            batcher = ScoringBatcher(scorer, selection['servable_mask'],
+                                     window_ms=app.config.get('RECOMMENDER_BATCH_WINDOW_MS', 2),
+                                     max_batch=app.config.get('RECOMMENDER_MAX_BATCH', 8))
 
     except Exception as e:
         app.logger.error(f"Error loading recommender components: {e}")
         model = None
+        scorer = None
+        selection = None
+        ann_index = None
+        similarity = None
+        batcher = None
 
     loaded_data = {
         'model': model,
-        'user_map': user_map, # Flask DB User ID -> Model Index
-        'item_map_ml_to_model': item_map_ml_to_model, # ML ID -> Model Index
-        'item_map_model_to_ml': item_map_model_to_ml, # Model Index -> ML ID
-        'tmdb_to_ml_map': tmdb_to_ml_map, # TMDB ID -> ML ID
-        'ml_to_tmdb_map': ml_to_tmdb_map # ML ID -> TMDB ID
+        'scorer': scorer, # ItemTowerScorer over the candidate items (see build_candidate_set)
+        'selection': selection, # Tables indexed by candidate position (see build_selection_tables)
+        'ann_index': ann_index, # IVFIndex for two-stage retrieval, or None to score every candidate
+        'similarity': similarity, # Normalised item embeddings for "More like this" (see build_similarity_tables)
+        'batcher': batcher, # ScoringBatcher coalescing concurrent requests, or None to score each on its own
+        'id_maps': id_maps, # Array-backed User ID / ML ID / TMDB ID <-> Model Index maps
     }
 
-    if loaded_data['model'] is None or not loaded_data['user_map'] or not loaded_data['item_map_ml_to_model'] or not loaded_data['item_map_model_to_ml'] or not loaded_data['tmdb_to_ml_map'] or not loaded_data['ml_to_tmdb_map']:
+    if loaded_data['model'] is None or loaded_data['id_maps'] is None:
          app.logger.warning("Recommender system is incomplete or failed to load all components. Recommendations may not function correctly.")
 
 
@@ -137,14 +964,19 @@ def load_recommender_model(app):
 
 
 # --- 3. Function to get recommendations for a user ---
-def get_recommendations_for_user(user_db_id, rated_movie_tmdb_ids, num_recommendations=20):
+def get_recommendations_for_user(user_db_id, rated_movie_tmdb_ids, num_recommendations=20, rating_values=None):
     """
     Generates personalized movie recommendations for a user using the loaded NCF (MLP) model.
 
+    Users missing from the user map (everyone who signed up after training) get an
+    embedding folded in from their ratings instead (see ItemTowerScorer.fold_in_user).
+
     Args:
         user_db_id (int): The database ID of the user.
         rated_movie_tmdb_ids (list): A list of TMDB IDs of movies the user has already rated.
         num_recommendations (int): The desired number of recommendations.
+        rating_values (list, optional): The 0-5 ratings matching rated_movie_tmdb_ids, used by
+            the fold-in; without them every rated movie counts as liked.
 
     Returns:
         list: A list of dictionaries, where each dictionary contains 'tmdb_id' and 'score'.
@@ -156,73 +988,158 @@ def get_recommendations_for_user(user_db_id, rated_movie_tmdb_ids, num_recommend
         return []
 
     model = loaded_data.get('model')
-    user_map = loaded_data.get('user_map')
-    item_map_ml_to_model = loaded_data.get('item_map_ml_to_model')
-    item_map_model_to_ml = loaded_data.get('item_map_model_to_ml')
-    tmdb_to_ml_map = loaded_data.get('tmdb_to_ml_map')
-    ml_to_tmdb_map = loaded_data.get('ml_to_tmdb_map')
+    scorer = loaded_data.get('scorer')
+    selection = loaded_data.get('selection')
+    id_maps = loaded_data.get('id_maps')
 
-    if model is None or user_map is None or item_map_ml_to_model is None or item_map_model_to_ml is None or not tmdb_to_ml_map or not ml_to_tmdb_map:
+    if model is None or scorer is None or selection is None or id_maps is None:
         current_app.logger.warning("Recommender components are missing or incomplete. Cannot generate recommendations.")
         return []
 
-    user_model_id = user_map.get(user_db_id)
+    user_model_id = id_maps.user_model_id(user_db_id)
 
-    if user_model_id is None:
+    if scorer.num_items == 0:
+         current_app.logger.warning("Item map (Model Index -> ML ID) is empty. Cannot generate recommendations.")
+         return []
+
+    # Model item indices of the movies the user has already rated
+    rated_item_model_ids = id_maps.tmdb_to_model_ids(rated_movie_tmdb_ids)
+    known = rated_item_model_ids >= 0
+    rated_item_model_ids = rated_item_model_ids[known]
+
+    if user_model_id is not None:
+        with torch.no_grad():
+            user_emb = scorer.user_embedding(torch.tensor(user_model_id))
+    elif not current_app.config.get('RECOMMENDER_FOLD_IN', True):
         current_app.logger.warning(f"User ID {user_db_id} not found in user map. Returning empty recommendations.")
         return []
+    elif len(rated_item_model_ids) == 0:
+        current_app.logger.info(f"User ID {user_db_id} is not in the user map and has no ratings the model knows. "
+                                "Returning empty recommendations.")
+        return []
+    else:
+        # Cold start: fold the user in from their ratings, then score as usual
+        if rating_values is None:
+            targets = np.ones(len(rated_item_model_ids), dtype=np.float32)
+        else:
+            targets = np.asarray(rating_values, dtype=np.float32)[known] / 5.0
+        user_emb = scorer.fold_in_user(rated_item_model_ids, targets,
+                                       steps=current_app.config.get('RECOMMENDER_FOLD_IN_STEPS', 10))
 
-    all_item_model_ids = list(item_map_model_to_ml.keys())
-    if not all_item_model_ids:
-         current_app.logger.warning("Item map (Model Index -> ML ID) is empty. Cannot generate recommendations.")
-         return []
+    rated_positions = selection['model_to_position'][rated_item_model_ids]
+    rated_positions = rated_positions[rated_positions >= 0]
+    ann_index = loaded_data.get('ann_index')
 
-    rated_item_model_ids = set()
-    for tmdb_id in rated_movie_tmdb_ids:
-         ml_id = tmdb_to_ml_map.get(tmdb_id)
-         if ml_id is not None:
-              model_id = item_map_ml_to_model.get(ml_id)
-              if model_id is not None:
-                   rated_item_model_ids.add(model_id)
+    if ann_index is None and loaded_data.get('batcher') is not None:
+        # Same as below, scored together with whichever requests arrive within the batch window
+        top_positions, top_scores = loaded_data['batcher'].top_k(user_emb, rated_positions, num_recommendations)
+    elif ann_index is None:
+        # Score every candidate (the item half of the first layer was precomputed at load time),
+        # mask out rated items and let torch.topk pick the winners; only the final k IDs and
+        # scores are converted back to Python objects
+        predictions = scorer.score_embeddings(user_emb.unsqueeze(0))[0]
+        top_positions, top_scores = select_top_k(predictions, selection['servable_mask'], rated_positions, num_recommendations)
+    else:
+        # Two-stage: pull a few hundred candidates from the ANN index, re-rank them exactly
+        min_candidates = current_app.config.get('RECOMMENDER_ANN_CANDIDATES', 300) + len(rated_positions)
+        positions = ann_index.candidates(scorer, user_emb, min_candidates)
+        predictions = scorer.score_embeddings(user_emb.unsqueeze(0), positions)[0]
+        excluded = np.flatnonzero(np.isin(positions.numpy(), rated_positions))
+        top_positions, top_scores = select_top_k(predictions, selection['servable_mask'][positions], excluded, num_recommendations)
+        top_positions = positions[top_positions]
 
-    # Create tensors for prediction
-    user_tensor = torch.tensor([user_model_id] * len(all_item_model_ids), dtype=torch.long)
-    item_tensor = torch.tensor(all_item_model_ids, dtype=torch.long)
+    top_tmdb_ids = selection['item_tmdb_ids'][top_positions]
 
-    # Optional: Move tensors/model to GPU if available
-    # device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    # user_tensor = user_tensor.to(device)
-    # item_tensor = item_tensor.to(device)
-    # model.to(device)
+    recommended_items_with_scores = [{'tmdb_id': tmdb_id, 'score': score}
+                                     for tmdb_id, score in zip(top_tmdb_ids.tolist(), top_scores.tolist())]
 
-    with torch.no_grad():
-        model.eval()
-        predictions = model(user_tensor, item_tensor)
+    if len(recommended_items_with_scores) < num_recommendations:
+         current_app.logger.warning(f"Only found {len(recommended_items_with_scores)} recommendations for user {user_db_id} after filtering rated and unmapped items.")
 
-    # Pair item model IDs with their scores
-    item_scores = list(zip(all_item_model_ids, predictions.tolist()))
+    return recommended_items_with_scores
 
-    # Sort by predicted score descending
-    sorted_item_scores = sorted(item_scores, key=lambda item: item[1], reverse=True)
 
-    recommended_items_with_scores = [] # List to hold {'tmdb_id': ..., 'score': ...} dictionaries
+# --- Per-user result cache ---
+def init_recommendation_cache(app):
+    """Creates the per-user recommendation cache configured by RECOMMENDATION_CACHE_* and stores it in app.config."""
+    app.config['recommendation_cache'] = make_cache(app.config.get('RECOMMENDATION_CACHE_BACKEND', 'memory'),
+                                                    path=app.config.get('RECOMMENDATION_CACHE_PATH'),
+                                                    max_entries=app.config.get('RECOMMENDATION_CACHE_MAX_ENTRIES', 1000))
 
-    for item_model_id, score in sorted_item_scores:
-        # Skip if the movie has already been rated by the user
-        if item_model_id not in rated_item_model_ids:
-            # Translate Model Index -> ML ID -> TMDB ID
-            ml_id = item_map_model_to_ml.get(item_model_id)
-            if ml_id is not None:
-                 tmdb_id = ml_to_tmdb_map.get(ml_id)
-                 if tmdb_id is not None:
-                     # Found a recommended TMDB ID, add it with its score
-                     recommended_items_with_scores.append({'tmdb_id': tmdb_id, 'score': score})
 
-                     # Stop when we have enough recommendations
-                     if len(recommended_items_with_scores) >= num_recommendations:
-                         break
+def ratings_version(ratings):
+    """
+    Version tag of a user's ratings (Rating rows): the count plus the latest timestamp,
+    so adding, updating (which re-stamps the rating) or deleting a rating changes it.
+    """
+    if not ratings:
+        return '0'
+    return f"{len(ratings)}:{max(rating.timestamp for rating in ratings).isoformat()}"
+
+
+def _recommendation_cache_key(user_db_id):
+    return f'recs:{user_db_id}'
+
+
+def get_cached_recommendations_for_user(user_db_id, ratings, num_recommendations=20):
+    """
+    get_recommendations_for_user behind the per-user result cache.
+
+    The ranked list is reused while the user's ratings version is unchanged (so another
+    worker's stale entry is never served) and it holds at least num_recommendations items.
+
+    Args:
+        user_db_id (int): The database ID of the user.
+        ratings (list): The user's Rating rows.
+        num_recommendations (int): The desired number of recommendations.
+
+    Returns:
+        list: Same as get_recommendations_for_user.
+    """
+    cache = current_app.config.get('recommendation_cache')
+    version = ratings_version(ratings)
+    key = _recommendation_cache_key(user_db_id)
+
+    if cache is not None:
+        entry = cache.get(key)
+        if entry is not None and entry['version'] == version and len(entry['items']) >= num_recommendations:
+            return entry['items'][:num_recommendations]
+
+    recommended_items_with_scores = None
+    if current_app.config.get('RECOMMENDER_USE_PRECOMPUTED', True):
+        recommended_items_with_scores = get_precomputed_recommendations(user_db_id, ratings, num_recommendations)
+    if recommended_items_with_scores is None:
+        recommended_items_with_scores = get_recommendations_for_user(
+            user_db_id, [rating.movie_id for rating in ratings], num_recommendations=num_recommendations,
+            rating_values=[rating.rating for rating in ratings])
+
+    # Empty results (e.g. model not loaded, user not in the map) are not cached
+    if cache is not None and recommended_items_with_scores:
+        cache.set(key, {'version': version, 'items': recommended_items_with_scores},
+                  current_app.config.get('RECOMMENDATION_CACHE_TTL', 24 * 60 * 60))
+    return recommended_items_with_scores
+
+
+def get_precomputed_recommendations(user_db_id, ratings, num_recommendations=20):
+    """
+    Serves a user's list from the user_recommendations table (see precompute.py).
+
+    Scores depend only on the user's model index, so the stored ranking stays exact; movies
+    rated since the job ran are filtered out here. Returns None (score live instead) when the
+    user has no stored list or too few items remain after filtering.
+    """
+    from .models import UserRecommendation # recommender is imported before db exists (see __init__.py)
+
+    rows = UserRecommendation.query.filter_by(user_id=user_db_id).order_by(UserRecommendation.rank).all()
+    rated_movie_ids = {rating.movie_id for rating in ratings}
+    items = [{'tmdb_id': row.movie_id, 'score': row.score} for row in rows if row.movie_id not in rated_movie_ids]
+    if len(items) < num_recommendations:
+        return None
+    return items[:num_recommendations]
 
-    if len(recommended_items_with_scores) < num_recommendations:
-         current_app.logger.warning(f"Only found {len(recommended_items_with_scores)} recommendations for user {user_db_id} after filtering rated and unmapped items.")
 
-    return recommended_items_with_scores
\ No newline at end of file
+def invalidate_recommendations(user_db_id):
+    """Drops a user's cached recommendations (call after their ratings change)."""
+    cache = current_app.config.get('recommendation_cache')
+    if cache is not None:
+        cache.delete(_recommendation_cache_key(user_db_id))
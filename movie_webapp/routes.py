@@ -1,5 +1,5 @@
 # movie_webapp/routes.py
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
 from . import db # Import db from the initialized instance in __init__.py
 # Import models, including Rating to get rated movies
@@ -7,41 +7,101 @@ from .models import User, Movie, Rating
 from .forms import SignupForm, LoginForm
 # Import API functions including the one for getting movie details and SEARCH
 # --- MODIFIED IMPORT (Added search_movies) ---
-from .api import get_top_rated_movies, get_movie_details, get_image_url, get_upcoming_movies, get_movie_credits, get_movie_videos, search_movies
+from .api import get_top_rated_movies, get_movie_details, get_image_url, get_upcoming_movies, get_movie_full_details, search_movies
 # --- END MODIFIED IMPORT ---
+from . import async_api
+from .catalog import get_cataloged_movies_metadata, get_movies_metadata_async, upsert_movies
+from .fragments import cached_fragment
+from .search_index import search_local
 # Import the recommendation function
-from .recommender import get_recommendations_for_user # Make sure this import is here
+from .recommender import get_cached_recommendations_for_user, invalidate_recommendations, get_similar_movies
 from datetime import datetime
 from sqlalchemy import desc
+from sqlalchemy.orm import joinedload
 
 # Create a Blueprint for routes
 routes = Blueprint('routes', __name__)
 
+def _format_movie_list(movies_data):
+    """Formats TMDB list results (id, title, poster) for the movie grid templates, skipping incomplete entries."""
+    return [{
+        'id': movie_data.get('id'),
+        'title': movie_data.get('title'),
+        'poster_url': get_image_url(movie_data.get('poster_path'))
+    } for movie_data in movies_data if movie_data.get('id') and movie_data.get('title')]
+
+def _render_movie_grid(movies_data):
+    """
+    Builds the fragment-cache entry for a top-rated / upcoming page: the rendered grid and
+    whether there is a next page. New movies are added to the local catalog on the way.
+    Returns None (nothing cached) when TMDB returned no results.
+    """
+    if not movies_data:
+        return None
+    # Add new movies to the local catalog and refresh known ones
+    upsert_movies(movies_data)
+    return {
+        'html': render_template('_movie_grid.html', movies=_format_movie_list(movies_data)),
+        'has_next': len(movies_data) == 20, # TMDB returns max 20 per page
+    }
+
+def _render_preview_row(movies_data):
+    """Builds the fragment-cache entry for a dashboard preview row (None when TMDB returned nothing)."""
+    if not movies_data:
+        return None
+    return {'html': render_template('_movie_preview_row.html', movies=_format_movie_list(movies_data))}
+
+# TMDB listing endpoint -> (fetch function, grid fragment prefix, dashboard row fragment key)
+LISTING_FRAGMENTS = {
+    'movie/top_rated': (get_top_rated_movies, 'movies', 'index:top_rated'),
+    'movie/upcoming': (get_upcoming_movies, 'upcoming_movies', 'index:upcoming'),
+}
+
+def grid_fragment(listing, page):
+    """(fragment key, build function) for one page of a listing grid; shared with the prefetcher."""
+    fetch, prefix, _ = LISTING_FRAGMENTS[listing]
+    return f'{prefix}:page={page}', lambda: _render_movie_grid(fetch(page=page))
+
+def preview_fragment(listing):
+    """(fragment key, build function) for a listing's dashboard preview row; shared with the prefetcher."""
+    fetch, _, key = LISTING_FRAGMENTS[listing]
+    return key, lambda: _render_preview_row(fetch(page=1)[:10])
+
+def _format_similar_movies(similar, details_by_id):
+    """Formats get_similar_movies items that have metadata (id, title, poster, similarity), most similar first."""
+    return [{
+        'id': item['tmdb_id'],
+        'title': details_by_id[item['tmdb_id']].get('title'),
+        'poster_url': get_image_url(details_by_id[item['tmdb_id']].get('poster_path')),
+        'similarity': item['score'],
+    } for item in similar if details_by_id.get(item['tmdb_id'])]
+
+async def _similar_movies(tmdb_id, k):
+    """Formatted "More like this" list for a movie; metadata missing from the catalog is fetched from TMDB."""
+    similar = get_similar_movies(tmdb_id, k)
+    return _format_similar_movies(similar, await get_movies_metadata_async([item['tmdb_id'] for item in similar]))
+
+def _cataloged_similar_movies(tmdb_id, k):
+    """
+    "More like this" for the detail page: only the similar movies with fresh catalog rows,
+    so the page never waits on TMDB for them (the JSON endpoint returns the full list).
+    """
+    similar = get_similar_movies(tmdb_id, k)
+    return _format_similar_movies(similar, get_cataloged_movies_metadata([item['tmdb_id'] for item in similar]))
+
 @routes.route('/')
 @routes.route('/index')
 def index():
     current_endpoint = request.endpoint
     if current_user.is_authenticated:
-        top_rated_preview_data = get_top_rated_movies(page=1)[:10]
-        upcoming_preview_data = get_upcoming_movies(page=1)[:10]
-
-        top_rated_preview = [{
-            'id': movie.get('id'),
-            'title': movie.get('title'),
-            'poster_url': get_image_url(movie.get('poster_path'))
-        } for movie in top_rated_preview_data]
-
-        upcoming_preview = [{
-            'id': movie.get('id'),
-            'title': movie.get('title'),
-            'poster_url': get_image_url(movie.get('poster_path'))
-        } for movie in upcoming_preview_data]
-
+        # The preview rows are the same for every user, so their HTML comes from the fragment cache
+        top_rated_preview = cached_fragment(*preview_fragment('movie/top_rated'))
+        upcoming_preview = cached_fragment(*preview_fragment('movie/upcoming'))
 
         return render_template('index.html',
                                title='Dashboard',
-                               top_rated_preview=top_rated_preview,
-                               upcoming_preview=upcoming_preview,
+                               top_rated_preview_html=top_rated_preview['html'] if top_rated_preview else '',
+                               upcoming_preview_html=upcoming_preview['html'] if upcoming_preview else '',
                                current_endpoint=current_endpoint)
     else:
         # Pass request.url to the login redirect so user can return after logging in
@@ -96,46 +156,20 @@ def logout():
 def movies():
     current_endpoint = request.endpoint
     page = request.args.get('page', 1, type=int)
-    top_movies_data = get_top_rated_movies(page=page)
+    # Rendered grid + has_next, shared by all users (fetched and rendered only on a cache miss)
+    fragment = cached_fragment(*grid_fragment('movie/top_rated', page))
 
-    if not top_movies_data:
+    if not fragment:
         flash("Could not fetch top rated movies from TMDB.", 'warning')
-        movies_list = []
-    else:
-        movies_list = []
-        movies_to_add = []
-        for movie_data in top_movies_data:
-            tmdb_id = movie_data.get('id')
-            title = movie_data.get('title')
-            poster_path = movie_data.get('poster_path')
-
-            if tmdb_id and title:
-                existing_movie = Movie.query.get(tmdb_id)
-                if not existing_movie:
-                    movies_to_add.append(Movie(id=tmdb_id, title=title))
-
-                movies_list.append({
-                    'id': tmdb_id,
-                    'title': title,
-                    'poster_url': get_image_url(movie_data.get('poster_path'))
-                })
+        fragment = {'html': '', 'has_next': False}
 
-        if movies_to_add:
-             db.session.add_all(movies_to_add)
-             try:
-                 db.session.commit()
-             except Exception as e:
-                 db.session.rollback()
-                 current_app.logger.error(f"Error adding new movies to DB: {e}")
-
-    has_next = len(top_movies_data) == 20 # TMDB returns max 20 per page
     has_prev = page > 1
 
     return render_template('movies.html',
                            title='Top Rated Movies',
-                           movies=movies_list,
+                           movie_grid_html=fragment['html'],
                            page=page,
-                           has_next=has_next,
+                           has_next=fragment['has_next'],
                            has_prev=has_prev,
                            current_endpoint=current_endpoint)
 
@@ -144,57 +178,33 @@ def movies():
 def upcoming_movies():
     current_endpoint = request.endpoint
     page = request.args.get('page', 1, type=int)
-    upcoming_movies_data = get_upcoming_movies(page=page)
+    # Rendered grid + has_next, shared by all users (fetched and rendered only on a cache miss)
+    fragment = cached_fragment(*grid_fragment('movie/upcoming', page))
 
-    if not upcoming_movies_data:
+    if not fragment:
         flash("Could not fetch upcoming movies from TMDB.", 'warning')
-        movies_list = []
-    else:
-        movies_list = []
-        movies_to_add = []
-        for movie_data in upcoming_movies_data:
-            tmdb_id = movie_data.get('id')
-            title = movie_data.get('title')
-            poster_path = movie_data.get('poster_path')
-
-            if tmdb_id and title:
-                 # Check if movie exists in our DB, add if not
-                existing_movie = Movie.query.get(tmdb_id)
-                if not existing_movie:
-                    movies_to_add.append(Movie(id=tmdb_id, title=title)) # Use TMDB ID as our primary key
-
-                movies_list.append({
-                    'id': tmdb_id,
-                    'title': title,
-                    'poster_url': get_image_url(movie_data.get('poster_path'))
-                })
+        fragment = {'html': '', 'has_next': False}
 
-        if movies_to_add:
-             db.session.add_all(movies_to_add)
-             try:
-                 db.session.commit() # Commit any new movies added
-             except Exception as e:
-                 db.session.rollback()
-                 current_app.logger.error(f"Error adding new upcoming movies to DB: {e}")
-
-
-    has_next = len(upcoming_movies_data) == 20 # Assuming max 20 per page
     has_prev = page > 1
 
     return render_template('upcoming_movies.html',
                            title='Upcoming Movies',
-                           movies=movies_list, # Pass the list of upcoming movies
+                           movie_grid_html=fragment['html'], # Rendered grid of upcoming movies
                            page=page,
-                           has_next=has_next,
+                           has_next=fragment['has_next'],
                            has_prev=has_prev,
                            current_endpoint=current_endpoint)
 
 
 @routes.route('/movie/<int:tmdb_id>') # Use TMDB ID as the route parameter
 @login_required
-def movie_detail(tmdb_id):
+async def movie_detail(tmdb_id):
     current_endpoint = request.endpoint
-    movie_data = get_movie_details(tmdb_id) # Fetch details from TMDB
+    # Fetch details, credits and videos from TMDB in one round trip (on the shared async client if enabled)
+    if current_app.config.get('TMDB_ASYNC_CLIENT', True):
+        movie_data, credits_data, videos_data = await async_api.call(async_api.get_movie_full_details, tmdb_id)
+    else:
+        movie_data, credits_data, videos_data = get_movie_full_details(tmdb_id)
 
     if not movie_data:
         flash(f"Could not fetch details for movie ID {tmdb_id}.", 'warning')
@@ -218,30 +228,16 @@ def movie_detail(tmdb_id):
         else:
              return redirect(url_for('routes.index'))
 
-    # Update or add the movie in our local database using TMDB ID
-    movie = Movie.query.get(tmdb_id)
-    if not movie:
-        # If it somehow wasn't added by the /movies route
-        movie = Movie(id=tmdb_id, title=movie_data.get('title', 'Unknown Title'))
-        db.session.add(movie)
-        # Commit the movie add if it happened here
-        # This check is simple; more complex logic might batch commits
-        if movie in db.session.new:
-            try:
-                 db.session.commit()
-            except Exception as e:
-                 db.session.rollback()
-                 current_app.logger.error(f"Error adding movie {tmdb_id} to DB in movie_detail: {e}")
+    # Update or add the movie in our local catalog (details also carry the genre names)
+    upsert_movies([movie_data])
 
 
-    credits_data = get_movie_credits(tmdb_id)
     cast_list = []
     if credits_data and 'cast' in credits_data:
         cast_list = credits_data['cast'][:15] # Get up to the first 15 cast members
 
 
-    # --- Fetch movie videos and find trailers ---
-    videos_data = get_movie_videos(tmdb_id)
+    # --- Find trailers in the fetched videos ---
     primary_trailer = None # Variable to hold the main trailer object for embedding
     other_trailers = []  # List to hold other video links
 
@@ -314,10 +310,14 @@ def movie_detail(tmdb_id):
         movie_id=tmdb_id
     ).first()
 
+    # --- More like this (nearest item embeddings; catalog rows only, never a TMDB call) ---
+    similar_movies = _cataloged_similar_movies(tmdb_id, current_app.config.get('RECOMMENDER_SIMILAR_K', 10))
+
     return render_template('movie_detail.html',
                            title=movie_details['title'],
                            movie=movie_details,
                            user_rating=user_rating,
+                           similar_movies=similar_movies,
                            cast_list=cast_list, # Pass the cast list
                            primary_trailer=primary_trailer, # <-- Pass the primary trailer object (contains key, name, etc.)
                            other_trailers=other_trailers, # <-- Pass the list of other formatted trailers (name, url)
@@ -325,6 +325,25 @@ def movie_detail(tmdb_id):
                            current_endpoint=current_endpoint) # Pass current endpoint
 
 
+@routes.route('/api/movie/<int:tmdb_id>/similar')
+@login_required
+async def similar_movies(tmdb_id):
+    """JSON list of the movies most similar to tmdb_id; ?k= sets the length (1-50)."""
+    k = min(max(request.args.get('k', current_app.config.get('RECOMMENDER_SIMILAR_K', 10), type=int), 1), 50)
+    return jsonify({'tmdb_id': tmdb_id, 'similar': await _similar_movies(tmdb_id, k)})
+
+
+@routes.route('/api/suggest')
+@login_required
+def suggest():
+    """Typeahead: titles starting with ?q= (at any word), most popular first. Never calls TMDB."""
+    index = current_app.config.get('suggest_index')
+    max_limit = current_app.config.get('SUGGEST_LIMIT', 10)
+    limit = min(max(request.args.get('limit', max_limit, type=int), 1), max_limit)
+    query = request.args.get('q', '')
+    return jsonify({'query': query, 'suggestions': index.suggest(query, limit) if index is not None else []})
+
+
 @routes.route('/rate_movie/<int:tmdb_id>', methods=['POST'])
 @login_required
 def rate_movie(tmdb_id):
@@ -356,7 +375,7 @@ def rate_movie(tmdb_id):
     if not movie:
         movie_data = get_movie_details(tmdb_id)
         if movie_data:
-             movie = Movie(id=tmdb_id, title=movie_data.get('title', 'Unknown Title'))
+             movie = Movie.from_tmdb(movie_data)
              db.session.add(movie)
              try:
                  db.session.commit()
@@ -403,6 +422,7 @@ def rate_movie(tmdb_id):
 
     try:
         db.session.commit()
+        invalidate_recommendations(current_user.id)
         flash(success_message, 'success')
     except Exception as e:
         db.session.rollback()
@@ -443,6 +463,7 @@ def delete_rating_from_detail(tmdb_id):
          try:
              db.session.delete(rating_to_delete)
              db.session.commit()
+             invalidate_recommendations(current_user.id)
              flash('Your rating has been deleted.', 'success')
          except Exception as e:
              db.session.rollback()
@@ -456,16 +477,20 @@ def delete_rating_from_detail(tmdb_id):
 
 @routes.route('/rated_movies')
 @login_required
-def rated_movies():
+async def rated_movies():
     current_endpoint = request.endpoint
-    user_ratings_db = Rating.query.filter_by(user_id=current_user.id).order_by(desc(Rating.timestamp)).all()
+    # Each rating's Movie row comes with it in the same query (no lazy load per rating)
+    user_ratings_db = (Rating.query.options(joinedload(Rating.movie))
+                       .filter_by(user_id=current_user.id).order_by(desc(Rating.timestamp)).all())
     rated_movies_list = []
 
+    # Current title and poster URL for all rated movies in one batch (local catalog first, then TMDB)
+    details_by_id = await get_movies_metadata_async([rating_obj.movie_id for rating_obj in user_ratings_db if rating_obj.movie])
+
     for rating_obj in user_ratings_db:
         local_movie = rating_obj.movie
         if local_movie:
-            # Fetch TMDB details to get current title and poster URL
-            movie_data = get_movie_details(local_movie.id)
+            movie_data = details_by_id.get(local_movie.id)
 
             if movie_data:
                 rated_movies_list.append({
@@ -482,7 +507,7 @@ def rated_movies():
                  rated_movies_list.append({
                      'rating_id': rating_obj.id,
                      'movie_id': local_movie.id,
-                     'title': local_movie.title + " (Details N/A)", # Indicate details couldn't be fetched
+                     'title': (local_movie.title or Movie.DISPLAY_PLACEHOLDER_TITLE) + " (Details N/A)", # Indicate details couldn't be fetched
                      'user_rating': rating_obj.rating,
                      'timestamp': rating_obj.timestamp,
                      'poster_url': None # No poster if details failed
@@ -527,6 +552,7 @@ def delete_rating_by_id(rating_id):
          try:
              db.session.delete(rating_to_delete)
              db.session.commit()
+             invalidate_recommendations(current_user.id)
              flash('Your rating has been deleted.', 'success')
          except Exception as e:
              db.session.rollback()
@@ -540,14 +566,13 @@ def delete_rating_by_id(rating_id):
 # --- Recommendations Route (Modified to split into Top 5 and Others based on has_ratings) ---
 @routes.route('/recommendations')
 @login_required
-def recommendations():
+async def recommendations():
     current_endpoint = request.endpoint
     user_db_id = current_user.id
 
     # Fetch rated movies from the database to determine if user has ratings
     # AND to pass rated movie IDs to the recommender if needed
     rated_movies_from_db = Rating.query.filter_by(user_id=user_db_id).all()
-    rated_movie_tmdb_ids = [rating.movie_id for rating in rated_movies_from_db]
 
     # Flag to indicate if the user has any ratings
     has_ratings = len(rated_movies_from_db) > 0
@@ -562,22 +587,25 @@ def recommendations():
     # --- Conditional logic based on whether the user has ratings ---
     if has_ratings:
         # User has ratings, attempt to get personalized recommendations
-        recommended_items_with_scores = get_recommendations_for_user(
+        # (reused from the per-user cache while the ratings are unchanged)
+        recommended_items_with_scores = get_cached_recommendations_for_user(
             user_db_id,
-            rated_movie_tmdb_ids,
+            rated_movies_from_db,
             num_recommendations=total_recommendations_requested
         )
 
         # Process personalized recommendations if any were returned by the recommender
         if recommended_items_with_scores:
             all_formatted_recommendations = []
+            # Display details for all recommendations in one batch (local catalog first, then TMDB)
+            details_by_id = await get_movies_metadata_async([item_data.get('tmdb_id') for item_data in recommended_items_with_scores
+                                                                    if item_data.get('tmdb_id')])
             for item_data in recommended_items_with_scores:
                 tmdb_id = item_data.get('tmdb_id')
                 score = item_data.get('score')
 
                 if tmdb_id:
-                     # Fetch full details from TMDB for display
-                     movie_data = get_movie_details(tmdb_id)
+                     movie_data = details_by_id.get(tmdb_id)
                      if movie_data:
                          # Append the formatted movie details including the predicted score
                          all_formatted_recommendations.append({
@@ -632,48 +660,28 @@ def search():
         # Using request.referrer might be complex, simpler to redirect to a known page.
         return redirect(url_for('routes.movies')) # Or routes.index
 
-    # Fetch search results from TMDB API
-    search_results_data = search_movies(query.strip(), page=page) # Use strip() to remove leading/trailing whitespace
+    # Answer from the local full-text index when the catalog has enough matches (decided on the
+    # total, so every page of a query comes from the same source); otherwise ask TMDB
+    local_results = search_local(query.strip(), page=page)
+    if local_results is not None and local_results[1] >= current_app.config.get('SEARCH_LOCAL_MIN_RESULTS', 5):
+        local_movies, local_total = local_results
+        search_results_data = {'results': local_movies, 'total_results': local_total,
+                               'total_pages': (local_total + 19) // 20, 'local': True}
+    else:
+        # Fetch search results from TMDB API
+        search_results_data = search_movies(query.strip(), page=page) # Use strip() to remove leading/trailing whitespace
 
     movies_list = []
     total_results = 0
     total_pages = 0
 
     if search_results_data and search_results_data.get('results') is not None: # Check for 'results' key existence
-        # Process the list of movie results
-        movies_list = []
-        movies_to_add = [] # Keep track of movies to add to local DB
-
-        for movie_data in search_results_data.get('results'):
-            tmdb_id = movie_data.get('id')
-            title = movie_data.get('title')
-
-            # Ensure we have essential data before processing
-            if tmdb_id and title:
-                # Check if movie exists in our DB, add if not
-                existing_movie = Movie.query.get(tmdb_id)
-                if not existing_movie:
-                    movies_to_add.append(Movie(id=tmdb_id, title=title)) # Use TMDB ID as our primary key
-
-                # Format movie data for the template
-                movies_list.append({
-                    'id': tmdb_id,
-                    'title': title,
-                    'poster_url': get_image_url(movie_data.get('poster_path')),
-                    # Add other potentially useful search result info if needed, e.g., release_date
-                    # 'release_date': movie_data.get('release_date'),
-                    # 'vote_average': movie_data.get('vote_average'),
-                })
-
-        # Add any new movies found in search results to the local DB
-        if movies_to_add:
-            db.session.add_all(movies_to_add)
-            try:
-                db.session.commit() # Commit any new movies added
-                current_app.logger.info(f"Added {len(movies_to_add)} new movies to DB from search results.")
-            except Exception as e:
-                db.session.rollback()
-                current_app.logger.error(f"Error adding new movies from search results to DB: {e}")
+        # Format the list of movie results for the template
+        movies_list = _format_movie_list(search_results_data.get('results'))
+        # Add any new movies found in search results to the local catalog (and refresh known ones);
+        # local results already come from it
+        if not search_results_data.get('local'):
+            upsert_movies(search_results_data.get('results'))
 
 
         # Get total results and pages for pagination
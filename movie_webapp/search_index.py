@@ -0,0 +1,117 @@
+# movie_webapp/search_index.py
+# Local full-text index over the movie catalog (SQLite FTS5), so /search can answer the
+# queries users keep repeating without spending TMDB quota.
+#
+# movies_fts holds (title, original_title, year) per titled catalog row, keyed by rowid = TMDB ID.
+# Triggers on `movies` keep it in sync with every write path (ORM, upserts, bulk inserts).
+# Rows still carrying Movie.PLACEHOLDER_TITLE are left out until TMDB fills in their title.
+import re
+from flask import current_app
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from . import db
+from .models import Movie
+
+# Values written into movies_fts for a `movies` row (new.* / old.* in the triggers)
+_FTS_VALUES = "{row}.id, {row}.title, {row}.original_title, substr({row}.release_date, 1, 4)"
+_CHANGED = ("old.title IS NOT new.title OR old.original_title IS NOT new.original_title "
+            "OR old.release_date IS NOT new.release_date")
+_TITLED = "{row}.title != '%s'" % Movie.PLACEHOLDER_TITLE.replace("'", "''")
+
+_SCHEMA = (
+    # Prefix indexes make "star wa"* style queries cheap while typing
+    "CREATE VIRTUAL TABLE IF NOT EXISTS movies_fts USING fts5("
+    "title, original_title, year, tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    # The sync triggers are recreated on every start, so databases indexed by an older
+    # version pick up changes to them
+    "DROP TRIGGER IF EXISTS movies_fts_insert",
+    f"CREATE TRIGGER movies_fts_insert AFTER INSERT ON movies WHEN {_TITLED.format(row='new')} BEGIN "
+    f"INSERT INTO movies_fts(rowid, title, original_title, year) VALUES ({_FTS_VALUES.format(row='new')}); END",
+    # Upserts rewrite every column; only touch the index when an indexed one changed
+    "DROP TRIGGER IF EXISTS movies_fts_update",
+    f"CREATE TRIGGER movies_fts_update AFTER UPDATE ON movies WHEN {_CHANGED} BEGIN "
+    "DELETE FROM movies_fts WHERE rowid = old.id; "
+    f"INSERT INTO movies_fts(rowid, title, original_title, year) SELECT {_FTS_VALUES.format(row='new')} "
+    f"WHERE {_TITLED.format(row='new')}; END",
+    "CREATE TRIGGER IF NOT EXISTS movies_fts_delete AFTER DELETE ON movies BEGIN "
+    "DELETE FROM movies_fts WHERE rowid = old.id; END",
+    # ORDER BY rank = BM25 with these column weights: title, original title, year
+    "INSERT INTO movies_fts(movies_fts, rank) VALUES ('rank', 'bm25(10.0, 5.0, 1.0)')",
+)
+
+# Matches counted per query at most (a two-letter prefix can match half the catalog)
+MAX_COUNTED_MATCHES = 1000
+
+_TOKEN = re.compile(r'\w+')
+
+
+def init_search_index(app):
+    """
+    Creates the FTS5 table and its triggers if missing (filling the table from the catalog
+    the first time) and records in app.config['search_index'] whether the index is usable.
+    Needs an app context and the `movies` table. Only SQLite builds with FTS5 are supported;
+    elsewhere /search keeps going straight to TMDB.
+    """
+    available = False
+    if app.config.get('SEARCH_LOCAL_INDEX', True) and db.engine.dialect.name == 'sqlite':
+        try:
+            with db.engine.begin() as conn:
+                exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'movies_fts'")).first()
+                for statement in _SCHEMA:
+                    conn.execute(text(statement))
+            if not exists:
+                count = rebuild_search_index()
+                app.logger.info(f"Built the local search index over {count} catalog rows.")
+            available = True
+        except OperationalError as e:
+            app.logger.warning(f"Local search index unavailable (SQLite without FTS5?), searching TMDB only: {e}")
+    app.config['search_index'] = available
+    return available
+
+
+def rebuild_search_index():
+    """Refills movies_fts from the titled catalog rows in one transaction. Returns the number of rows indexed."""
+    with db.engine.begin() as conn:
+        conn.execute(text("DELETE FROM movies_fts"))
+        conn.execute(text("INSERT INTO movies_fts(rowid, title, original_title, year) "
+                          f"SELECT {_FTS_VALUES.format(row='movies')} FROM movies WHERE {_TITLED.format(row='movies')}"))
+        return conn.execute(text("SELECT count(*) FROM movies_fts")).scalar()
+
+
+def match_expression(query):
+    """
+    FTS5 MATCH expression for free-text user input: every word must match the start of a
+    word in some column ("godf 1972" finds The Godfather). Returns None if there are no words.
+    Tokens are \\w+ runs only, so user input cannot inject FTS5 syntax.
+    """
+    tokens = _TOKEN.findall(query.lower())
+    return ' '.join(f'"{token}"*' for token in tokens) or None
+
+
+def search_local(query, page=1, per_page=20):
+    """
+    Searches the local catalog, best BM25 match first.
+
+    Returns:
+        tuple: (list of TMDB-shaped movie dicts for the page, number of matches capped at
+               MAX_COUNTED_MATCHES), or None if the index is unavailable.
+    """
+    if not current_app.config.get('search_index'):
+        return None
+    expression = match_expression(query)
+    if expression is None:
+        return [], 0
+
+    params = {'expression': expression, 'limit': per_page, 'offset': (page - 1) * per_page,
+              'max_counted': MAX_COUNTED_MATCHES}
+    total = db.session.execute(text("SELECT count(*) FROM (SELECT 1 FROM movies_fts WHERE movies_fts MATCH :expression "
+                                    "LIMIT :max_counted)"), params).scalar()
+    if not total:
+        return [], 0
+    # Rank and page inside FTS5 first, then join only the page's rows (joining first makes
+    # SQLite visit every match in the movies table)
+    statement = text("SELECT movies.* FROM (SELECT rowid, rank FROM movies_fts WHERE movies_fts MATCH :expression "
+                     "ORDER BY rank LIMIT :limit OFFSET :offset) AS hits "
+                     "JOIN movies ON movies.id = hits.rowid ORDER BY hits.rank")
+    movies = db.session.scalars(db.select(Movie).from_statement(statement), params).all()
+    return [movie.to_tmdb_dict() for movie in movies], total
@@ -0,0 +1,214 @@
+# movie_webapp/suggest.py
+# In-memory title prefix index behind /api/suggest (search-box typeahead). Built from the
+# movies catalog at startup and kept current by the catalog upsert paths; lookups never
+# touch the database or TMDB.
+import bisect
+import re
+import threading
+import unicodedata
+import numpy as np
+from flask import current_app
+from sqlalchemy import text
+from . import db
+from .models import Movie
+
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+
+
+def normalize_title(title):
+    """Lowercase ASCII words separated by single spaces ("Amélie (2001)" -> "amelie 2001")."""
+    folded = unicodedata.normalize('NFKD', title or '').encode('ascii', 'ignore').decode('ascii')
+    return _NON_ALNUM.sub(' ', folded.lower()).strip()
+
+
+def _title_keys(normalized):
+    """Index keys for a normalised title: the title from each word on, so any word start matches."""
+    words = normalized.split(' ')
+    return [' '.join(words[start:]) for start in range(len(words))] if normalized else []
+
+
+class SuggestIndex:
+    """
+    Sorted-array prefix index over movie titles, ranked by popularity.
+
+    Every word start of every title is a key ("the godfather" is found by "the g" and by
+    "godf"). Keys live in a sorted list searched with bisect, with the movie slot of each
+    key in a parallel numpy array; a prefix is one contiguous key range, and the most
+    popular movies in it are picked with argpartition over the slots' popularity.
+
+    Movies added or renamed after the build go to a small sorted delta list, merged into
+    the main arrays once it reaches merge_threshold keys. Keys of renamed movies are
+    filtered out at lookup time and dropped at the next merge. Writers hold a lock and
+    swap in new lists, so lookups never lock and never see a half-updated list.
+    """
+
+    def __init__(self, merge_threshold=2000):
+        self.merge_threshold = merge_threshold
+        self._lock = threading.Lock()
+        self._slot_of = {} # TMDB ID -> slot
+        self._movie_ids = [] # slot -> TMDB ID
+        self._titles = [] # slot -> display title
+        self._normalized = [] # slot -> normalize_title(title)
+        self._years = [] # slot -> release year string or None
+        self._popularity = np.zeros(0) # slot -> popularity (unknown = 0)
+        self._keys = [] # Sorted main keys
+        self._key_slots = np.zeros(0, dtype=np.int64)
+        self._pending = [] # Sorted (key, slot) delta
+        self._renamed = set() # Slots whose old keys may still be in the main arrays
+
+    def __len__(self):
+        return len(self._movie_ids)
+
+    # --- Updates ---
+    def add_movies(self, movies, merge=True):
+        """
+        Adds or updates movies from dicts with 'id' and optionally 'title', 'popularity' and
+        'release_date'. Missing or None fields keep their current value; movies without any
+        title are skipped.
+        """
+        with self._lock:
+            added = []
+            popularity = self._popularity
+            for movie in movies:
+                movie_id = movie.get('id')
+                slot = self._slot_of.get(movie_id)
+                title = movie.get('title')
+                if slot is None:
+                    if not title or movie_id is None:
+                        continue
+                    slot = len(self._movie_ids)
+                    self._slot_of[movie_id] = slot
+                    self._movie_ids.append(movie_id)
+                    self._titles.append(None)
+                    self._normalized.append('')
+                    self._years.append(None)
+                    if slot >= len(popularity):
+                        popularity = np.concatenate([popularity, np.zeros(max(len(popularity), 1024))])
+
+                if title and title != self._titles[slot]:
+                    normalized = normalize_title(title)
+                    self._titles[slot] = title
+                    if normalized != self._normalized[slot]:
+                        if self._normalized[slot]:
+                            self._renamed.add(slot)
+                        self._normalized[slot] = normalized
+                        added.extend((key, slot) for key in _title_keys(normalized))
+                if movie.get('popularity') is not None:
+                    popularity[slot] = movie['popularity']
+                if movie.get('release_date'):
+                    self._years[slot] = movie['release_date'][:4]
+
+            self._popularity = popularity
+            pending = sorted(self._pending + added) if added else self._pending
+            if merge and len(pending) >= self.merge_threshold:
+                self._merge(pending)
+            else:
+                self._pending = pending
+
+    def merge(self):
+        """Folds the delta into the main arrays now."""
+        with self._lock:
+            self._merge(self._pending)
+
+    def _merge(self, pending):
+        """
+        Folds the delta into the main arrays, dropping keys of renamed titles. Called with the
+        lock held. The delta is small, so it is spliced in at bisect positions rather than
+        re-sorting everything: list slices and np.insert keep this a few milliseconds.
+        """
+        keys, key_slots = self._keys, self._key_slots
+        if self._renamed:
+            stale = np.flatnonzero(np.isin(key_slots, np.fromiter(self._renamed, dtype=np.int64)))
+            drop = {position for position in stale.tolist()
+                    if not self._is_current(keys[position], int(key_slots[position]))}
+            if drop:
+                keys = [key for position, key in enumerate(keys) if position not in drop]
+                key_slots = np.delete(key_slots, sorted(drop))
+            pending = [(key, slot) for key, slot in pending if self._is_current(key, slot)]
+            self._renamed = set()
+
+        positions = [bisect.bisect_left(keys, key) for key, _ in pending]
+        merged, previous = [], 0
+        for position, (key, _) in zip(positions, pending):
+            merged.extend(keys[previous:position])
+            merged.append(key)
+            previous = position
+        merged.extend(keys[previous:])
+
+        self._key_slots = np.insert(key_slots, positions, [slot for _, slot in pending]).astype(np.int64)
+        self._keys = merged
+        self._pending = []
+
+    def _is_current(self, key, slot):
+        """True if key is still a word-start suffix of the slot's current title."""
+        normalized = self._normalized[slot]
+        return normalized.endswith(key) and (len(key) == len(normalized) or normalized[-len(key) - 1] == ' ')
+
+    # --- Lookups ---
+    def suggest(self, query, limit=10):
+        """
+        Up to limit movies whose title, from some word on, starts with the query
+        ("godf" and "the godf" both find The Godfather), most popular first.
+
+        Returns:
+            list: dicts with 'id', 'title' and 'year'.
+        """
+        prefix = normalize_title(query)
+        if not prefix or limit <= 0:
+            return []
+        keys, key_slots, pending, popularity = self._keys, self._key_slots, self._pending, self._popularity
+
+        # Main range: [lo, hi) of keys starting with prefix
+        lo = bisect.bisect_left(keys, prefix)
+        hi = bisect.bisect_left(keys, prefix + '\x7f', lo)
+        slots = key_slots[lo:hi]
+        # A movie can own several keys in the range, and renamed titles leave stale keys,
+        # so over-fetch before deduplicating
+        fetch = min(len(slots), limit * 4)
+        if len(slots) > fetch:
+            slots = slots[np.argpartition(-popularity[slots], fetch - 1)[:fetch]]
+        candidates = set(slots.tolist())
+
+        start = bisect.bisect_left(pending, (prefix,))
+        for key, slot in pending[start:]:
+            if not key.startswith(prefix):
+                break
+            candidates.add(slot)
+
+        ranked = sorted((slot for slot in candidates if self._matches(slot, prefix)),
+                        key=lambda slot: (-popularity[slot], self._movie_ids[slot]))
+        return [{'id': self._movie_ids[slot], 'title': self._titles[slot], 'year': self._years[slot]}
+                for slot in ranked[:limit]]
+
+    def _matches(self, slot, prefix):
+        """True if the slot's current title has prefix at a word start (filters keys of renamed titles)."""
+        return (' ' + prefix) in (' ' + self._normalized[slot])
+
+
+def build_suggest_index(merge_threshold=2000, chunk_size=10000):
+    """Builds a SuggestIndex from every titled row of the movies catalog. Needs an app context."""
+    index = SuggestIndex(merge_threshold=merge_threshold)
+    result = db.session.execute(text("SELECT id, title, popularity, release_date FROM movies WHERE title != :placeholder"),
+                                {'placeholder': Movie.PLACEHOLDER_TITLE})
+    # One add_movies call (one sort of all keys) and one merge into the empty main arrays
+    index.add_movies(({'id': row.id, 'title': row.title, 'popularity': row.popularity,
+                       'release_date': row.release_date} for row in result.yield_per(chunk_size)), merge=False)
+    index.merge()
+    return index
+
+
+def init_suggest_index(app):
+    """Builds the typeahead index if SUGGEST_ENABLED and stores it in app.config['suggest_index']. Needs an app context."""
+    index = None
+    if app.config.get('SUGGEST_ENABLED', True):
+        index = build_suggest_index(merge_threshold=app.config.get('SUGGEST_MERGE_THRESHOLD', 2000))
+        app.logger.info(f"Built the typeahead index over {len(index)} titles.")
+    app.config['suggest_index'] = index
+    return index
+
+
+def note_catalog_rows(rows):
+    """Feeds catalog rows just written (dicts with id / title / popularity / release_date) to the typeahead index."""
+    index = current_app.config.get('suggest_index')
+    if index is not None:
+        index.add_movies(rows)